@@ -0,0 +1,82 @@
+import copy
+
+# Sharded v2/findings/query execution. A query is split by cloud account into shards that
+# each carry a cloudAccountIds filter, the shards run in parallel and their responses are
+# merged back into the response of the single query: totalCount and bucket counts are
+# summed, nested subAggregations are merged recursively and the termsCount cut is applied
+# again to the merged buckets, ordered like the API by count then key.
+#
+# Shards never share an account, so the merge is exact for aggregations whose buckets
+# belong to one account (CloudAccountId, ObjectXid) and for aggregations without a
+# termsCount. A top N of another field (ex: the top 10 rules) is not: a term just below
+# the cut of every shard can be in the overall top N, so shardable() refuses those queries
+# and they are sent unsharded.
+
+# Fields whose terms belong to a single cloud account
+ACCOUNT_FIELDS = ["CloudAccountId", "ObjectXid"]
+
+
+## True when the merge of the shards of payload is exactly the response of payload
+def shardable(payload):
+    return exact_terms(payload.get("aggregations") or {})
+
+def exact_terms(aggregations):
+    for spec in aggregations.values():
+        if("termsCount" in spec and spec.get("fieldName") not in ACCOUNT_FIELDS):
+            return False
+        if not exact_terms(spec.get("subAggregations") or {}):
+            return False
+    return True
+
+"""Splits {account id: findings} into shard_count lists of account ids with about the same number of findings"""
+def balance_shards(account_counts, shard_count):
+    shards = [[] for _ in range(min(shard_count, len(account_counts)))]
+    sizes = [0] * len(shards)
+    for account, count in sorted(account_counts.items(), key=lambda item: (-item[1], item[0])):
+        lightest = sizes.index(min(sizes))
+        shards[lightest].append(account)
+        sizes[lightest] += count
+    return [sorted(shard) for shard in shards]
+
+## Returns the payload of one shard, restricted to accounts
+def shard_payload(payload, accounts):
+    shard = copy.deepcopy(payload)
+    shard.setdefault("filters", {})["cloudAccountIds"] = list(accounts)
+    return shard
+
+def merge_buckets(aggregations, spec):
+    counts = {}
+    children = {}
+    for aggregation in aggregations:
+        for key, bucket in (aggregation.get("buckets") or {}).items():
+            counts[key] = counts.get(key, 0) + bucket.get("count", 0)
+            if "subAggregations" in bucket:
+                children.setdefault(key, []).append(bucket["subAggregations"])
+
+    ordered = sorted(counts, key=lambda key: (-counts[key], key))
+    if "termsCount" in spec:
+        ordered = ordered[:int(spec["termsCount"])]
+
+    buckets = {}
+    for key in ordered:
+        bucket = {"count": counts[key]}
+        if key in children:
+            bucket["subAggregations"] = merge_aggregations(children[key], spec.get("subAggregations") or {})
+        buckets[key] = bucket
+    return {"buckets": buckets}
+
+"""Merges several {aggregation name: {"buckets": ...}} of the same aggregation specs"""
+def merge_aggregations(aggregation_sets, specs):
+    names = []
+    for aggregations in aggregation_sets:
+        names += [name for name in aggregations if name not in names]
+    return {name: merge_buckets([aggregations[name] for aggregations in aggregation_sets if name in aggregations], specs.get(name) or {})
+            for name in names}
+
+"""Merges the responses of the shards of payload into the response of the unsharded query"""
+def merge_responses(responses, payload):
+    merged = dict(responses[0]) if responses else {}
+    merged["totalCount"] = sum(response.get("totalCount", 0) for response in responses)
+    merged["aggregations"] = merge_aggregations([response.get("aggregations") or {} for response in responses],
+                                                payload.get("aggregations") or {})
+    return merged
@@ -0,0 +1,48 @@
+import contextlib
+import os
+import threading
+
+# Files written under a temporary name next to their path and renamed over it once they are
+# complete, so a reader sees the previous file or the new one and never a partial one. Every
+# module that persists a file (report model, rule catalog, token cache, response cache, trend
+# history, metrics, exports) writes it through here.
+#
+# The temporary name carries the process and thread id, so concurrent writers of the same path
+# never share a temporary file. When writing or renaming fails, the temporary file is removed and
+# the error is raised again. The parent directory of path is created when it does not exist.
+#
+#   atomic_file.write(path, json.dumps(data))
+#   with atomic_file.open_atomic(path, "wb") as output_file:
+#       output_file.write(data)
+
+
+def temp_name(path):
+    return path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+
+"""Yields the temporary path to write instead of path, for writers that open the file themselves. It is renamed over path when the block succeeds and removed when it fails"""
+@contextlib.contextmanager
+def replacing(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = temp_name(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+## File object of the temporary file of path, created with permissions (less the umask)
+@contextlib.contextmanager
+def open_atomic(path, mode="w", permissions=0o666, buffering=-1):
+    with replacing(path) as temp_path:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, permissions)
+        with os.fdopen(fd, mode, buffering) as output_file:
+            yield output_file
+
+## Writes data (str, or bytes when mode is "wb") to path
+def write(path, data, mode="w", permissions=0o666):
+    with open_atomic(path, mode, permissions) as output_file:
+        output_file.write(data)
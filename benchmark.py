@@ -0,0 +1,249 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_api
+import vss_client
+import token_cache
+import gather_info
+import report_config
+import report_data
+import report_model
+import rule_catalog
+
+# End-to-end benchmark against the local mock API. For every tenant size it times
+# gather_data() in each gather mode, every get_* reader on a cold data cache, the report
+# model computation, the startup of a "generate.py fetch" run and a full "generate.py build"
+# run in subprocesses. Results are written as JSON so runs can be compared to spot regressions:
+#
+#   python benchmark.py --sizes small medium --output benchmark.json
+
+SIZES = {
+    "small": {"findings": 2000, "accounts": 20, "rules": 200},
+    "medium": {"findings": 50000, "accounts": 500, "rules": 1500},
+    "large": {"findings": 250000, "accounts": 5000, "rules": 3000}
+}
+
+BENCHMARK_CONFIG = {
+    "org_name": "Benchmark Tenant",
+    "config": {
+        "providers": ["AWS", "Azure", "GCP"],
+        "severity": ["High", "Medium", "Low"],
+        "cloudTags": {},
+        "cloudAccountIds": ["All"]
+    }
+}
+
+IMAGES = ["vmware_logo.jpg", "vss.jpeg", "aws-logo.jpg", "azure-logo.jpg"]
+
+# (name, reader, takes the report config)
+READERS = [
+    ("get_account_info", gather_info.get_account_info, False),
+    ("get_open_resolved_findings", gather_info.get_open_resolved_findings, False),
+    ("get_findings_by_provider", gather_info.get_findings_by_provider, True),
+    ("get_top_10_accounts_by_findings", gather_info.get_top_10_accounts_by_findings, True),
+    ("get_high_med_low_top_10_violations", gather_info.get_high_med_low_top_10_violations, True),
+    ("get_all_violations_by_severity", gather_info.get_all_violations_by_severity, True),
+    ("get_top_10_rules", gather_info.get_top_10_rules, False),
+    ("get_top_10_objects_by_risk", gather_info.get_top_10_objects_by_risk, False),
+    ("get_open_findings_trends", gather_info.get_open_findings_trends, False),
+    ("get_new_resolved_trends", gather_info.get_new_resolved_trends, False)
+]
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules a fetch run does not need, they are reported when a change starts loading them again
+FETCH_UNUSED_MODULES = ["numpy", "pyarrow", "reportlab"]
+
+
+## The report expects its images under images/ of the working directory
+def prepare_images(work_dir):
+    target = os.path.join(work_dir, "images")
+    source = os.path.join(REPO_DIR, "images")
+    if os.path.isdir(source):
+        shutil.copytree(source, target)
+        return
+    from PIL import Image
+    os.makedirs(target)
+    for name in IMAGES:
+        Image.new("RGB", (64, 16), "white").save(os.path.join(target, name))
+
+def clear_caches():
+    report_data.invalidate()
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        clear_caches()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def time_gather(config, mode, workers, repeat):
+    def gather():
+        # Forces the rule catalog to be downloaded like on a first run
+        if os.path.exists(rule_catalog.CATALOG_FILE):
+            os.remove(rule_catalog.CATALOG_FILE)
+        gather_info.gather_data(config, mode, workers)
+    return best_time(gather, repeat)
+
+def generate_env(work_dir, url):
+    env = dict(os.environ)
+    env.update({
+        "VSS_API_URL": url,
+        "CSP_URL": url,
+        "REFRESH_TOKEN": "benchmark",
+        "VSS_TOKEN_CACHE_DIR": os.path.join(work_dir, "build-tokens")
+    })
+    return env
+
+## Seconds spent importing modules and the modules imported, from the -X importtime lines of a process
+def parse_import_time(stderr):
+    total = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        modules.add(name.strip())
+        # Top level imports are not indented, their cumulative time includes the nested ones
+        if not name.startswith(" "):
+            total += int(fields[1])
+    return total / 1000000.0, modules
+
+"""Times the startup of a "generate.py fetch" run: its wall time and the time it spends importing modules, the fastest of repeat runs"""
+def time_fetch_startup(work_dir, url, repeat):
+    command = [sys.executable, "-X", "importtime", os.path.join(REPO_DIR, "generate.py"), "fetch", "--config", "config.json"]
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(command, cwd=work_dir, env=generate_env(work_dir, url), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - started
+        stderr = completed.stderr.decode("utf-8", "replace")
+        if(completed.returncode != 0):
+            raise RuntimeError("generate.py fetch failed: " + stderr[-2000:])
+        imports, modules = parse_import_time(stderr)
+        if result is None or elapsed < result["wall"]:
+            result = {"wall": elapsed, "imports": imports,
+                      "unused_modules": [module for module in FETCH_UNUSED_MODULES if module in modules]}
+    return result
+
+def time_build(work_dir, url, mode, workers):
+    command = [sys.executable, os.path.join(REPO_DIR, "generate.py"), "build", "--config", "config.json",
+               "--output-file", "report.pdf", "--gather-mode", mode, "--workers", str(workers)]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=work_dir, env=generate_env(work_dir, url), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - started
+    if(completed.returncode != 0 or not os.path.exists(os.path.join(work_dir, "report.pdf"))):
+        raise RuntimeError("generate.py build failed: " + completed.stderr.decode("utf-8", "replace")[-2000:])
+    return elapsed
+
+"""Runs every benchmark for one tenant size and returns the timings in seconds"""
+def run_size(name, spec, args):
+    result = {"tenant": dict(spec)}
+
+    started = time.perf_counter()
+    tenant = mock_api.Tenant(spec["findings"], spec["accounts"], spec["rules"], seed=args.seed, padding=args.padding)
+    result["tenant_setup"] = time.perf_counter() - started
+
+    server = mock_api.serve(tenant, latency=args.latency)
+    url = mock_api.base_url(server)
+    work_dir = tempfile.mkdtemp(prefix="vss-benchmark-" + name + "-")
+    current_dir = os.getcwd()
+    try:
+        os.chdir(work_dir)
+        with open("config.json", "w") as config_file:
+            json.dump(BENCHMARK_CONFIG, config_file)
+        prepare_images(work_dir)
+
+        vss_client.VSS_API_URL = url
+        vss_client.CSP_AUTHORIZE_URL = url + "/csp/gateway/am/api/auth/api-tokens/authorize"
+        token_cache.TOKEN_CACHE_DIR = os.path.join(work_dir, "tokens")
+        os.environ["REFRESH_TOKEN"] = "benchmark"
+        gather_info.auth()
+
+        config = report_config.load("config.json")
+
+        result["gather_data"] = {}
+        for mode in args.modes:
+            result["gather_data"][mode] = time_gather(config, mode, args.workers, args.repeat)
+            logging.info(name + " gather_data " + mode + ": " + str(round(result["gather_data"][mode], 3)) + "s\n")
+
+        result["readers"] = {}
+        for reader_name, reader, takes_config in READERS:
+            func = (lambda reader=reader: reader(config)) if takes_config else reader
+            result["readers"][reader_name] = best_time(func, args.repeat)
+
+        result["compute_model"] = best_time(lambda: report_model.build_model(config), args.repeat)
+
+        if not args.no_fetch_startup:
+            result["fetch_startup"] = time_fetch_startup(work_dir, url, args.repeat)
+            logging.info(name + " fetch startup: " + str(round(result["fetch_startup"]["imports"], 3)) + "s of imports in "
+                         + str(round(result["fetch_startup"]["wall"], 3)) + "s\n")
+            if result["fetch_startup"]["unused_modules"]:
+                logging.warning(name + " fetch imported " + ", ".join(result["fetch_startup"]["unused_modules"]) + "\n")
+
+        if not args.no_build:
+            result["build"] = time_build(work_dir, url, args.modes[-1], args.workers)
+            logging.info(name + " build: " + str(round(result["build"], 3)) + "s\n")
+
+        result["requests"] = server.RequestHandlerClass.requests
+    finally:
+        os.chdir(current_dir)
+        server.shutdown()
+        server.server_close()
+        if args.keep:
+            logging.info("Kept " + work_dir + "\n")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark report generation against the local mock API")
+    parser.add_argument('--sizes', nargs="+", choices=list(SIZES), default=["small", "medium"], help="tenant sizes to run")
+    parser.add_argument('--modes', nargs="+", choices=gather_info.GATHER_MODES, default=["sequential", "thread"], help="gather modes to time")
+    parser.add_argument('--workers', type=int, default=gather_info.DEFAULT_GATHER_WORKERS)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement, the fastest one is reported")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the mock API adds to every response")
+    parser.add_argument('--padding', type=int, default=0, help="extra bytes per finding in findings pages")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-fetch-startup', action="store_true", help="skip the generate.py fetch startup runs")
+    parser.add_argument('--no-build', action="store_true", help="skip the generate.py build run")
+    parser.add_argument('--keep', action="store_true", help="keep the working directories")
+    parser.add_argument('--output', default="benchmark.json", help="JSON file the results are written to")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    args = parse_arguments()
+    args.output = os.path.abspath(args.output)
+
+    results = {
+        "created_at": datetime.datetime.utcnow().replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "workers": args.workers,
+        "repeat": args.repeat,
+        "sizes": {}
+    }
+    for size in args.sizes:
+        logging.info("Running " + size + " benchmark\n")
+        results["sizes"][size] = run_size(size, SIZES[size], args)
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=4)
+    logging.info("Wrote " + args.output + "\n")
@@ -0,0 +1,43 @@
+import findings_stream
+import vss_client
+
+# Collection status of the cloud accounts, from v1/cloud-accounts/collection-status/query.
+# Used by getaccoutn.py for exports and by the incremental sync of the findings store,
+# which re-downloads the findings of an account only when it was collected again.
+
+# Fields that identify the cloud account of a collection status record
+ACCOUNT_ID_FIELDS = ["cloudAccountId", "accountId", "id"]
+
+# Fields holding the time the account was last collected, tried in order
+COLLECTED_AT_FIELDS = ["lastCollectedAt", "lastCollectionTime", "lastSuccessfulCollectionTime", "collectedAt", "lastUpdated"]
+
+STATUS_PAGE_SIZE = 1000
+
+
+def account_id(record):
+    for field in ACCOUNT_ID_FIELDS:
+        if record.get(field):
+            return str(record[field])
+    return None
+
+def collected_at(record):
+    for field in COLLECTED_AT_FIELDS:
+        if record.get(field):
+            return str(record[field])
+    return None
+
+## Yields the collection status record of every cloud account, page by page
+def iter_accnt_status():
+    url = vss_client.api_url("v1/cloud-accounts/collection-status/query")
+    for page in findings_stream.iter_pages(url, page_size=STATUS_PAGE_SIZE):
+        for record in page.get("results") or []:
+            yield record
+
+"""Returns {account id: last collected time} of every cloud account, the time is None when the API does not report it"""
+def collection_times():
+    times = {}
+    for record in iter_accnt_status():
+        key = account_id(record)
+        if key is not None:
+            times[key] = collected_at(record)
+    return times
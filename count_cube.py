@@ -0,0 +1,172 @@
+# Finding counts of a report as a NumPy cube indexed by provider, cloud account, severity
+# and status. The per-account tables and per-provider charts of the report are slices and
+# sums of the cube, for any number of providers.
+#
+# A cube is built in one pass from (provider, account, severity, status, count) cells,
+# taken from the aggregation responses in data/ or from raw findings, and accumulated with
+# one bincount. Counts the source does not break down further are kept under OTHER: the
+# aggregation responses only split the top 10 accounts by severity, so the rest of a
+# provider's findings of a severity is in its OTHER account, and counts without a known
+# severity (suppressed and resolved findings per account) are under ANY_SEVERITY. Sums over
+# accounts and severities are therefore the totals of the source.
+#
+# The suppressed status counts suppressed findings whatever their status, like the
+# isSuppressed queries, so it overlaps the open and resolved counts.
+#
+# NumPy is imported by the functions that build, load and save a cube, not by this module,
+# so a fetch run that imports gather_info does not pay for loading it.
+
+SEVERITIES = ["high", "medium", "low"]
+ANY_SEVERITY = "*"
+STATUSES = ["open", "resolved", "suppressed"]
+OTHER = ""
+
+# Providers of the report come in this order, others after them by name
+PROVIDER_ORDER = ["aws", "azure", "gcp"]
+
+
+def provider_sort_key(provider):
+    if provider in PROVIDER_ORDER:
+        return (0, PROVIDER_ORDER.index(provider), provider)
+    return (1 if provider != OTHER else 2, 0, provider)
+
+
+class CountCube(object):
+    """counts[provider, account, severity, status], severities are SEVERITIES + [ANY_SEVERITY]"""
+
+    def __init__(self, providers, accounts, counts):
+        self.providers = list(providers)
+        self.accounts = list(accounts)
+        self.severities = SEVERITIES + [ANY_SEVERITY]
+        self.counts = counts
+        self.provider_index = {provider: index for index, provider in enumerate(self.providers)}
+        self.account_index = {account: index for index, account in enumerate(self.accounts)}
+
+    def status(self, status):
+        return STATUSES.index(status)
+
+    def severity_indexes(self, levels):
+        return [SEVERITIES.index(level.lower()) for level in levels if level.lower() in SEVERITIES]
+
+    ## Providers that have findings, without OTHER
+    def report_providers(self):
+        totals = self.counts.sum(axis=(1, 2, 3))
+        return [provider for index, provider in enumerate(self.providers) if provider != OTHER and totals[index] > 0]
+
+    """Returns {provider: [high, medium, low]} of open findings"""
+    def open_by_severity(self):
+        open_counts = self.counts[:, :, :len(SEVERITIES), self.status("open")].sum(axis=1)
+        return {provider: [int(count) for count in open_counts[index]] for index, provider in enumerate(self.providers) if provider != OTHER}
+
+    ## Open findings of levels per provider, in the order of providers
+    def open_by_provider(self, providers, levels):
+        severity = self.severity_indexes(levels)
+        totals = self.counts[:, :, severity, self.status("open")].sum(axis=(1, 2))
+        return [int(totals[self.provider_index[provider]]) if provider in self.provider_index else 0 for provider in providers]
+
+    ## Findings of every account for a status summed over providers and severities, as an array in the order of self.accounts
+    def account_totals(self, status, levels=None):
+        if levels is None:
+            return self.counts[:, :, :, self.status(status)].sum(axis=(0, 2))
+        return self.counts[:, :, self.severity_indexes(levels), self.status(status)].sum(axis=(0, 2))
+
+    """Returns the n accounts with the most open findings of levels, ties by account id"""
+    def top_accounts(self, n, levels):
+        totals = self.account_totals("open", levels)
+        ranked = sorted((-int(totals[index]), account) for index, account in enumerate(self.accounts)
+                        if account != OTHER and totals[index] > 0)
+        return [account for count, account in ranked[:n]]
+
+    def account_count(self, account, status, level=None):
+        if account not in self.account_index:
+            return 0
+        index = self.account_index[account]
+        if level is None:
+            return int(self.counts[:, index, :, self.status(status)].sum())
+        return int(self.counts[:, index, SEVERITIES.index(level.lower()), self.status(status)].sum())
+
+    ## Provider with the most findings of the account, OTHER when no provider is known
+    def account_provider(self, account):
+        if account not in self.account_index:
+            return OTHER
+        totals = self.counts[:, self.account_index[account]].sum(axis=(1, 2))
+        if OTHER in self.provider_index:
+            totals[self.provider_index[OTHER]] = 0
+        return self.providers[int(totals.argmax())] if totals.any() else OTHER
+
+    def save(self, path):
+        import numpy
+        numpy.savez_compressed(path, counts=self.counts, providers=numpy.array(self.providers, dtype=str),
+                               accounts=numpy.array(self.accounts, dtype=str))
+
+
+"""Builds a cube from an iterable of (provider, account, severity, status, count) cells in one pass"""
+def from_cells(cells):
+    import numpy
+    providers = {}
+    accounts = {}
+    severities = {severity: index for index, severity in enumerate(SEVERITIES + [ANY_SEVERITY])}
+    statuses = {status: index for index, status in enumerate(STATUSES)}
+    provider_ids = []
+    account_ids = []
+    severity_ids = []
+    status_ids = []
+    values = []
+    for provider, account, severity, status, count in cells:
+        provider_ids.append(providers.setdefault(provider, len(providers)))
+        account_ids.append(accounts.setdefault(account, len(accounts)))
+        severity_ids.append(severities.get(severity, severities[ANY_SEVERITY]))
+        status_ids.append(statuses[status])
+        values.append(count)
+
+    order = sorted(providers, key=provider_sort_key)
+    remap = numpy.zeros(max(len(providers), 1), dtype=numpy.int64)
+    for index, provider in enumerate(order):
+        remap[providers[provider]] = index
+
+    shape = (len(order), len(accounts), len(severities), len(statuses))
+    size = int(numpy.prod(shape))
+    if size == 0:
+        return CountCube(order, list(accounts), numpy.zeros(shape, dtype=numpy.int64))
+    flat = numpy.ravel_multi_index((remap[numpy.array(provider_ids, dtype=numpy.int64)], numpy.array(account_ids, dtype=numpy.int64),
+                                    numpy.array(severity_ids, dtype=numpy.int64), numpy.array(status_ids, dtype=numpy.int64)), shape)
+    counts = numpy.bincount(flat, weights=numpy.array(values, dtype=numpy.float64), minlength=size)
+    return CountCube(order, list(accounts), numpy.rint(counts).astype(numpy.int64).reshape(shape))
+
+## Cells of normalized findings (findings_stream.normalize_finding), one per finding and one more if it is suppressed
+def finding_cells(findings):
+    for finding in findings:
+        provider = (finding["provider"] or OTHER).lower()
+        account = finding["account_id"] or OTHER
+        level = (finding["level"] or ANY_SEVERITY).lower()
+        status = (finding["status"] or "").lower()
+        if status in ("open", "resolved"):
+            yield provider, account, level, status, 1
+        if finding["is_suppressed"]:
+            yield provider, account, level, "suppressed", 1
+
+def from_findings(findings):
+    return from_cells(finding_cells(findings))
+
+"""Builds the cube of a local findings store with one GROUP BY, restricted by the SQL conditions"""
+def from_store(connection, conditions, params):
+    sql = ("SELECT provider, account_id, level, status, is_suppressed, COUNT(*) FROM findings"
+           + (" WHERE " + " AND ".join(conditions) if conditions else "")
+           + " GROUP BY provider, account_id, level, status, is_suppressed")
+
+    def cells():
+        for provider, account, level, status, suppressed, count in connection.execute(sql, params):
+            provider = (provider or OTHER).lower()
+            account = account or OTHER
+            level = (level or ANY_SEVERITY).lower()
+            status = (status or "").lower()
+            if status in ("open", "resolved"):
+                yield provider, account, level, status, count
+            if suppressed:
+                yield provider, account, level, "suppressed", count
+    return from_cells(cells())
+
+def load(path):
+    import numpy
+    with numpy.load(path, allow_pickle=False) as data:
+        return CountCube([str(provider) for provider in data["providers"]], [str(account) for account in data["accounts"]], data["counts"])
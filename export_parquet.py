@@ -0,0 +1,160 @@
+import logging
+import os
+
+import atomic_file
+import count_cube
+import findings_store
+import findings_stream
+
+# Parquet export of the findings and of the report tables, for bulk analysis instead of
+# the pretty printed aggregation responses in data/.
+#
+# findings.parquet has one row per finding with the columns of findings_stream.FINDING_FIELDS,
+# or the subset given by columns. It is written while the findings are streamed, from the
+# paginated findings query or from a local findings store: rows are buffered up to one row
+# group and written out, so memory is bounded by the row group size and not by the number
+# of findings. The report tables (top rules, accounts by open/resolved/suppressed findings,
+# objects by risk, ...) come from the report model and are small, finding_counts.parquet
+# has every cell of the count cube.
+#
+# Every file is written under a temporary name and renamed (atomic_file), so a reader never
+# sees a partial file. pyarrow is only imported by the functions that build the schemas and write
+# the files, so report_cli can use the defaults below without loading it.
+
+DEFAULT_EXPORT_DIR = "exports"
+DEFAULT_ROW_GROUP_SIZE = 100000
+COMPRESSIONS = ["snappy", "zstd", "gzip", "none"]
+DEFAULT_COMPRESSION = "zstd"
+
+# Columns of the Parquet files as (name, pyarrow type name) pairs, see arrow_schema
+FINDING_FIELDS = [
+    ("id", "string"),
+    ("object_id", "string"),
+    ("object_xid", "string"),
+    ("rule_id", "string"),
+    ("account_id", "string"),
+    ("provider", "string"),
+    ("level", "string"),
+    ("status", "string"),
+    ("risk_score", "int32"),
+    ("is_suppressed", "bool_")
+]
+FINDING_COLUMNS = [name for name, type_name in FINDING_FIELDS]
+
+# Report tables: name -> (fields, function returning the rows of the report model)
+REPORT_TABLES = {
+    "top_rules": ([("rule_name", "string"), ("provider", "string"), ("object_type", "string"), ("severity", "string"), ("findings", "int64")],
+                  lambda model: model["top_10_rules"]),
+    "accounts_by_severity": ([("provider", "string"), ("account_id", "string"), ("high", "int64"), ("medium", "int64"), ("low", "int64"),
+                              ("suppressed", "int64"), ("resolved", "int64")],
+                             lambda model: [[None if value == "N/A" else value for value in row] for row in model["top_10_accounts_by_severity"]]),
+    "accounts_by_findings": ([("account_id", "string"), ("open", "int64"), ("resolved", "int64")],
+                             lambda model: list(zip(model["top_10_accounts_by_findings"]["accounts"],
+                                                    model["top_10_accounts_by_findings"]["open"][0],
+                                                    model["top_10_accounts_by_findings"]["resolved"][0]))),
+    "objects_by_risk": ([("risk_score", "int64"), ("findings", "int64"), ("object_name", "string"), ("object_id", "string"),
+                         ("provider", "string"), ("account_id", "string")],
+                        lambda model: model["top_10_objects_by_risk"]),
+    "findings_by_provider": ([("provider", "string"), ("open", "int64")],
+                             lambda model: list(zip(model["providers"], model["findings_by_provider"][0]))),
+    "findings_by_severity": ([("provider", "string"), ("high", "int64"), ("medium", "int64"), ("low", "int64")],
+                             lambda model: [[provider] + list(counts) for provider, counts in model["violations_by_severity"].items()]),
+    "open_findings_trends": ([("period", "string"), ("open", "int64")],
+                             lambda model: list(zip(model["open_findings_trends"]["months"], model["open_findings_trends"]["data"][0]))),
+    "new_resolved_trends": ([("period", "string"), ("new", "int64"), ("resolved", "int64")],
+                            lambda model: list(zip(model["new_resolved_trends"]["months"], *model["new_resolved_trends"]["data"])))
+}
+
+COUNT_FIELDS = [("provider", "string"), ("account_id", "string"), ("severity", "string"), ("status", "string"), ("findings", "int64")]
+
+
+## pyarrow schema of (name, pyarrow type name) fields
+def arrow_schema(fields):
+    import pyarrow
+    return pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in fields])
+
+def compression_codec(compression):
+    return None if compression == "none" else compression
+
+## Schema of the finding columns in columns, all of them when columns is empty
+def finding_schema(columns=None):
+    unknown = [column for column in columns or [] if column not in FINDING_COLUMNS]
+    if unknown:
+        raise ValueError("Unknown finding columns " + ", ".join(unknown) + ", expected some of " + ", ".join(FINDING_COLUMNS))
+    return arrow_schema([(name, type_name) for name, type_name in FINDING_FIELDS if not columns or name in columns])
+
+"""Writes rows (lists in the order of schema) to a Parquet file, one row group per row_group_size rows. Returns the number of rows"""
+def write_rows(path, schema, rows, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=DEFAULT_COMPRESSION):
+    import pyarrow
+    import pyarrow.parquet as parquet
+    count = 0
+    with atomic_file.replacing(path) as temp_path:
+        writer = parquet.ParquetWriter(temp_path, schema, compression=compression_codec(compression))
+        try:
+            batch = [[] for _ in schema.names]
+            for row in rows:
+                for column, value in zip(batch, row):
+                    column.append(value)
+                count += 1
+                if(len(batch[0]) >= row_group_size):
+                    writer.write_table(pyarrow.Table.from_arrays(batch, schema=schema), row_group_size=row_group_size)
+                    batch = [[] for _ in schema.names]
+            if(batch[0] or count == 0):
+                writer.write_table(pyarrow.Table.from_arrays(batch, schema=schema), row_group_size=row_group_size)
+        finally:
+            writer.close()
+    return count
+
+## Rows of the findings streamed from the API, only the columns of schema
+def stream_finding_rows(filters, schema):
+    names = schema.names
+    for finding in findings_stream.iter_findings(filters):
+        row = findings_stream.normalize_finding(finding)
+        yield [row[name] for name in names]
+
+## Rows of the findings of a local findings store, read with a cursor
+def store_finding_rows(store_path, filters, schema):
+    conditions, params = findings_store.where_clause(filters)
+    sql = "SELECT " + ", ".join(schema.names) + " FROM findings" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+    suppressed = schema.names.index("is_suppressed") if "is_suppressed" in schema.names else None
+    connection = findings_store.connect(store_path)
+    try:
+        for row in connection.execute(sql, params):
+            if suppressed is not None:
+                row = list(row)
+                row[suppressed] = bool(row[suppressed])
+            yield row
+    finally:
+        connection.close()
+
+"""Writes the findings matching filters to export_dir/findings.parquet, from store_path when set or else from the API"""
+def export_findings(export_dir, filters, store_path=None, columns=None, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=DEFAULT_COMPRESSION):
+    schema = finding_schema(columns)
+    if(store_path):
+        rows = store_finding_rows(store_path, filters, schema)
+    else:
+        rows = stream_finding_rows(filters, schema)
+    path = os.path.join(export_dir, "findings.parquet")
+    count = write_rows(path, schema, rows, row_group_size, compression)
+    logging.info("Exported " + str(count) + " findings to " + path + "\n")
+    return count
+
+## Non zero cells of the count cube, the counts not split by provider, account or severity have null there
+def cube_rows(cube):
+    for provider_index, account_index, severity_index, status_index in zip(*cube.counts.nonzero()):
+        provider = cube.providers[provider_index]
+        account = cube.accounts[account_index]
+        severity = cube.severities[severity_index]
+        yield [provider if provider != count_cube.OTHER else None,
+               account if account != count_cube.OTHER else None,
+               severity if severity != count_cube.ANY_SEVERITY else None,
+               count_cube.STATUSES[status_index],
+               int(cube.counts[provider_index, account_index, severity_index, status_index])]
+
+"""Writes every table of the report model, and the count cube when given, to export_dir/<table>.parquet"""
+def export_report_tables(export_dir, model, cube=None, compression=DEFAULT_COMPRESSION):
+    for name, (fields, rows) in REPORT_TABLES.items():
+        write_rows(os.path.join(export_dir, name + ".parquet"), arrow_schema(fields), rows(model), compression=compression)
+    if cube is not None:
+        write_rows(os.path.join(export_dir, "finding_counts.parquet"), arrow_schema(COUNT_FIELDS), cube_rows(cube), compression=compression)
+    logging.info("Exported the report tables to " + export_dir + "\n")
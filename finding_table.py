@@ -0,0 +1,190 @@
+import array
+
+import numpy
+
+from findings_stream import finding_value
+
+# Compact in-memory table of findings, built while the findings are streamed. Only the
+# fields of findings_stream.FINDING_FIELDS used for local computations are kept, one typed
+# array per field instead of one JSON dict per finding. ID fields are dictionary encoded:
+# each distinct value is stored once and the column holds its integer code, so a finding
+# takes a few dozen bytes whatever the size of its JSON.
+#
+# Filters and group-bys are NumPy scans over the code columns. Values are translated to
+# codes once per query, a value that never occurs matches no row without a scan. Repeated
+# point lookups use lookup() instead, a hash index of the rows by the codes of some columns
+# that is built by one pass over the table and then answers each lookup in O(1).
+#
+#   table = finding_table.from_findings(findings_stream.iter_findings())
+#   table.count(object_id=object_id, rule_id=rule_id, status="Open")
+#   table.lookup(object_id=object_id, rule_id=rule_id, status="Open")
+#   table.group_sum("object_id", "risk_score", table.mask(status="Open"))
+
+# Dictionary encoded columns, providers and levels are lower case like normalize_finding()
+ENCODED_COLUMNS = ["object_id", "object_xid", "rule_id", "account_id", "provider", "level", "status"]
+LOWER_CASE_COLUMNS = ["provider", "level"]
+
+# Plain columns and their array typecode
+VALUE_COLUMNS = {"risk_score": "i", "is_suppressed": "b"}
+
+CODE_TYPECODE = "i"
+
+
+class Dictionary(object):
+    """Interned values of an encoded column, code i is values[i]"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class FindingTable(object):
+    """Columns of findings, rows are in the order the findings were appended"""
+
+    def __init__(self):
+        self.dictionaries = {name: Dictionary() for name in ENCODED_COLUMNS}
+        self.columns = {name: array.array(CODE_TYPECODE) for name in ENCODED_COLUMNS}
+        for name, typecode in VALUE_COLUMNS.items():
+            self.columns[name] = array.array(typecode)
+        # NumPy copies of the columns, made on the first scan after an append
+        self.arrays = {}
+        # Hash indexes of lookup(), built on the first lookup after an append
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.columns["status"])
+
+    ## Appends a finding as returned by the API
+    def append(self, finding):
+        for name in ENCODED_COLUMNS:
+            value = finding_value(finding, name)
+            if(name in LOWER_CASE_COLUMNS and value):
+                value = value.lower()
+            self.columns[name].append(self.dictionaries[name].encode(value))
+        self.columns["risk_score"].append(int(finding_value(finding, "risk_score") or 0))
+        self.columns["is_suppressed"].append(1 if finding_value(finding, "is_suppressed") else 0)
+        if self.arrays:
+            self.arrays = {}
+        if self.indexes:
+            self.indexes = {}
+
+    def extend(self, findings):
+        for finding in findings:
+            self.append(finding)
+
+    def column(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = numpy.array(self.columns[name])
+        return self.arrays[name]
+
+    def decode(self, name, codes):
+        values = self.dictionaries[name].values
+        return [values[code] for code in codes]
+
+    ## Codes of the values present in the column, a single value or a list of values
+    def codes(self, name, values):
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if(name in LOWER_CASE_COLUMNS):
+            values = [value.lower() if value else value for value in values]
+        known = self.dictionaries[name].codes
+        return [known[value] for value in values if value in known]
+
+    """Returns a boolean array of the rows matching every condition, ex: mask(status="Open", level=["high", "medium"])"""
+    def mask(self, **conditions):
+        selected = numpy.ones(len(self), dtype=bool)
+        for name, values in conditions.items():
+            if name in self.dictionaries:
+                codes = self.codes(name, values)
+                if not codes:
+                    return numpy.zeros(len(self), dtype=bool)
+                if(len(codes) == 1):
+                    selected &= self.column(name) == codes[0]
+                else:
+                    selected &= numpy.isin(self.column(name), codes)
+            else:
+                selected &= numpy.isin(self.column(name), values if isinstance(values, (list, tuple, set)) else [values])
+        return selected
+
+    ## Row numbers matching the conditions
+    def where(self, **conditions):
+        return numpy.flatnonzero(self.mask(**conditions))
+
+    def count(self, **conditions):
+        return int(numpy.count_nonzero(self.mask(**conditions)))
+
+    ## {codes of the columns: rows}, built once for a set of columns
+    def index(self, names):
+        names = tuple(sorted(names))
+        if names not in self.indexes:
+            index = {}
+            for row, codes in enumerate(zip(*(self.columns[name] for name in names))):
+                rows = index.get(codes)
+                if rows is None:
+                    rows = index[codes] = array.array(CODE_TYPECODE)
+                rows.append(row)
+            self.indexes[names] = index
+        return self.indexes[names]
+
+    """Returns the rows whose columns have the given values, ex: lookup(object_id=object_id, status="Open"), with a hash index of the columns"""
+    def lookup(self, **conditions):
+        names = sorted(conditions)
+        codes = []
+        for name in names:
+            found = self.codes(name, conditions[name])
+            if not found:
+                return []
+            codes.append(found[0])
+        return self.index(names).get(tuple(codes), [])
+
+    """Returns {value of key: number of rows} of the rows selected by mask, all rows without a mask"""
+    def group_count(self, key, mask=None):
+        codes = self.column(key) if mask is None else self.column(key)[mask]
+        counts = numpy.bincount(codes, minlength=len(self.dictionaries[key]))
+        return {value: int(counts[code]) for code, value in enumerate(self.dictionaries[key].values) if counts[code]}
+
+    """Returns {value of key: sum of the column} of the rows selected by mask, ex: the risk score per object"""
+    def group_sum(self, key, column="risk_score", mask=None):
+        codes = self.column(key)
+        values = self.column(column)
+        if mask is not None:
+            codes = codes[mask]
+            values = values[mask]
+        counts = numpy.bincount(codes, minlength=len(self.dictionaries[key]))
+        sums = numpy.bincount(codes, weights=values, minlength=len(self.dictionaries[key]))
+        return {value: int(sums[code]) for code, value in enumerate(self.dictionaries[key].values) if counts[code]}
+
+    ## Rows as normalize_finding() dicts, without the finding id that is not kept
+    def rows(self, indexes):
+        rows = []
+        for index in indexes:
+            row = {name: self.dictionaries[name].values[self.columns[name][index]] for name in ENCODED_COLUMNS}
+            row["risk_score"] = self.columns["risk_score"][index]
+            row["is_suppressed"] = bool(self.columns["is_suppressed"][index])
+            rows.append(row)
+        return rows
+
+    ## Bytes held by the columns and the distinct values of the encoded columns
+    def memory_size(self):
+        size = sum(column.itemsize * len(column) for column in self.columns.values())
+        for dictionary in self.dictionaries.values():
+            size += sum(len(value) for value in dictionary.values if isinstance(value, str))
+        return size
+
+
+"""Builds a table from an iterable of API findings in one pass, ex: findings_stream.iter_findings()"""
+def from_findings(findings):
+    table = FindingTable()
+    table.extend(findings)
+    return table
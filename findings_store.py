@@ -0,0 +1,238 @@
+import json
+import logging
+import sqlite3
+import time
+
+import collection_status
+import findings_stream
+import vss_client
+
+# Local SQLite copy of the raw findings of a tenant. sync() downloads the findings once,
+# query() then answers v2/findings/query payloads (filters, Terms aggregations with
+# termsCount and subAggregations) with local SQL and returns the same response shape
+# as the API, so the data/*.json files and get_* readers work unchanged.
+#
+# sync_incremental() keeps the store current without downloading every finding again: it
+# remembers the last collection time of every cloud account and only replaces the findings
+# of accounts collected again since the previous sync. Accounts that are gone lose their
+# findings, new accounts are downloaded.
+#
+# Findings are stored without their cloud tags, so payloads filtering on cloudTags cannot be
+# answered locally: where_clause() raises ValueError for them instead of ignoring the filter.
+
+COLUMNS = ["id", "object_id", "object_xid", "rule_id", "account_id", "provider", "level", "status", "risk_score", "is_suppressed"]
+
+INDEXED_COLUMNS = ["account_id", "rule_id", "provider", "level", "status", "object_xid"]
+
+# Aggregation fieldName -> column
+FIELD_COLUMNS = {
+    "CloudProvider": "provider",
+    "CloudAccountId": "account_id",
+    "RuleId": "rule_id",
+    "ObjectXid": "object_xid",
+    "ObjectId": "object_id",
+    "RiskScore": "risk_score",
+    "Level": "level",
+    "Status": "status",
+    "IsSuppressed": "is_suppressed"
+}
+
+# Columns stored as 0/1, their buckets are keyed true/false like the API
+BOOLEAN_COLUMNS = ["is_suppressed"]
+
+INSERT_BATCH_SIZE = 5000
+
+SYNC_MODES = ["full", "incremental"]
+# Accounts whose findings are downloaded with one paginated query
+ACCOUNT_BATCH_SIZE = 100
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    create_schema(connection)
+    return connection
+
+def create_schema(connection):
+    connection.execute('''CREATE TABLE IF NOT EXISTS findings (
+                            id TEXT,
+                            object_id TEXT,
+                            object_xid TEXT,
+                            rule_id TEXT,
+                            account_id TEXT,
+                            provider TEXT,
+                            level TEXT,
+                            status TEXT,
+                            risk_score INTEGER,
+                            is_suppressed INTEGER)''')
+    for column in INDEXED_COLUMNS:
+        connection.execute("CREATE INDEX IF NOT EXISTS findings_" + column + " ON findings (" + column + ")")
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    # Last collection time of every account at the last sync
+    connection.execute("CREATE TABLE IF NOT EXISTS accounts (account_id TEXT PRIMARY KEY, collected_at TEXT)")
+    connection.commit()
+
+def insert_findings(connection, findings):
+    statement = "INSERT INTO findings (" + ", ".join(COLUMNS) + ") VALUES (" + ", ".join("?" * len(COLUMNS)) + ")"
+    count = 0
+    batch = []
+    for finding in findings:
+        row = findings_stream.normalize_finding(finding)
+        batch.append(tuple(row[column] for column in COLUMNS))
+        if len(batch) >= INSERT_BATCH_SIZE:
+            connection.executemany(statement, batch)
+            count += len(batch)
+            batch = []
+    connection.executemany(statement, batch)
+    return count + len(batch)
+
+def save_collection_times(connection, times):
+    connection.execute("DELETE FROM accounts")
+    connection.executemany("INSERT INTO accounts (account_id, collected_at) VALUES (?, ?)", sorted(times.items()))
+
+def mark_synced(connection, mode):
+    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (str(time.time()),))
+    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sync_mode', ?)", (mode,))
+
+"""Replaces the store content with every finding matching filters (all findings of the tenant by default)"""
+def sync(path, filters=None):
+    connection = connect(path)
+    started = time.time()
+    try:
+        # Read before the findings, an account collected during the download is fetched again next time
+        try:
+            times = collection_status.collection_times()
+        except vss_client.ErrorStatusCode as error:
+            logging.warning("Cannot read the collection status, the next sync will be a full one: " + str(error) + "\n")
+            times = {}
+        with connection:
+            connection.execute("DELETE FROM findings")
+            count = insert_findings(connection, findings_stream.iter_findings(filters))
+            save_collection_times(connection, times)
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('filters', ?)", (json.dumps(filters, sort_keys=True),))
+            mark_synced(connection, "full")
+    finally:
+        connection.close()
+    logging.info("Synced " + str(count) + " findings to " + path + " in " + str(round(time.time() - started, 1)) + "s\n")
+    return count
+
+def meta_value(connection, key):
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+## Returns (accounts collected again or new since the last sync, accounts that are gone)
+def changed_accounts(connection, times):
+    previous = dict(connection.execute("SELECT account_id, collected_at FROM accounts").fetchall())
+    changed = sorted(account for account, collected in times.items()
+                     if account not in previous or collected is None or collected != previous[account])
+    removed = sorted(account for account in previous if account not in times)
+    return changed, removed
+
+def delete_accounts(connection, accounts):
+    for start in range(0, len(accounts), ACCOUNT_BATCH_SIZE):
+        batch = accounts[start:start + ACCOUNT_BATCH_SIZE]
+        connection.execute("DELETE FROM findings WHERE account_id IN (" + ", ".join("?" * len(batch)) + ")", batch)
+
+"""Brings the store up to date by downloading only the findings of accounts collected since the last sync. Falls back to sync() for a store that was never synced or was synced with other filters"""
+def sync_incremental(path, filters=None):
+    connection = connect(path)
+    started = time.time()
+    try:
+        synced = meta_value(connection, "synced_at") is not None
+        same_filters = meta_value(connection, "filters") == json.dumps(filters, sort_keys=True)
+        has_accounts = connection.execute("SELECT COUNT(*) FROM accounts").fetchone()[0] > 0
+        if not (synced and same_filters and has_accounts):
+            connection.close()
+            logging.info("No previous sync of " + path + ", downloading every finding\n")
+            return sync(path, filters)
+
+        times = collection_status.collection_times()
+        changed, removed = changed_accounts(connection, times)
+        if filters and "cloudAccountIds" in filters:
+            wanted = set(filters["cloudAccountIds"])
+            changed = [account for account in changed if account in wanted]
+        logging.info(str(len(changed)) + " of " + str(len(times)) + " accounts were collected since the last sync, "
+                     + str(len(removed)) + " are gone\n")
+
+        count = 0
+        with connection:
+            delete_accounts(connection, removed)
+            connection.executemany("DELETE FROM accounts WHERE account_id = ?", [(account,) for account in removed])
+        # One transaction per batch, the accounts table only records a batch once its findings are stored
+        for start in range(0, len(changed), ACCOUNT_BATCH_SIZE):
+            batch = changed[start:start + ACCOUNT_BATCH_SIZE]
+            with connection:
+                delete_accounts(connection, batch)
+                count += insert_findings(connection, findings_stream.iter_findings(dict(filters or {}, cloudAccountIds=batch)))
+                connection.executemany("INSERT OR REPLACE INTO accounts (account_id, collected_at) VALUES (?, ?)",
+                                       [(account, times[account]) for account in batch])
+        with connection:
+            mark_synced(connection, "incremental")
+    finally:
+        connection.close()
+    logging.info("Synced " + str(count) + " findings of changed accounts to " + path + " in " + str(round(time.time() - started, 1)) + "s\n")
+    return count
+
+## Translates the filters of a findings query into a WHERE clause and its parameters
+def where_clause(filters):
+    conditions = []
+    params = []
+
+    def is_in(column, values, lower=False):
+        values = [value.lower() if lower else value for value in values]
+        conditions.append(column + " IN (" + ", ".join("?" * len(values)) + ")")
+        params.extend(values)
+
+    if "cloudAccountIds" in filters:
+        is_in("account_id", filters["cloudAccountIds"])
+    if "levels" in filters:
+        is_in("level", filters["levels"], lower=True)
+    if "cloudProviders" in filters:
+        is_in("provider", filters["cloudProviders"], lower=True)
+    if "status" in filters:
+        conditions.append("status = ?")
+        params.append(filters["status"])
+    if "isSuppressed" in filters:
+        conditions.append("is_suppressed = ?")
+        params.append(1 if filters["isSuppressed"] else 0)
+    if filters.get("cloudTags"):
+        raise ValueError("Cloud tag filters cannot be computed from the local findings store, findings are stored without their tags")
+
+    return conditions, params
+
+def aggregate(connection, conditions, params, spec):
+    column = FIELD_COLUMNS[spec["fieldName"]]
+    sql = "SELECT " + column + ", COUNT(*) AS count FROM findings"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " GROUP BY " + column + " ORDER BY count DESC, " + column
+    if "termsCount" in spec:
+        sql += " LIMIT " + str(int(spec["termsCount"]))
+
+    buckets = {}
+    for value, count in connection.execute(sql, params).fetchall():
+        if value is None:
+            continue
+        bucket = {"count": count}
+        if spec.get("subAggregations"):
+            bucket["subAggregations"] = {
+                name: aggregate(connection, conditions + [column + " = ?"], params + [value], sub_spec)
+                for name, sub_spec in spec["subAggregations"].items()
+            }
+        buckets[("true" if value else "false") if column in BOOLEAN_COLUMNS else str(value)] = bucket
+    return {"buckets": buckets}
+
+## Answers a v2/findings/query payload from the store
+def query(connection, payload):
+    conditions, params = where_clause(payload.get("filters", {}))
+
+    sql = "SELECT COUNT(*) FROM findings"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    total_count = connection.execute(sql, params).fetchone()[0]
+
+    return {
+        "totalCount": total_count,
+        "aggregations": {name: aggregate(connection, conditions, params, spec)
+                         for name, spec in payload.get("aggregations", {}).items()}
+    }
@@ -0,0 +1,135 @@
+import json
+import logging
+import queue
+import threading
+
+import vss_client
+
+# Streams every finding of a v2/findings/query by following continuationToken to the
+# last page. Pages are fetched on a background thread into a bounded queue while the
+# caller works through the current page, so memory stays at a few pages no matter how
+# many findings the tenant has.
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_PREFETCH = 2
+
+DONE = object()
+
+# Finding fields used for local computations, with the API field names tried in order
+FINDING_FIELDS = {
+    "id": ["id", "findingId"],
+    "object_id": ["objectId"],
+    "object_xid": ["objectXid", "objectId"],
+    "rule_id": ["ruleId"],
+    "account_id": ["cloudAccountId", "accountId"],
+    "provider": ["cloudProvider", "provider"],
+    "level": ["level", "severity"],
+    "status": ["status"],
+    "risk_score": ["riskScore"],
+    "is_suppressed": ["isSuppressed"]
+}
+
+
+def finding_value(finding, field):
+    for name in FINDING_FIELDS[field]:
+        if finding.get(name) is not None:
+            return finding[name]
+    return None
+
+"""Returns the fields of FINDING_FIELDS from a finding. Providers and levels are lower case like the aggregation bucket keys"""
+def normalize_finding(finding):
+    provider = finding_value(finding, "provider")
+    level = finding_value(finding, "level")
+    return {
+        "id": finding_value(finding, "id"),
+        "object_id": finding_value(finding, "object_id"),
+        "object_xid": finding_value(finding, "object_xid"),
+        "rule_id": finding_value(finding, "rule_id"),
+        "account_id": finding_value(finding, "account_id"),
+        "provider": provider.lower() if provider else provider,
+        "level": level.lower() if level else level,
+        "status": finding_value(finding, "status"),
+        "risk_score": int(finding_value(finding, "risk_score") or 0),
+        "is_suppressed": bool(finding_value(finding, "is_suppressed"))
+    }
+
+def continuation_token(data):
+    token = data.get("continuationToken")
+    if token is None:
+        token = (data.get("paginationInfo") or {}).get("continuationToken")
+    return token
+
+"""Yields the response of every page of a paginated query. Pages are not cached, continuation tokens are only valid for a short time"""
+def iter_pages(url, payload=None, page_size=DEFAULT_PAGE_SIZE):
+    payload = dict(payload or {})
+    pagination = {"pageSize": page_size}
+
+    while True:
+        payload["paginationInfo"] = pagination
+        response = vss_client.post(url, data=json.dumps(payload), use_cache=False)
+        if(response.status_code != 200):
+            raise vss_client.ErrorStatusCode(str(response.status_code) + " " + str(response.content))
+
+        data = response.json()
+        yield data
+
+        token = continuation_token(data)
+        if not token or not data.get("results"):
+            break
+        pagination = {"continuationToken": token, "pageSize": page_size}
+
+## Runs the iterable on a background thread, keeping at most size items ahead of the caller
+def prefetched(iterable, size=DEFAULT_PREFETCH):
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        error = None
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as exc:
+            error = exc
+        put((DONE, error))
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if item is DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Lets the worker exit if the caller stops early
+        stop.set()
+
+"""Yields the findings matching the filters one at a time. prefetch is the number of pages fetched ahead, 0 fetches each page only when it is needed"""
+def iter_findings(filters=None, page_size=DEFAULT_PAGE_SIZE, prefetch=DEFAULT_PREFETCH):
+    payload = {}
+    if filters:
+        payload["filters"] = filters
+
+    pages = iter_pages(vss_client.api_url("v2/findings/query"), payload, page_size)
+    if(prefetch > 0):
+        pages = prefetched(pages, prefetch)
+
+    count = 0
+    for page in pages:
+        for finding in page.get("results") or []:
+            count += 1
+            yield finding
+    logging.debug("Streamed " + str(count) + " findings")
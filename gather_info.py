@@ -1,52 +1,50 @@
 import logging
-import requests
+import vss_client
+import token_cache
+import query_planner
+import agg_merge
+import topk
+import count_cube
+import findings_store
+import collection_status
+import rule_catalog
+import report_data
+import trend_store
+import metrics
 import os
 import json
 import sys
 import calendar
+import datetime
+import asyncio
+import concurrent.futures
+import threading
 
 from operator import itemgetter
 from iso8601utils import parsers
-from generate import parse_arguments
 
-# Access Token from CSP
-access_token = ''
-
-if "REFRESH_TOKEN" in os.environ:
-    refresh_token = os.environ['REFRESH_TOKEN']
-else:
-    logging.error("REFRESH_TOKEN was not set in environment variable.\nToken can be obtained from CSP\n")
-    sys.exit()
-    
 
 class ErrorStatusCode(Exception):
     pass
 
+## REFRESH_TOKEN is only needed by the stages that call the API
+def get_refresh_token():
+    if "REFRESH_TOKEN" in os.environ:
+        return os.environ['REFRESH_TOKEN']
+    logging.error("REFRESH_TOKEN was not set in environment variable.\nToken can be obtained from CSP\n")
+    sys.exit()
+
 ## Get Access Token from CSP
 def auth():
 
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    url = 'https://console.cloud.vmware.com/csp/gateway/am/api/auth/api-tokens/authorize'
-    payload = {"refresh_token": refresh_token }
-
-    response = requests.post(url, data=payload , headers=headers)
-
     try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
+        token_cache.login(get_refresh_token())
+    except token_cache.AuthError as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
             sys.exit()
 
-    data = json.loads(response.content)
-
-    global access_token
-    access_token = data["access_token"]
-
-"""Add Payload Filters - Payload, Existing Filters (Set True if filters exist), Set Levels Filter(If filtering by severity should be enabled), Status of findings ("Open" or "Resolved")"""
-def add_payload_filters(pl, existing_filters=True, set_levels_filter=False,status="Open"):
+"""Add Payload Filters - Payload, Report configuration, Existing Filters (Set True if filters exist), Set Levels Filter(If filtering by severity should be enabled), Status of findings ("Open" or "Resolved")"""
+def add_payload_filters(pl, config, existing_filters=True, set_levels_filter=False,status="Open"):
     if(existing_filters):
         pass    
     else:
@@ -54,31 +52,29 @@ def add_payload_filters(pl, existing_filters=True, set_levels_filter=False,statu
         
         pl.update(filter_dict)
     
-    if(get_config()["config"]["cloudAccountIds"][0].lower() != "all"):
-            pl["filters"]["cloudAccountIds"] = get_config()["config"]["cloudAccountIds"]
+    if(not config.all_accounts()):
+            pl["filters"]["cloudAccountIds"] = list(config.cloud_account_ids)
             pl["filters"]["status"] = status
-    if(isinstance(get_config()["config"]["cloudTags"], dict)):
-            pl["filters"]["cloudTags"] = get_config()["config"]["cloudTags"]
+    if(config.cloud_tags is not None):
+            pl["filters"]["cloudTags"] = dict(config.cloud_tags)
             pl["filters"]["status"] = status
-    if(isinstance(get_config()["config"]["severity"], list) and set_levels_filter):
-            pl["filters"]["levels"] = get_config()["config"]["severity"]
+    if(set_levels_filter):
+            pl["filters"]["levels"] = list(config.severity)
             pl["filters"]["status"] = status
-    if(isinstance(get_config()["config"]["providers"], list)):
-            pl["filters"]["cloudProviders"] = get_config()["config"]["providers"]
+    if(config.providers is not None):
+            pl["filters"]["cloudProviders"] = list(config.providers)
             pl["filters"]["status"] = status
         
     return pl
 
 
 def create_or_update_file(file_path, content):
-    if os.path.isfile(file_path):
-        with open(file_path, "w") as output_file:
-            json.dump(content.json(), output_file, indent=4)
-        output_file.close()
-    else:
-        output_file = open(file_path, "w")
-        json.dump(content.json(), output_file, indent=4)
-        output_file.close()
+    write_json_file(file_path, content.json())
+
+def write_json_file(file_path, data):
+    with open(file_path, "w") as output_file:
+        json.dump(data, output_file, indent=4)
+    report_data.store(file_path, data)
  
 # Creates necessary directories
 def create_dir():
@@ -89,9 +85,7 @@ def create_dir():
         os.mkdir("data")   
         logging.info("Successfully created data directory\n")
 
-def vss_account_info():
-    
-    url = "https://api.securestate.vmware.com/v2/findings/query"
+def account_info_payload(config):
     payload = {
                 "aggregations": {
                             "find": {
@@ -106,14 +100,14 @@ def vss_account_info():
                             }
                }    
     
-    payload = add_payload_filters(payload, False, True)
+    return add_payload_filters(payload, config, False, True)
 
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+def vss_account_info(config):
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    url = vss_client.api_url("v2/findings/query")
+    payload = account_info_payload(config)
+    
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -124,29 +118,16 @@ def vss_account_info():
     
     create_or_update_file("data/account_info.json", response)
     
+## Refreshes the rule catalog when it is older than rule_catalog.CATALOG_TTL or was fetched for another tenant
 def vss_all_rules():
-    url = "https://api.securestate.vmware.com/v1/rules/query"
-    payload = "{\n}"
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    
-    response = requests.post(url, data=payload, headers=headers)
-
+    tenant = rule_catalog.tenant_key(vss_client.VSS_API_URL, token_cache.token_id(get_refresh_token()))
     try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
+        rule_catalog.get_catalog(tenant=tenant)
+    except vss_client.ErrorStatusCode as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
             sys.exit()
-        
-    create_or_update_file("data/all_rules_info.json", response)
 
-def vss_top_10_rules():
-    
-    url = "https://api.securestate.vmware.com/v2/findings/query"
-    
+def top_10_rules_payload(config):
     payload = {
 	    "aggregations":{
 		    "rules":{
@@ -157,14 +138,15 @@ def vss_top_10_rules():
 	    }
     }
     
-    payload = add_payload_filters(payload, False, True)
+    return add_payload_filters(payload, config, False, True)
+
+def vss_top_10_rules(config):
+    
+    url = vss_client.api_url("v2/findings/query")
     
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }    
+    payload = top_10_rules_payload(config)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -176,9 +158,7 @@ def vss_top_10_rules():
     create_or_update_file("data/rules_info_top_10.json", response)
     
 
-def vss_open_resolved_findings():
-   
-    url = "https://api.securestate.vmware.com/v2/findings/query"
+def resolved_findings_payload(config):
     payload = {
                 "aggregations": {
                         "accounts":{
@@ -191,14 +171,14 @@ def vss_open_resolved_findings():
                     }
             }
         
-    payload = add_payload_filters(payload, True, True, status="Resolved")
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    return add_payload_filters(payload, config, True, True, status="Resolved")
+
+def vss_open_resolved_findings(config):
+   
+    url = vss_client.api_url("v2/findings/query")
+    payload = resolved_findings_payload(config)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -211,14 +191,10 @@ def vss_open_resolved_findings():
     create_or_update_file("data/resolved_findings.json", response)
     
 def vss_frameworks():
-    url = "https://api.securestate.vmware.com/v1/compliance-frameworks"
+    url = vss_client.api_url("v1/compliance-frameworks")
     payload = {}    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
     
-    response = requests.get(url, headers=headers)
+    response = vss_client.get(url)
     
     try:
         if(response.status_code !=200):
@@ -230,9 +206,7 @@ def vss_frameworks():
     create_or_update_file("data/frameworks.json", response)
 
 
-def vss_top_10_by_severity(sev, accounts):
-    url = "https://api.securestate.vmware.com/v2/findings/query"
-
+def top_10_by_severity_payload(config, sev, accounts):
     payload = {
             "aggregations":{
                 "cloud":{
@@ -254,14 +228,14 @@ def vss_top_10_by_severity(sev, accounts):
             }
         }
     
-    payload = add_payload_filters(payload, True, set_levels_filter=False)
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    return add_payload_filters(payload, config, True, set_levels_filter=False)
+
+def vss_top_10_by_severity(config, sev, accounts):
+    url = vss_client.api_url("v2/findings/query")
+
+    payload = top_10_by_severity_payload(config, sev, accounts)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
 
     try:
         if(response.status_code !=200):
@@ -272,11 +246,10 @@ def vss_top_10_by_severity(sev, accounts):
     
     return response
 
-def vss_high_med_low_top_10_findings():
+## Accounts of data/account_info.json, the top 10 accounts by open findings
+def top_10_accounts():
     
-    with open("data/account_info.json", "r") as accounts_info:
-        accounts = json.load(accounts_info)
-    accounts_info.close()
+    accounts = report_data.load("account_info")
     
     open_accounts = accounts["aggregations"]["accounts"]["buckets"]
     
@@ -285,26 +258,28 @@ def vss_high_med_low_top_10_findings():
     for account in open_accounts:
         top_10_account.append(account)   
     
-    response = vss_top_10_by_severity("high", top_10_account)
+    return top_10_account
+
+def vss_top_10_findings_by_severity(config, sev):
+    
+    response = vss_top_10_by_severity(config, sev, top_10_accounts())
+    
+    create_or_update_file("data/" + sev + "_severity_top_10.json", response)
+
+def vss_high_med_low_top_10_findings(config):
     
-    create_or_update_file("data/high_severity_top_10.json", response)
+    vss_top_10_findings_by_severity(config, "high")
 
     #Medium Severity
     
-    response = vss_top_10_by_severity("medium", top_10_account)
- 
-    create_or_update_file("data/medium_severity_top_10.json", response)
+    vss_top_10_findings_by_severity(config, "medium")
 
     # Low Severity
 
-    response = vss_top_10_by_severity("low", top_10_account)
-    
-    create_or_update_file("data/low_severity_top_10.json", response)
+    vss_top_10_findings_by_severity(config, "low")
     
 
-def vss_suppressed_findings():
-    
-    url = "https://api.securestate.vmware.com/v2/findings/query"
+def suppressed_findings_payload(config):
     payload = {
             "aggregations":{
                 "cloud":{
@@ -328,24 +303,25 @@ def vss_suppressed_findings():
         }
 
 
-    if(get_config()["config"]["cloudAccountIds"][0].lower() != "all"):
-        payload["filters"]["cloudAccountIds"] = get_config()["config"]["cloudAccountIds"]
+    if(not config.all_accounts()):
+        payload["filters"]["cloudAccountIds"] = list(config.cloud_account_ids)
     
-    if(isinstance(get_config()["config"]["cloudTags"], dict)):
-        payload["filters"]["cloudTags"] = get_config()["config"]["cloudTags"]
+    if(config.cloud_tags is not None):
+        payload["filters"]["cloudTags"] = dict(config.cloud_tags)
         
-    if(isinstance(get_config()["config"]["severity"], list)):
-        payload["filters"]["levels"] = get_config()["config"]["severity"]
+    payload["filters"]["levels"] = list(config.severity)
         
-    if(isinstance(get_config()["config"]["providers"], list)):
-        payload["filters"]["cloudProviders"] = get_config()["config"]["providers"]
+    if(config.providers is not None):
+        payload["filters"]["cloudProviders"] = list(config.providers)
 
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    return payload
+
+def vss_suppressed_findings(config):
+    
+    url = vss_client.api_url("v2/findings/query")
+    payload = suppressed_findings_payload(config)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
 
     try:
         if(response.status_code !=200):
@@ -356,9 +332,7 @@ def vss_suppressed_findings():
     
     create_or_update_file("data/suppressed_findings.json", response)
 
-def vss_all_violations_by_severity():
-    
-    url = "https://api.securestate.vmware.com/v2/findings/query"
+def violations_by_severity_payload(config, level):
     payload = {
             "aggregations":{
                 "cloud":{
@@ -367,46 +341,19 @@ def vss_all_violations_by_severity():
                     }
             },
             "filters":{
-                "levels":["High"],
+                "levels":[level],
                 "status":"Open"
             }
         }
         
-    payload = add_payload_filters(payload, True)
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
-    
-    try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
-            sys.exit()
-    
-    
-    create_or_update_file("data/high_severity.json", response)
-    
-    payload = {
-            "aggregations":{
-                "cloud":{
-                    "fieldName":"CloudProvider",
-                    "aggregationType":"Terms",
-                    }
-                },
-            "filters":{
-                "levels":["Medium"],
-                "status":"Open"
-                }
-        }
+    return add_payload_filters(payload, config, True)
+
+def vss_violations_by_severity(config, level):
     
-    payload = add_payload_filters(payload, True)
+    url = vss_client.api_url("v2/findings/query")
+    payload = violations_by_severity_payload(config, level)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -415,37 +362,17 @@ def vss_all_violations_by_severity():
             logging.error("Cannot generate report " + str(response.content) + "\n")
             sys.exit()
     
-    create_or_update_file("data/medium_severity.json", response)
-    
-    payload = {
-            "aggregations":{
-                "cloud":{
-                    "fieldName":"CloudProvider",
-                    "aggregationType":"Terms",
-                    }
-                },
-            "filters":{
-                "levels":["Low"],
-                "status":"Open"
-                }
-            }
-    
-    payload = add_payload_filters(payload, True)
+    create_or_update_file("data/" + level.lower() + "_severity.json", response)
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+def vss_all_violations_by_severity(config):
     
-    try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
-            sys.exit()
+    vss_violations_by_severity(config, "High")
     
-    create_or_update_file("data/low_severity.json", response)
-
-def vss_top_10_objects_by_risk():
-    url = "https://api.securestate.vmware.com/v2/findings/query"
+    vss_violations_by_severity(config, "Medium")
     
+    vss_violations_by_severity(config, "Low")
+
+def objects_by_risk_payload(config):
     payload = {
                 "aggregations":{
                     "provider":{
@@ -487,14 +414,14 @@ def vss_top_10_objects_by_risk():
             }
     
     
-    payload = add_payload_filters(payload, True, set_levels_filter=True)
+    return add_payload_filters(payload, config, True, set_levels_filter=True)
+
+def vss_top_10_objects_by_risk(config):
+    url = vss_client.api_url("v2/findings/query")
     
-    headers = {
-        'Content-Type':'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    payload = objects_by_risk_payload(config)
     
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -505,25 +432,23 @@ def vss_top_10_objects_by_risk():
     
     create_or_update_file("data/objects_risk_top_10.json", response)
     
-def vss_trends():
-    url = "https://api.securestate.vmware.com/v2/findings/trends-query"
+def trends_payload(config, interval="month"):
     payload = {
             "filters":{
                 "status":"Open"
             },
-            "Interval":"month",
+            "Interval":interval,
             "TopNThreshold":3
         }
 
 
-    payload = add_payload_filters(payload, True, set_levels_filter=True)
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    return add_payload_filters(payload, config, True, set_levels_filter=True)
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+def vss_trends(config, interval="month"):
+    url = vss_client.api_url("v2/findings/trends-query")
+    payload = trends_payload(config, interval)
+    
+    response = vss_client.post(url, data=json.dumps(payload))
     
     try:
         if(response.status_code !=200):
@@ -534,26 +459,356 @@ def vss_trends():
     
     create_or_update_file("data/trends.json", response)
 
-def get_org_name():
-    return get_config()["org_name"]
+# Most cloud accounts per provider one snapshot request returns, tenants with more are counted in batches of accounts
+SNAPSHOT_MAX_ACCOUNTS = 10000
+SNAPSHOT_ACCOUNT_BATCH_SIZE = 1000
+
+# Finding counts per provider, account, severity and status of the report scope, one snapshot of the trend history.
+# max_accounts is the termsCount of the accounts, None counts every account
+def trend_snapshot_payload(config, max_accounts=SNAPSHOT_MAX_ACCOUNTS):
+    payload = {
+            "aggregations": {
+                "providers": {
+                    "fieldName": "CloudProvider",
+                    "aggregationType": "Terms",
+                    "subAggregations": {
+                        "accounts": {
+                            "fieldName": "CloudAccountId",
+                            "aggregationType": "Terms",
+                            "subAggregations": {
+                                "levels": {
+                                    "fieldName": "Level",
+                                    "aggregationType": "Terms",
+                                    "subAggregations": {
+                                        "status": {
+                                            "fieldName": "Status",
+                                            "aggregationType": "Terms"
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "filters": {}
+        }
+    if(max_accounts is not None):
+        payload["aggregations"]["providers"]["subAggregations"]["accounts"]["termsCount"] = max_accounts
+    
+    payload = add_payload_filters(payload, config, True, set_levels_filter=True)
+    # Open and resolved findings are both counted
+    payload["filters"].pop("status", None)
+    return payload
+
+## True when the account buckets of every provider hold all of its findings, none were cut by termsCount
+def snapshot_complete(data):
+    for provider_bucket in data["aggregations"]["providers"]["buckets"].values():
+        accounts = provider_bucket["subAggregations"]["accounts"]["buckets"]
+        if(sum(bucket["count"] for bucket in accounts.values()) != provider_bucket["count"]):
+            return False
+    return True
+
+## Cloud accounts of the report scope, the configured ones or every account of the tenant
+def snapshot_accounts(config):
+    if(not config.all_accounts()):
+        return list(config.cloud_account_ids)
+    try:
+        accounts = [collection_status.account_id(record) for record in collection_status.iter_accnt_status()]
+    except vss_client.ErrorStatusCode as error:
+        logging.error("Cannot generate report " + str(error) + "\n")
+        sys.exit()
+    return sorted(account for account in accounts if account is not None)
+
+def vss_trend_snapshot(config, store_path=None):
+    if(store_path):
+        connection = findings_store.connect(store_path)
+        try:
+            return findings_store.query(connection, trend_snapshot_payload(config, None))
+        finally:
+            connection.close()
+    
+    url = vss_client.api_url("v2/findings/query")
+    
+    def post(payload):
+        response = vss_client.post(url, data=json.dumps(payload))
+        try:
+            if(response.status_code !=200):
+                raise ErrorStatusCode(str(response.status_code))
+        except ErrorStatusCode:
+                logging.error("Cannot generate report " + str(response.content) + "\n")
+                sys.exit()
+        return response.json()
+    
+    payload = trend_snapshot_payload(config)
+    data = post(payload)
+    if(snapshot_complete(data)):
+        return data
+    
+    # A batch has no more accounts than its termsCount and batches never share an account, so their
+    # merge without a terms cut counts every account exactly
+    accounts = snapshot_accounts(config)
+    logging.info("A provider has more accounts than one snapshot request returns, counting the snapshot of "
+                 + str(len(accounts)) + " accounts in batches of " + str(SNAPSHOT_ACCOUNT_BATCH_SIZE) + "\n")
+    batch_payload = trend_snapshot_payload(config, SNAPSHOT_ACCOUNT_BATCH_SIZE)
+    responses = [post(agg_merge.shard_payload(batch_payload, accounts[start:start + SNAPSHOT_ACCOUNT_BATCH_SIZE]))
+                 for start in range(0, len(accounts), SNAPSHOT_ACCOUNT_BATCH_SIZE)]
+    return agg_merge.merge_responses(responses, trend_snapshot_payload(config, None))
+
+# Appends the counts of this run to the trend history in history_dir and computes data/trends.json from it.
+# The trends API is only asked for past periods the history does not cover yet, ex: on the first run.
+def update_trends(config, history_dir, interval=trend_store.DEFAULT_INTERVAL, store_path=None):
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    snapshot = vss_trend_snapshot(config, store_path)
+    path = trend_store.store_path(history_dir, trend_snapshot_payload(config)["filters"])
+    trend_store.append_snapshot(path, now, trend_store.snapshot_counts(snapshot))
+    
+    records = trend_store.read_records(path)
+    missing = trend_store.missing_periods(records, interval, now.date())
+    if missing:
+        logging.info("Importing " + str(len(missing)) + " past " + interval + "s into the trend history\n")
+        vss_trends(config, interval)
+        response = report_data.load("trends")
+        periods = trend_store.periods_from_response(response, interval, set(missing))
+        # Periods the API has no bucket for had no findings, they are not asked again
+        periods = {start: periods.get(start, {"open": 0, "new": 0, "resolved": 0}) for start in missing}
+        trend_store.append_periods(path, interval, periods)
+        current_start = trend_store.period_start(now.date(), interval)
+        current = trend_store.periods_from_response(response, interval, {current_start})
+        trend_store.append_partial_period(path, interval, current_start, now, current.get(current_start, {"open": 0, "new": 0, "resolved": 0}))
+        records = trend_store.read_records(path)
+    
+    trend_store.compact(path, now)
+    write_json_file("data/trends.json", trend_store.compute_trends(records, interval, now.date()))
+
+# Findings queries of a report as (name of the file in data/, payload), used to plan merged requests.
+# Objects by risk are left out when they are ranked over every open finding (top_objects > 0).
+def findings_query_sections(config, top_objects=0):
+    sections = [
+        ("account_info", account_info_payload(config)),
+        ("rules_info_top_10", top_10_rules_payload(config)),
+        ("resolved_findings", resolved_findings_payload(config)),
+        ("suppressed_findings", suppressed_findings_payload(config)),
+        ("high_severity", violations_by_severity_payload(config, "High")),
+        ("medium_severity", violations_by_severity_payload(config, "Medium")),
+        ("low_severity", violations_by_severity_payload(config, "Low")),
+        ("objects_risk_top_10", objects_by_risk_payload(config))
+    ]
+    if(top_objects):
+        sections = [(name, payload) for name, payload in sections if name != "objects_risk_top_10"]
+    return sections
+
+# Needs data/account_info.json
+def top_10_by_severity_sections(config):
+    accounts = top_10_accounts()
+    return [(sev + "_severity_top_10", top_10_by_severity_payload(config, sev, accounts)) for sev in ["high", "medium", "low"]]
+
+## Sends one planned request and writes the response of every section it carries
+def vss_query_group(group):
+    url = vss_client.api_url("v2/findings/query")
+    
+    response = vss_client.post(url, data=json.dumps(group["payload"]))
+    
+    try:
+        if(response.status_code !=200):
+            raise ErrorStatusCode(str(response.status_code))
+    except ErrorStatusCode:
+            logging.error("Cannot generate report " + str(response.content) + "\n")
+            sys.exit()
+    
+    for name, data in query_planner.split_response(group, response.json()).items():
+        write_json_file("data/" + name + ".json", data)
+
+# Most cloud accounts a query is sharded for, the account counts of larger tenants are cut
+SHARD_MAX_ACCOUNTS = 10000
+
+# Findings per cloud account of the report scope, used to split queries into shards of the same size
+def account_counts_payload(config):
+    payload = {
+            "aggregations": {
+                "accounts": {
+                    "fieldName": "CloudAccountId",
+                    "aggregationType": "Terms",
+                    "termsCount": SHARD_MAX_ACCOUNTS
+                }
+            },
+            "filters": {}
+        }
+    
+    payload = add_payload_filters(payload, config, True, set_levels_filter=True)
+    payload["filters"].pop("status", None)
+    return payload
+
+## Returns the cloud accounts of the report scope split into at most shard_count shards, None when the query cannot be sharded
+def vss_account_shards(config, shard_count):
+    url = vss_client.api_url("v2/findings/query")
+    response = vss_client.post(url, data=json.dumps(account_counts_payload(config)))
+    
+    try:
+        if(response.status_code !=200):
+            raise ErrorStatusCode(str(response.status_code))
+    except ErrorStatusCode:
+            logging.error("Cannot generate report " + str(response.content) + "\n")
+            sys.exit()
+    
+    data = response.json()
+    account_counts = {key: bucket["count"] for key, bucket in data["aggregations"]["accounts"]["buckets"].items()}
+    if(sum(account_counts.values()) != data.get("totalCount", 0)):
+        logging.warning("More than " + str(SHARD_MAX_ACCOUNTS) + " accounts, queries are not sharded\n")
+        return None
+    if(len(account_counts) < 2):
+        return None
+    shards = agg_merge.balance_shards(account_counts, shard_count)
+    logging.info("Splitting findings queries of " + str(len(account_counts)) + " accounts into " + str(len(shards)) + " shards\n")
+    return shards
+
+"""Sends payload once per shard of accounts in parallel and returns the merged response. in_flight is a semaphore
+shared by the sharded queries of a gather, so concurrent tasks together keep at most workers requests in flight"""
+def vss_sharded_post(payload, shards, in_flight):
+    url = vss_client.api_url("v2/findings/query")
+    
+    if(not agg_merge.shardable(payload)):
+        # Merged shards would not give the exact top N of a field that spans accounts
+        logging.info("Sending " + ", ".join(payload.get("aggregations") or {}) + " unsharded, its top N is not exact over shards\n")
+        shards = [None]
+    
+    def post(accounts):
+        shard = payload if accounts is None else agg_merge.shard_payload(payload, accounts)
+        with in_flight:
+            response = vss_client.post(url, data=json.dumps(shard))
+        try:
+            if(response.status_code !=200):
+                raise ErrorStatusCode(str(response.status_code))
+        except ErrorStatusCode:
+                logging.error("Cannot generate report " + str(response.content) + "\n")
+                sys.exit()
+        return response.json()
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        responses = list(executor.map(post, shards))
+    
+    if(len(responses) == 1):
+        return responses[0]
+    return agg_merge.merge_responses(responses, payload)
+
+def vss_sharded_query(name, payload, shards, in_flight):
+    write_json_file("data/" + name + ".json", vss_sharded_post(payload, shards, in_flight))
+
+def vss_sharded_query_group(group, shards, in_flight):
+    data = vss_sharded_post(group["payload"], shards, in_flight)
+    for name, section in query_planner.split_response(group, data).items():
+        write_json_file("data/" + name + ".json", section)
+
+# Ranks objects by the total risk score of their open findings and keeps the top_objects best,
+# from the local findings store when store_path is set and from the findings stream otherwise
+def rank_objects_by_risk(config, top_objects, store_path=None):
+    filters = objects_by_risk_payload(config)["filters"]
+    if(store_path):
+        connection = findings_store.connect(store_path)
+        try:
+            rows = topk.store_top_objects(connection, filters, top_objects)
+        finally:
+            connection.close()
+    else:
+        try:
+            rows = topk.stream_top_objects(filters, top_objects)
+        except vss_client.ErrorStatusCode as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
+            sys.exit()
+    write_json_file("data/objects_risk_top_10.json", topk.ranking_data(rows, top_objects))
+
+def objects_by_risk_task(config, top_objects, store_path=None):
+    return ("Ranking Top " + str(top_objects) + " Objects by Risk", rank_objects_by_risk, (config, top_objects, store_path))
+
+## Answers findings queries from the local findings store instead of the API
+def local_query_sections(store_path, sections):
+    connection = findings_store.connect(store_path)
+    try:
+        for name, payload in sections:
+            write_json_file("data/" + name + ".json", findings_store.query(connection, payload))
+    finally:
+        connection.close()
+
+def local_top_10_findings_by_severity(config, store_path):
+    local_query_sections(store_path, top_10_by_severity_sections(config))
+
+def vss_planned_top_10_findings_by_severity(config):
+    for group in query_planner.plan_queries(top_10_by_severity_sections(config)):
+        vss_query_group(group)
+
+CUBE_FILE = "data/count_cube.npz"
+
+# Cells of the count cube from the aggregation responses in data/. The top 10 by severity
+# responses give the open findings of the top 10 accounts, the rest of the open findings of a
+# provider and severity goes to its count_cube.OTHER account. Suppressed and resolved findings
+# are only split by account, resolved ones not even by provider.
+def report_cells(config):
+    
+    for level in count_cube.SEVERITIES:
+        if(not config.has_level(level)):
+            continue
+        top_10 = report_data.load(level + "_severity_top_10")["aggregations"]["cloud"]["buckets"]
+        totals = report_data.load(level + "_severity")["aggregations"]["cloud"]["buckets"]
+        for provider in list(totals) + [provider for provider in top_10 if provider not in totals]:
+            accounts = top_10.get(provider, {}).get("subAggregations", {}).get(level, {}).get("buckets", {})
+            counted = 0
+            for account, bucket in accounts.items():
+                counted += bucket.get("count", 0)
+                yield provider.lower(), account, level, "open", bucket.get("count", 0)
+            rest = totals.get(provider, {}).get("count", 0) - counted
+            if(rest > 0):
+                yield provider.lower(), count_cube.OTHER, level, "open", rest
+    
+    suppressed = report_data.load("suppressed_findings")["aggregations"]["cloud"]["buckets"]
+    for provider, provider_bucket in suppressed.items():
+        counted = 0
+        for account, bucket in provider_bucket.get("subAggregations", {}).get("suppressed", {}).get("buckets", {}).items():
+            counted += bucket.get("count", 0)
+            yield provider.lower(), account, count_cube.ANY_SEVERITY, "suppressed", bucket.get("count", 0)
+        rest = provider_bucket.get("count", 0) - counted
+        if(rest > 0):
+            yield provider.lower(), count_cube.OTHER, count_cube.ANY_SEVERITY, "suppressed", rest
+    
+    resolved = report_data.load("resolved_findings")
+    counted = 0
+    for account, bucket in resolved["aggregations"]["accounts"]["buckets"].items():
+        counted += bucket.get("count", 0)
+        yield count_cube.OTHER, account, count_cube.ANY_SEVERITY, "resolved", bucket.get("count", 0)
+    rest = resolved.get("totalCount", 0) - counted
+    if(rest > 0):
+        yield count_cube.OTHER, count_cube.OTHER, count_cube.ANY_SEVERITY, "resolved", rest
+
+## Count cube of the report, the one computed from the local findings store or else built from the responses in data/.
+## It is built once and shared by the sections of the report until the data changes
+def report_cube(config):
+    return report_data.derive("report_cube", lambda: build_report_cube(config))
+
+def build_report_cube(config):
+    if os.path.exists(CUBE_FILE):
+        return count_cube.load(CUBE_FILE)
+    return count_cube.from_cells(report_cells(config))
+
+# Counts every finding of the local findings store in the report scope, so the per-account
+# counts are exact for all accounts instead of the top 10
+def local_count_cube(config, store_path):
+    conditions, params = findings_store.where_clause(trend_snapshot_payload(config)["filters"])
+    connection = findings_store.connect(store_path)
+    try:
+        cube = count_cube.from_store(connection, conditions, params)
+    finally:
+        connection.close()
+    cube.save(CUBE_FILE)
+    report_data.invalidate_derived()
 
 def get_account_info():
 
-    with open("data/account_info.json", "r") as accounts_info:
-        accounts = json.load(accounts_info)
-    accounts_info.close()
+    accounts = report_data.load("account_info")
     
-    with open("data/all_rules_info.json", "r") as rules_info:
-        rules = json.load(rules_info)
-    rules_info.close()
+    rules = rule_catalog.require_catalog()
     
-    with open("data/frameworks.json", "r") as frameworks_info:
-        frameworks = json.load(frameworks_info)
-    frameworks_info.close()
+    frameworks = report_data.load("frameworks")
     
-    with open("data/suppressed_findings.json", "r") as suppressed_info:
-        suppressed_findings = json.load(suppressed_info)
-    suppressed_info.close()
+    suppressed_findings = report_data.load("suppressed_findings")
     
 
     dict_accounts = accounts["aggregations"]["accounts"]["buckets"]
@@ -561,7 +816,7 @@ def get_account_info():
     
     account_info = {
         "accounts": total_accounts,
-        "rules": rules["totalCount"],
+        "rules": rules["total_count"],
         "compliance_frameworks": frameworks["totalCount"],
         "total_violations": accounts["totalCount"],
         "suppressed_findings": suppressed_findings["totalCount"]
@@ -571,13 +826,9 @@ def get_account_info():
 
 def get_open_resolved_findings():
     
-    with open("data/account_info.json", "r") as findings:
-        open_findings = json.load(findings)
-    findings.close()
+    open_findings = report_data.load("account_info")
     
-    with open("data/resolved_findings.json", "r") as findings:
-        resolved_findings = json.load(findings)
-    findings.close()
+    resolved_findings = report_data.load("resolved_findings")
     
     data = {
         "open": open_findings["totalCount"],
@@ -586,292 +837,98 @@ def get_open_resolved_findings():
     return data
     
 
-def get_config():
-    
-    Config_file_name, report_file_name = parse_arguments()
-    
-    with open(Config_file_name) as config_file:
-        configuration = json.load(config_file)
-    config_file.close()
-    
-    return configuration
-
-
-def get_findings_by_provider():
-    
-    with open("data/account_info.json", "r") as account_info:
-        accounts = json.load(account_info)
-    account_info.close()
+def get_findings_by_provider(config):
     
-    provider = []
-    if("aws" in accounts["aggregations"]["find"]["buckets"]):
-        if("count" in accounts["aggregations"]["find"]["buckets"]["aws"]):
-            provider.append(accounts["aggregations"]["find"]["buckets"]["aws"]["count"])
-        else:
-            provider.append(0)
+    cube = report_cube(config)
     
-    if("azure" in accounts["aggregations"]["find"]["buckets"]):
-        if("count" in accounts["aggregations"]["find"]["buckets"]["azure"]):
-            provider.append(accounts["aggregations"]["find"]["buckets"]["azure"]["count"])
-        else:
-            provider.append(0)
+    providers = cube.report_providers()
         
     result = []
-    result.append(provider)
-    return result
+    result.append(cube.open_by_provider(providers, config.severity))
+    return result, [topk.provider_label(provider) for provider in providers]
 
 
-def get_top_10_accounts_by_findings():
+def get_top_10_accounts_by_findings(config):
     
-    with open("data/account_info.json", "r") as accounts_info:
-        accounts = json.load(accounts_info)
-    accounts_info.close()
+    cube = report_cube(config)
     
-    with open("data/resolved_findings.json", "r") as output_file:
-        findings = json.load(output_file)
-    output_file.close()
+    open_totals = cube.account_totals("open", config.severity)
+    resolved_totals = cube.account_totals("resolved")
 
-    account_ids = []
-    
-    open_findings = []
-    resolved_findings = []
-    resolved_accounts = findings["aggregations"]["accounts"]["buckets"]
-    open_accounts = accounts["aggregations"]["accounts"]["buckets"]
-    sorted_open_accounts = dict(sorted(open_accounts.items(), key=lambda k_v:k_v[1]['count'], reverse=True))
+    account_ids = cube.top_accounts(10, config.severity)
     
-    total_accounts = max(len(resolved_accounts.keys()), len(open_accounts))
-    for open_account in sorted_open_accounts:
-        if(open_account in resolved_accounts):
-            resolved_findings.append(resolved_accounts[open_account]["count"])
-            open_findings.append(sorted_open_accounts[open_account]["count"])
-        else:
-            resolved_findings.append(0)
-            open_findings.append(sorted_open_accounts[open_account]["count"])
-        ## @TODO - Change account ID logic with inventory service API    
-        account_ids.append(open_account)
+    open_findings = [int(open_totals[cube.account_index[account]]) for account in account_ids]
+    resolved_findings = [int(resolved_totals[cube.account_index[account]]) for account in account_ids]
+    ## @TODO - Change account ID logic with inventory service API    
     
     return [open_findings],[resolved_findings], account_ids
 
 
-def get_high_med_low_top_10_violations():
-    
-    with open("data/account_info.json", "r") as accounts_info:
-        accounts = json.load(accounts_info)
-    accounts_info.close()
-    
-    open_accounts = accounts["aggregations"]["accounts"]["buckets"]
-    sorted_open_accounts = dict(sorted(open_accounts.items(), key=lambda k_v:k_v[1]['count'], reverse=True))
-    
-    high_sev = {}
-    medium_sev = {}
-    low_sev = {}
-    aws_suppressed_findings = {}
-    azure_suppressed_findings = {}
-    aws_accounts_high_sev = {}
-    azure_accounts_high_sev = {}
-    aws_accounts_med_sev = {}
-    azure_accounts_med_sev = {}
-    aws_accounts_low_sev = {}
-    azure_accounts_low_sev = {}
-    
-    if("high" in (level.lower() for level in get_config()["config"]["severity"])):
-        with open("data/high_severity_top_10.json", "r") as severity_info:
-            high_sev = json.load(severity_info)
-        severity_info.close()
-        if("aws" in high_sev["aggregations"]["cloud"]["buckets"]):
-            aws_accounts_high_sev = high_sev["aggregations"]["cloud"]["buckets"]["aws"]["subAggregations"]["high"]["buckets"]
-        if("azure" in high_sev["aggregations"]["cloud"]["buckets"]):
-            azure_accounts_high_sev = high_sev["aggregations"]["cloud"]["buckets"]["azure"]["subAggregations"]["high"]["buckets"]
-    
-    
-    if("medium" in (level.lower() for level in get_config()["config"]["severity"])):
-        with open("data/medium_severity_top_10.json", "r") as severity_info:
-            medium_sev = json.load(severity_info)
-        severity_info.close()
-            
-        if("aws" in medium_sev["aggregations"]["cloud"]["buckets"]):
-            aws_accounts_med_sev = medium_sev["aggregations"]["cloud"]["buckets"]["aws"]["subAggregations"]["medium"]["buckets"]
-        if("azure" in medium_sev["aggregations"]["cloud"]["buckets"]):
-            azure_accounts_med_sev = medium_sev["aggregations"]["cloud"]["buckets"]["azure"]["subAggregations"]["medium"]["buckets"]
-    
-    if("low" in (level.lower() for level in get_config()["config"]["severity"])):
-    
-        with open("data/low_severity_top_10.json", "r") as severity_info:
-            low_sev = json.load(severity_info)
-        severity_info.close()
+def get_high_med_low_top_10_violations(config):
     
-        if("aws" in low_sev["aggregations"]["cloud"]["buckets"]):
-            aws_accounts_low_sev = low_sev["aggregations"]["cloud"]["buckets"]["aws"]["subAggregations"]["low"]["buckets"]
-        if("azure" in low_sev["aggregations"]["cloud"]["buckets"]):
-            azure_accounts_low_sev = low_sev["aggregations"]["cloud"]["buckets"]["azure"]["subAggregations"]["low"]["buckets"]
+    cube = report_cube(config)
     
-    with open("data/suppressed_findings.json", "r") as suppressed_info:
-        suppressed_findings = json.load(suppressed_info)
-    suppressed_info.close()
-    
-    if("aws" in suppressed_findings["aggregations"]["cloud"]["buckets"]):
-        aws_suppressed_findings = suppressed_findings["aggregations"]["cloud"]["buckets"]["aws"]["subAggregations"]["suppressed"]["buckets"]
-    if("azure" in suppressed_findings["aggregations"]["cloud"]["buckets"]):
-        azure_suppressed_findings = suppressed_findings["aggregations"]["cloud"]["buckets"]["azure"]["subAggregations"]["suppressed"]["buckets"]
-       
-
-    
-    with open("data/resolved_findings.json", "r") as output_file:
-        resolved_findings = json.load(output_file)
-    output_file.close()
-
     final_result = []
     
-    for account in sorted_open_accounts:
-        high = "N/A"
-        medium = "N/A"
-        low = "N/A"
-        suppressed = 0
-        resolved = 0
-            
-        if (account in aws_accounts_high_sev):
-            high = aws_accounts_high_sev[account]["count"]
-            provider = "AWS"
-        elif(account in aws_accounts_high_sev):
-            high = azure_accounts_high_sev[account]["count"]
-            provider = "Azure"
-        if (account in aws_accounts_med_sev):
-            medium = aws_accounts_med_sev[account]["count"]
-            provider = "AWS"
-        elif(account in azure_accounts_med_sev):
-            medium = azure_accounts_med_sev[account]["count"]
-            provider = "Azure"
-        if (account in aws_accounts_low_sev):           
-            low = aws_accounts_low_sev[account]["count"]         
-            provider = "AWS"
-        elif(account in azure_accounts_low_sev):
-            low = azure_accounts_low_sev[account]["count"]
-            provider = "Azure"
-        if (account in aws_suppressed_findings):
-            suppressed = aws_suppressed_findings[account]["count"]
-            provider = "AWS"
-        elif(account in azure_suppressed_findings):
-            suppressed = azure_suppressed_findings[account]["count"]
-            provider = "Azure"
-        if(account in resolved_findings["aggregations"]["accounts"]["buckets"]):
-            resolved = resolved_findings["aggregations"]["accounts"]["buckets"][account]["count"]            
-            
+    for account in cube.top_accounts(10, config.severity):
         data = []
-        data.append(provider)
+        data.append(topk.provider_label(cube.account_provider(account)))
         data.append(account)
-        data.append(high)
-        data.append(medium)
-        data.append(low)
-        data.append(suppressed)
-        data.append(resolved)
+        for level in count_cube.SEVERITIES:
+            if(config.has_level(level)):
+                data.append(cube.account_count(account, "open", level))
+            else:
+                data.append("N/A")
+        data.append(cube.account_count(account, "suppressed"))
+        data.append(cube.account_count(account, "resolved"))
         final_result.append(data)
 
     return final_result
     
-def get_all_violations_by_severity():
-    
-    
-    high = {}
-    medium = {}
-    low = {}
-    
-    aws_high = 0 
-    azure_high = 0
-    aws_med = 0 
-    azure_med = 0    
-    aws_low = 0 
-    azure_low = 0 
-    
-    if("high" in (level.lower() for level in get_config()["config"]["severity"])):
-        with open("data/high_severity.json", "r") as output_file:
-            high = json.load(output_file)
-        output_file.close()
-        if("aws" in high["aggregations"]["cloud"]["buckets"]):
-            if("count" in high["aggregations"]["cloud"]["buckets"]["aws"]):
-                aws_high = high["aggregations"]["cloud"]["buckets"]["aws"]["count"]
-            else:
-                aws_high = 0
-        if("azure" in high["aggregations"]["cloud"]["buckets"]):
-            if("count" in high["aggregations"]["cloud"]["buckets"]["azure"]):   
-                azure_high = high["aggregations"]["cloud"]["buckets"]["azure"]["count"]
-            else:
-                azure_high = 0
-    
-    if("medium" in (level.lower() for level in get_config()["config"]["severity"])):
-        with open("data/medium_severity.json", "r") as output_file:
-            medium = json.load(output_file)
-        output_file.close()
-        if("aws" in medium["aggregations"]["cloud"]["buckets"]):
-            if("count" in medium["aggregations"]["cloud"]["buckets"]["aws"]):
-                aws_med = medium["aggregations"]["cloud"]["buckets"]["aws"]["count"]
-            else:
-                aws_med = 0
-        if("azure" in medium["aggregations"]["cloud"]["buckets"]):
-            if("count" in medium["aggregations"]["cloud"]["buckets"]["azure"]):
-                azure_med = medium["aggregations"]["cloud"]["buckets"]["azure"]["count"]
-            else:
-                azure_med = 0 
-    
-    if("low" in (level.lower() for level in get_config()["config"]["severity"])):
-        with open("data/low_severity.json", "r") as output_file:
-            low = json.load(output_file)
-        output_file.close()
-        if("aws" in low["aggregations"]["cloud"]["buckets"]):
-            if("count" in low["aggregations"]["cloud"]["buckets"]["aws"]):
-                aws_low = low["aggregations"]["cloud"]["buckets"]["aws"]["count"]
-            else:
-                aws_low = 0
-        if("azure" in low["aggregations"]["cloud"]["buckets"]):
-            if("count" in low["aggregations"]["cloud"]["buckets"]["azure"]):
-                azure_low = low["aggregations"]["cloud"]["buckets"]["azure"]["count"]
-            else:
-                azure_low = 0
+## Returns {provider: [high, medium, low]} of open findings for every provider of the report
+def get_all_violations_by_severity(config):
     
-    aws = [aws_high, aws_med, aws_low]
-    azure = [azure_high, azure_med, azure_low]
-    
-    return aws, azure
+    return report_cube(config).open_by_severity()
  
 def get_top_10_rules():
     
-    with open("data/all_rules_info.json", "r") as output_file:
-        all_rules = json.load(output_file)
-    output_file.close()
+    all_rules = rule_catalog.require_catalog()["rules"]
     
-    with open("data/rules_info_top_10.json", "r") as output_file:
-        rules = json.load(output_file)
-    output_file.close()
+    rules = report_data.load("rules_info_top_10")
     
     result = []
     top_10_rules = rules["aggregations"]["rules"]["buckets"]
     sorted_top_10_rules = dict(sorted(top_10_rules.items(), key=lambda k_v:k_v[1]['count'], reverse=True))
     
     for rule in sorted_top_10_rules:
-        for item in all_rules["results"]:
-            data = []
-            if(item["id"]==rule):
-                name = item["displayName"]
-                provider = item["provider"]
-                if(provider == "aws"):
-                    provider = "AWS"
-                elif(provider == "azure"):
-                    provider = "Azure"
-                object_type = item["service"]
-                severity = item["level"]
-                count = top_10_rules[rule]["count"]
-                data.append(name)
-                data.append(provider)
-                data.append(object_type)
-                data.append(severity)
-                data.append(count)
-                result.append(data)
+        item = all_rules.get(rule)
+        if(item is None):
+            continue
+        data = []
+        name = item["displayName"]
+        provider = item["provider"]
+        if(provider == "aws"):
+            provider = "AWS"
+        elif(provider == "azure"):
+            provider = "Azure"
+        object_type = item["service"]
+        severity = item["level"]
+        count = top_10_rules[rule]["count"]
+        data.append(name)
+        data.append(provider)
+        data.append(object_type)
+        data.append(severity)
+        data.append(count)
+        result.append(data)
 
     return result
                             
 def get_top_10_objects_by_risk():
-    with open("data/objects_risk_top_10.json", "r") as object_risks_info:
-        objects_top_10 = json.load(object_risks_info)
-    object_risks_info.close()
+    objects_top_10 = report_data.load("objects_risk_top_10")
+    
+    # Written by rank_objects_by_risk, already ranked
+    if("objects" in objects_top_10):
+        return [list(row) for row in objects_top_10["objects"]]
     
     aws_object_ids = []
     azure_object_ids = []
@@ -926,13 +983,19 @@ def get_top_10_objects_by_risk():
         result.append(data)
         
     result = sorted(result, key=itemgetter(0,1), reverse=True)
-    result = result[0:9]
+    result = result[0:10]
     return result
 
+## Chart label of a trend bucket, the month name or the day and month of a day or week
+def trend_label(bucket, interval):
+    parse_date = parsers.datetime(bucket).date()
+    if(interval == "month"):
+        return calendar.month_abbr[parse_date.month]
+    return str(parse_date.day) + " " + calendar.month_abbr[parse_date.month]
+
 def get_open_findings_trends():
-    with open("data/trends.json", "r") as trends_file:
-        trends = json.load(trends_file)
-    trends_file.close()
+    trends = report_data.load("trends")
+    interval = trends.get("interval", "month")
     
     open_findings = trends["results"]["Open"]["buckets"]
     
@@ -940,8 +1003,7 @@ def get_open_findings_trends():
     trend_month = []
     data = []
     for findings in open_findings:
-        parse_date = parsers.datetime(findings).date().month 
-        trend_month.append(calendar.month_abbr[parse_date])
+        trend_month.append(trend_label(findings, interval))
         data.append(open_findings[findings]["count"])
     
     
@@ -950,9 +1012,8 @@ def get_open_findings_trends():
     return result, trend_month
 
 def get_new_resolved_trends():
-    with open("data/trends.json", "r") as trends_file:
-        trends = json.load(trends_file)
-    trends_file.close()
+    trends = report_data.load("trends")
+    interval = trends.get("interval", "month")
     
     new_findings = trends["results"]["New"]["buckets"]
     resolved_findings = trends["results"]["Resolved"]["buckets"]
@@ -961,8 +1022,7 @@ def get_new_resolved_trends():
     trend_month = []
     data = []
     for findings in new_findings:
-        parse_date = parsers.datetime(findings).date().month
-        trend_month.append(calendar.month_abbr[parse_date])
+        trend_month.append(trend_label(findings, interval))
         if("count" in new_findings[findings]):
             data.append(new_findings[findings]["count"])
         else:
@@ -981,28 +1041,252 @@ def get_new_resolved_trends():
     return result, trend_month
 
 
-# Sequentially makes API calls to Secure state to gather information and store it in a directory
-def gather_data():
+# Modes supported by gather_data. "sequential" makes one API call at a time, "thread" and "asyncio"
+# run independent calls concurrently with at most `workers` requests in flight
+GATHER_MODES = ["sequential", "thread", "asyncio"]
+DEFAULT_GATHER_WORKERS = 8
+
+# Trends come from the local trend history when history_dir is set, from the trends API otherwise
+def trends_task(config, store_path=None, history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL):
+    if(history_dir):
+        return ("Updating Trends history", update_trends, (config, history_dir, trend_interval, store_path))
+    return ("Gathering Trends info", vss_trends, (config,))
+
+# Returns the account info call, the calls that are independent of each other and the calls
+# that read data/account_info.json and therefore have to wait for the account info call
+def gather_tasks(config, merge_queries=False, store_path=None, history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL,
+                 account_shards=None, workers=DEFAULT_GATHER_WORKERS, top_objects=0):
+    if(store_path):
+        return local_gather_tasks(config, store_path, history_dir, trend_interval, top_objects)
+    if(account_shards):
+        return sharded_gather_tasks(config, account_shards, workers, merge_queries, history_dir, trend_interval, top_objects)
+    if(merge_queries):
+        return planned_gather_tasks(config, history_dir, trend_interval, top_objects)
+    
+    account_info_task = ("Gathering Account Info", vss_account_info, (config,))
+    
+    objects_task = ("Gathering Top 10 Objects by Risk", vss_top_10_objects_by_risk, (config,))
+    if(top_objects):
+        objects_task = objects_by_risk_task(config, top_objects)
+    
+    independent_tasks = [
+        ("Gathering All Rules Info", vss_all_rules, ()),
+        ("Gathering Frameworks Info", vss_frameworks, ()),
+        ("Gathering Open and Resolved Findings", vss_open_resolved_findings, (config,)),
+        ("Gathering Suppressed Findings", vss_suppressed_findings, (config,)),
+        ("Gathering High Findings by severity", vss_violations_by_severity, (config, "High")),
+        ("Gathering Medium Findings by severity", vss_violations_by_severity, (config, "Medium")),
+        ("Gathering Low Findings by severity", vss_violations_by_severity, (config, "Low")),
+        ("Gathering Top 10 Rules", vss_top_10_rules, (config,)),
+        objects_task,
+        trends_task(config, None, history_dir, trend_interval)
+    ]
+    
+    dependent_tasks = [
+        ("Gathering Top 10 High Findings by severity", vss_top_10_findings_by_severity, (config, "high")),
+        ("Gathering Top 10 Medium Findings by severity", vss_top_10_findings_by_severity, (config, "medium")),
+        ("Gathering Top 10 Low Findings by severity", vss_top_10_findings_by_severity, (config, "low"))
+    ]
+    
+    return account_info_task, independent_tasks, dependent_tasks
+
+# Same as gather_tasks, with the findings queries merged by the query planner
+def planned_gather_tasks(config, history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL, top_objects=0):
+    account_info_task = None
+    independent_tasks = [
+        ("Gathering All Rules Info", vss_all_rules, ()),
+        ("Gathering Frameworks Info", vss_frameworks, ()),
+        trends_task(config, None, history_dir, trend_interval)
+    ]
+    
+    if(top_objects):
+        independent_tasks.append(objects_by_risk_task(config, top_objects))
+    
+    for group in query_planner.plan_queries(findings_query_sections(config, top_objects)):
+        names = [name for name, path in group["members"]]
+        task = ("Gathering " + ", ".join(names), vss_query_group, (group,))
+        if("account_info" in names):
+            account_info_task = task
+        else:
+            independent_tasks.append(task)
+    
+    dependent_tasks = [
+        ("Gathering Top 10 Findings by severity", vss_planned_top_10_findings_by_severity, (config,))
+    ]
+    
+    return account_info_task, independent_tasks, dependent_tasks
+
+# Same as gather_tasks, with every findings query of the report split by cloud account into
+# account_shards that run in parallel. The top 10 by severity queries only cover 10 accounts
+# and are not sharded, neither are the queries for the top N of a field that spans accounts
+# (ex: the top 10 rules) since merged shards would not give their exact top N.
+def sharded_gather_tasks(config, account_shards, workers, merge_queries=False, history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL,
+                         top_objects=0):
+    account_info_task = None
+    independent_tasks = [
+        ("Gathering All Rules Info", vss_all_rules, ()),
+        ("Gathering Frameworks Info", vss_frameworks, ()),
+        trends_task(config, None, history_dir, trend_interval)
+    ]
+    in_flight = threading.BoundedSemaphore(workers)
+    
+    sections = findings_query_sections(config, top_objects)
+    # Queries with a top N of a field that spans accounts are sent unsharded, see agg_merge
+    tasks = [([name], ("Gathering " + name, vss_sharded_query, (name, payload, account_shards, in_flight)))
+             for name, payload in sections if not agg_merge.shardable(payload)]
+    sections = [(name, payload) for name, payload in sections if agg_merge.shardable(payload)]
+    if(merge_queries):
+        for group in query_planner.plan_queries(sections):
+            names = [name for name, path in group["members"]]
+            tasks.append((names, ("Gathering " + ", ".join(names) + " in " + str(len(account_shards)) + " shards",
+                                  vss_sharded_query_group, (group, account_shards, in_flight))))
+    else:
+        tasks += [([name], ("Gathering " + name + " in " + str(len(account_shards)) + " shards", vss_sharded_query, (name, payload, account_shards, in_flight)))
+                  for name, payload in sections]
+    if(top_objects):
+        tasks.append(([], objects_by_risk_task(config, top_objects)))
+    
+    for names, task in tasks:
+        if("account_info" in names):
+            account_info_task = task
+        else:
+            independent_tasks.append(task)
+    
+    if(merge_queries):
+        dependent_tasks = [("Gathering Top 10 Findings by severity", vss_planned_top_10_findings_by_severity, (config,))]
+    else:
+        dependent_tasks = [
+            ("Gathering Top 10 High Findings by severity", vss_top_10_findings_by_severity, (config, "high")),
+            ("Gathering Top 10 Medium Findings by severity", vss_top_10_findings_by_severity, (config, "medium")),
+            ("Gathering Top 10 Low Findings by severity", vss_top_10_findings_by_severity, (config, "low"))
+        ]
+    
+    return account_info_task, independent_tasks, dependent_tasks
+
+# Same as gather_tasks, with the findings queries computed from the local findings store.
+# Rules, frameworks and trends still come from the API, the trend history snapshot from the store.
+def local_gather_tasks(config, store_path, history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL, top_objects=0):
+    account_info_task = ("Computing Findings Info from local findings store", local_query_sections, (store_path, findings_query_sections(config, top_objects)))
+    
+    independent_tasks = [
+        ("Gathering All Rules Info", vss_all_rules, ()),
+        ("Gathering Frameworks Info", vss_frameworks, ()),
+        trends_task(config, store_path, history_dir, trend_interval),
+        ("Computing Count cube from local findings store", local_count_cube, (config, store_path))
+    ]
+    if(top_objects):
+        independent_tasks.append(objects_by_risk_task(config, top_objects, store_path))
+    
+    dependent_tasks = [
+        ("Computing Top 10 Findings by severity from local findings store", local_top_10_findings_by_severity, (config, store_path))
+    ]
+    
+    return account_info_task, independent_tasks, dependent_tasks
+
+def run_gather_task(message, func, args):
+    logging.info(message + "\n")
+    name = " ".join([func.__name__] + [arg for arg in args if isinstance(arg, str)])
+    with metrics.timed("gather", name):
+        func(*args)
+
+def gather_data_sequential(config, merge_queries, store_path, history_dir, trend_interval, account_shards, workers, top_objects):
+    account_info_task, independent_tasks, dependent_tasks = gather_tasks(config, merge_queries, store_path, history_dir, trend_interval, account_shards, workers, top_objects)
+    
+    run_gather_task(*account_info_task)
+    for task in dependent_tasks + independent_tasks:
+        run_gather_task(*task)
+
+def gather_data_threaded(config, workers, merge_queries, store_path, history_dir, trend_interval, account_shards, top_objects):
+    account_info_task, independent_tasks, dependent_tasks = gather_tasks(config, merge_queries, store_path, history_dir, trend_interval, account_shards, workers, top_objects)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        account_info = executor.submit(run_gather_task, *account_info_task)
+        futures = [executor.submit(run_gather_task, *task) for task in independent_tasks]
+        
+        account_info.result()
+        futures += [executor.submit(run_gather_task, *task) for task in dependent_tasks]
+        
+        # result() re-raises the SystemExit of a failed API call in the main thread
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+async def gather_data_async(config, workers, merge_queries, store_path, history_dir, trend_interval, account_shards, top_objects):
+    account_info_task, independent_tasks, dependent_tasks = gather_tasks(config, merge_queries, store_path, history_dir, trend_interval, account_shards, workers, top_objects)
+    semaphore = asyncio.Semaphore(workers)
+    
+    async def run(task):
+        async with semaphore:
+            await asyncio.to_thread(run_gather_task, *task)
+    
+    account_info = asyncio.ensure_future(run(account_info_task))
+    futures = [asyncio.ensure_future(run(task)) for task in independent_tasks]
+    
+    await account_info
+    futures += [asyncio.ensure_future(run(task)) for task in dependent_tasks]
+    
+    await asyncio.gather(*futures)
+
+# Makes API calls to Secure state to gather information and store it in a directory
+# config is the report_config.ReportConfig the payload filters are built from.
+# merge_queries sends the findings queries that share filters as one request. store_path computes the
+# findings queries from a local findings store, except for configs filtering on cloud tags that the store
+# does not keep, those are gathered from the API. sync_store downloads the findings into it first, all of them
+# or with sync_store="incremental" only those of the accounts collected since the last sync.
+# history_dir keeps a local trend history there and computes the trends by trend_interval from it.
+# shards > 1 splits every findings query by cloud account into that many queries sent in parallel.
+# top_objects ranks that many objects by the risk score of all their open findings, 0 takes the
+# 10 objects with the most findings from the aggregation query instead. When it is None, objects
+# are ranked when there is a local findings store and the aggregation query is used otherwise,
+# since ranking from the API downloads every open finding.
+def gather_data(config, mode="sequential", workers=DEFAULT_GATHER_WORKERS, merge_queries=False, store_path=None, sync_store=False,
+                history_dir=None, trend_interval=trend_store.DEFAULT_INTERVAL, shards=1, top_objects=None):
+    
+    if(store_path and config.cloud_tags):
+        logging.warning("Cloud tag filters cannot be computed from the local findings store, gathering from the API instead\n")
+        store_path = None
+    if(top_objects is None):
+        top_objects = topk.TOP_OBJECTS if store_path else 0
+    
+    if(mode not in GATHER_MODES):
+        raise ValueError("Unknown gather mode " + str(mode))
+    if(workers < 1):
+        raise ValueError("Number of workers must be at least 1")
+    if(trend_interval not in trend_store.INTERVALS):
+        raise ValueError("Unknown trend interval " + str(trend_interval))
+    if(shards < 1):
+        raise ValueError("Number of shards must be at least 1")
+    if(top_objects < 0):
+        raise ValueError("Number of top objects cannot be negative")
     
     logging.info("Checking to see if data directory exists\n")
     create_dir()
-    logging.info("Gathering Account Info\n")
-    vss_account_info()
-    logging.info("Gathering All Rules Info\n")
-    vss_all_rules()
-    logging.info("Gathering Frameworks Info\n")
-    vss_frameworks()
-    logging.info("Gathering Open and Resolved Findings\n")
-    vss_open_resolved_findings()
-    logging.info("Gathering Top 10 Findings by severity\n")
-    vss_high_med_low_top_10_findings()
-    logging.info("Gathering Suppressed Findings\n")
-    vss_suppressed_findings()
-    logging.info("Gathering All Findings by severity\n")
-    vss_all_violations_by_severity()
-    logging.info("Gathering Top 10 Rules\n")
-    vss_top_10_rules()
-    logging.info("Gathering Top 10 Objects by Risk\n")
-    vss_top_10_objects_by_risk()
-    logging.info("Gathering Trends info\n")
-    vss_trends()
\ No newline at end of file
+    
+    # Artifacts parsed before this gather are stale
+    report_data.invalidate()
+    if os.path.exists(CUBE_FILE):
+        os.remove(CUBE_FILE)
+    
+    if(store_path and sync_store):
+        logging.info("Syncing findings to local findings store\n")
+        try:
+            if(sync_store == "incremental"):
+                with metrics.timed("gather", "findings_store.sync_incremental"):
+                    findings_store.sync_incremental(store_path)
+            else:
+                with metrics.timed("gather", "findings_store.sync"):
+                    findings_store.sync(store_path)
+        except vss_client.ErrorStatusCode as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
+            sys.exit()
+    
+    account_shards = None
+    if(shards > 1 and not store_path):
+        with metrics.timed("gather", "vss_account_shards"):
+            account_shards = vss_account_shards(config, shards)
+    
+    if(mode == "thread"):
+        gather_data_threaded(config, workers, merge_queries, store_path, history_dir, trend_interval, account_shards, top_objects)
+    elif(mode == "asyncio"):
+        asyncio.run(gather_data_async(config, workers, merge_queries, store_path, history_dir, trend_interval, account_shards, top_objects))
+    else:
+        gather_data_sequential(config, merge_queries, store_path, history_dir, trend_interval, account_shards, workers, top_objects)
@@ -1,18 +1,19 @@
 import logging
-import requests
+import vss_client
+import token_cache
 import os
 import json
 import sys
+import argparse
+import atomic_file
 
 
 from operator import itemgetter
 from iso8601utils import parsers
 from requests.models import Response
+from collection_status import account_id, iter_accnt_status
 
 
-# Access Token from CSP
-access_token = ''
-
 if "REFRESH_TOKEN" in os.environ:
     refresh_token = os.environ['REFRESH_TOKEN']
 else:
@@ -27,41 +28,22 @@ class ErrorStatusCode(Exception):
 ## Get Access Token from CSP
 def auth():
 
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    url = 'https://console.cloud.vmware.com/csp/gateway/am/api/auth/api-tokens/authorize'
-    payload = {"refresh_token": refresh_token }
-
-    response = requests.post(url, data=payload , headers=headers)
-
     try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
+        token_cache.login(refresh_token)
+    except token_cache.AuthError as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
             sys.exit()
 
-    data = json.loads(response.content)
-
-    global access_token
-    access_token = data["access_token"]
-
 
 #download account inventory status
 
-def vss_accnt_status():
-    url = 'https://api.securestate.vmware.com/v1/cloud-accounts/collection-status/query'
+def vss_accnt_status(file_path="account.json"):
+    url = vss_client.api_url("v1/cloud-accounts/collection-status/query")
     payload = {
        "paginationInfo": {"pageSize": 1000},
    }
-    headers = {
-        'Content-Type': 'application/json',
-         'Authorization': 'Bearer {}'.format(access_token)
-
-    }
     while True:
-      response = requests.post(url, json=payload , headers=headers)
+      response = vss_client.post(url, json=payload )
       try:
          if(response.status_code !=200):
             raise ErrorStatusCode(str(response.status_code))
@@ -71,7 +53,7 @@ def vss_accnt_status():
             if response.status_code != 200:
                 raise Exception(f"something went wrong: {response.text}")
       r = response.json()
-      create_or_update_file("account.json", response) 
+      create_or_update_file(file_path, response) 
       
       print(r)
       
@@ -97,10 +79,84 @@ def create_or_update_file(file_path, content):
       
 
 
-if __name__ == '__main__':
-    auth()
-    vss_accnt_status()
+def index_path(file_path):
+    return file_path + ".idx"
+
+"""Writes one compact JSON record per line and its index (account id -> byte offset of the record). Both are written
+to temp files (atomic_file) and renamed into place once complete, the index right before the file, so readers never see a
+partial export. The index records the size and mtime of the file it was built for, readers ignore an index that does not
+match the file"""
+def write_ndjson(file_path, records):
+    offsets = {}
+    offset = 0
+    with atomic_file.replacing(file_path) as temp_path:
+        with open(temp_path, "wb", buffering=1024 * 1024) as output_file:
+            for record in records:
+                line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+                key = account_id(record)
+                if key is not None:
+                    offsets[key] = offset
+                output_file.write(line)
+                offset += len(line)
+        # The rename keeps the size and mtime of the temp file
+        stat = os.stat(temp_path)
+
+        with atomic_file.open_atomic(index_path(file_path)) as index_file:
+            json.dump({"file": os.path.basename(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "offsets": offsets},
+                      index_file, separators=(",", ":"))
+    
+    return len(offsets)
 
+## Offsets of the index of an export, None when there is no index or it was not built for the opened file
+def load_offsets(file_path, export_file):
+    try:
+        with open(index_path(file_path), "r") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+    stat = os.fstat(export_file.fileno())
+    if(index.get("size") != stat.st_size or index.get("mtime_ns") != stat.st_mtime_ns):
+        return None
+    return index["offsets"]
+
+"""Reads the record of one account from an export without parsing the rest of the file, or by scanning the file
+when its index is missing or stale (ex: read between the renames of write_ndjson)"""
+def read_accnt_status(file_path, account):
+    with open(file_path, "rb") as export_file:
+        offsets = load_offsets(file_path, export_file)
+        if offsets is None:
+            logging.warning("No index matches " + file_path + ", scanning it\n")
+            for line in export_file:
+                record = json.loads(line)
+                if account_id(record) == account:
+                    return record
+            return None
+        if account not in offsets:
+            return None
+        export_file.seek(offsets[account])
+        return json.loads(export_file.readline())
+
+def export_accnt_status(file_path):
+    try:
+        count = write_ndjson(file_path, iter_accnt_status())
+    except vss_client.ErrorStatusCode as error:
+        logging.error("Cannot generate report " + str(error) + "\n")
+        sys.exit()
+    logging.info("Exported collection status of " + str(count) + " accounts to " + file_path + "\n")
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(usage="Exports the collection status of every cloud account")
+    parser.add_argument('--output-file', help="export file name, default account.ndjson for ndjson and account.json for json")
+    parser.add_argument('--format', choices=["ndjson", "json"], default="ndjson",
+                        help="ndjson writes one record per account with a .idx offset index, json appends the raw pages")
+    return parser.parse_args()
 
 
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    args = parse_arguments()
+    auth()
+    if(args.format == "ndjson"):
+        export_accnt_status(args.output_file or "account.ndjson")
+    else:
+        vss_accnt_status(args.output_file or "account.json")
@@ -1,5 +1,7 @@
 import logging
-import requests
+import vss_client
+import token_cache
+import rule_catalog
 import os
 import json
 import sys
@@ -9,9 +11,6 @@ from operator import itemgetter
 from iso8601utils import parsers
 
 
-# Access Token from CSP
-access_token = ''
-
 if "REFRESH_TOKEN" in os.environ:
     refresh_token = os.environ['REFRESH_TOKEN']
 else:
@@ -25,47 +24,23 @@ class ErrorStatusCode(Exception):
 ## Get Access Token from CSP
 def auth():
 
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    url = 'https://console.cloud.vmware.com/csp/gateway/am/api/auth/api-tokens/authorize'
-    payload = {"refresh_token": refresh_token }
-
-    response = requests.post(url, data=payload , headers=headers)
-
     try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
+        token_cache.login(refresh_token)
+    except token_cache.AuthError as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
             sys.exit()
 
-    data = json.loads(response.content)
-
-    global access_token
-    access_token = data["access_token"]
-
 
 
 def vss_rules():
-    url = "https://api.securestate.vmware.com/v1/rules"
-    payload = {}    
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    
-    response = requests.get(url, headers=headers)
-    
     try:
-        if(response.status_code !=200):
-            raise ErrorStatusCode(str(response.status_code))
-    except ErrorStatusCode:
-            logging.error("Cannot generate report " + str(response.content) + "\n")
+        catalog = rule_catalog.get_catalog()
+    except vss_client.ErrorStatusCode as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
             sys.exit()
     
 
-    print(response.json())
+    print(json.dumps(catalog["rules"], indent=4))
 
 
 if __name__ == '__main__':
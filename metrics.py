@@ -0,0 +1,142 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+import urllib.parse
+
+import atomic_file
+
+# In-process metrics of a report run: wall and CPU time per phase (gather tasks, report
+# sections, stages), latency, bytes and status per API endpoint, parse time per data file
+# and the time spent in build_report. Recording is always on and cheap. At the end of a
+# run the totals can be written as a JSON summary and as a Prometheus text file for the
+# node exporter textfile collector.
+#
+# CPU time is the time of the thread that ran the phase, so it stays meaningful for gather
+# tasks running on a thread pool. Nested phases are inclusive: a section that calls another
+# section counts the time of both.
+
+PREFIX = "vss_report"
+
+lock = threading.Lock()
+phases = {}
+http = {}
+parses = {}
+started_at = time.time()
+started = time.perf_counter()
+
+
+def reset():
+    global started_at, started
+    with lock:
+        phases.clear()
+        http.clear()
+        parses.clear()
+        started_at = time.time()
+        started = time.perf_counter()
+
+def record_phase(phase, name, wall, cpu):
+    with lock:
+        entry = phases.setdefault((phase, name), {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_wall_seconds": 0.0})
+        entry["calls"] += 1
+        entry["wall_seconds"] += wall
+        entry["cpu_seconds"] += cpu
+        entry["max_wall_seconds"] = max(entry["max_wall_seconds"], wall)
+
+@contextlib.contextmanager
+def timed(phase, name):
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        record_phase(phase, name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+## Wraps func so every call is recorded as a phase
+def timed_function(phase, func, name=None):
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed(phase, name):
+            return func(*args, **kwargs)
+    return wrapper
+
+## Decorator form of timed_function, ex: @metrics.timed_calls("section")
+def timed_calls(phase, name=None):
+    return lambda func: timed_function(phase, func, name)
+
+## Endpoint label of a URL, its path without the leading slash
+def endpoint(url):
+    return urllib.parse.urlparse(url).path.lstrip("/")
+
+def record_http(method, url, status, seconds, size, source="network"):
+    key = (endpoint(url), method.upper(), str(status), source)
+    with lock:
+        entry = http.setdefault(key, {"requests": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0})
+        entry["requests"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["bytes"] += size
+
+def record_parse(path, seconds, size):
+    with lock:
+        entry = parses.setdefault(path, {"parses": 0, "seconds": 0.0, "bytes": 0})
+        entry["parses"] += 1
+        entry["seconds"] += seconds
+        entry["bytes"] += size
+
+def summary():
+    with lock:
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started_at)),
+            "run_seconds": time.perf_counter() - started,
+            "phases": [dict(phase=phase, name=name, **entry) for (phase, name), entry in sorted(phases.items())],
+            "http": [dict(endpoint=path, method=method, status=status, source=source, **entry)
+                     for (path, method, status, source), entry in sorted(http.items())],
+            "parses": [dict(file=path, **entry) for path, entry in sorted(parses.items())]
+        }
+
+def write_json(path):
+    atomic_file.write(path, json.dumps(summary(), indent=4))
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def labels(**values):
+    return "{" + ",".join(key + '="' + label_value(value) + '"' for key, value in values.items()) + "}"
+
+"""Returns the metrics in the Prometheus text exposition format"""
+def prometheus_text():
+    data = summary()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP " + PREFIX + "_" + name + " " + help_text)
+        lines.append("# TYPE " + PREFIX + "_" + name + " " + kind)
+        for sample_labels, value in samples:
+            lines.append(PREFIX + "_" + name + sample_labels + " " + repr(float(value)))
+
+    phase_labels = [(labels(phase=entry["phase"], name=entry["name"]), entry) for entry in data["phases"]]
+    metric("phase_calls_total", "counter", "Number of times a phase ran", [(key, entry["calls"]) for key, entry in phase_labels])
+    metric("phase_wall_seconds_total", "counter", "Wall time spent in a phase", [(key, entry["wall_seconds"]) for key, entry in phase_labels])
+    metric("phase_cpu_seconds_total", "counter", "CPU time of the thread running a phase", [(key, entry["cpu_seconds"]) for key, entry in phase_labels])
+    metric("phase_max_wall_seconds", "gauge", "Longest single run of a phase", [(key, entry["max_wall_seconds"]) for key, entry in phase_labels])
+
+    http_labels = [(labels(endpoint=entry["endpoint"], method=entry["method"], status=entry["status"], source=entry["source"]), entry) for entry in data["http"]]
+    metric("http_requests_total", "counter", "API requests by endpoint, status and source (network or cache)", [(key, entry["requests"]) for key, entry in http_labels])
+    metric("http_request_seconds_total", "counter", "Time spent waiting for API responses", [(key, entry["seconds"]) for key, entry in http_labels])
+    metric("http_request_max_seconds", "gauge", "Slowest API response", [(key, entry["max_seconds"]) for key, entry in http_labels])
+    metric("http_response_bytes_total", "counter", "Bytes of API response bodies", [(key, entry["bytes"]) for key, entry in http_labels])
+
+    parse_labels = [(labels(file=entry["file"]), entry) for entry in data["parses"]]
+    metric("parse_seconds_total", "counter", "Time spent parsing data files", [(key, entry["seconds"]) for key, entry in parse_labels])
+    metric("parse_bytes_total", "counter", "Bytes of parsed data files", [(key, entry["bytes"]) for key, entry in parse_labels])
+
+    metric("run_seconds", "gauge", "Wall time of the last report run", [("", data["run_seconds"])])
+    metric("last_run_timestamp_seconds", "gauge", "Unix time the last report run started", [("", started_at)])
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    atomic_file.write(path, prometheus_text())
@@ -0,0 +1,236 @@
+import argparse
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import findings_store
+import synthetic_tenant
+
+# Local stand-in for the SecureState and CSP APIs, used for benchmarks and tests without a
+# live tenant. It serves a seeded synthetic tenant: findings are kept in an in-memory
+# findings store, so v2/findings/query answers filters, Terms aggregations, termsCount and
+# subAggregations the same way the local store does, and every list endpoint pages with
+# continuationToken. Point the scripts at it with VSS_API_URL and CSP_URL:
+#
+#   python mock_api.py --port 8080 --findings 100000 &
+#   VSS_API_URL=http://127.0.0.1:8080 CSP_URL=http://127.0.0.1:8080 REFRESH_TOKEN=mock \
+#       python generate.py --config config.json --output-file report.pdf
+
+ACCESS_TOKEN = "mock-access-token"
+TOKEN_EXPIRES_IN = 1799
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+class Tenant(object):
+    """Seeded synthetic tenant. Accounts and rules are skewed so a few of them carry most findings"""
+
+    def __init__(self, findings=10000, accounts=50, rules=500, frameworks=12, seed=1, padding=0):
+        self.random = random.Random(seed)
+        self.padding = "x" * padding
+        self.accounts = synthetic_tenant.make_accounts(self.random, accounts)
+        self.rules = synthetic_tenant.make_rules(self.random, rules)
+        self.frameworks = [{"id": "framework-" + str(index), "displayName": "Framework " + str(index)} for index in range(frameworks)]
+
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.lock = threading.Lock()
+        findings_store.create_schema(self.connection)
+        if findings:
+            generator = synthetic_tenant.FindingGenerator(self.random, self.accounts, self.rules)
+            with self.connection:
+                findings_store.insert_findings(self.connection, generator.iter_findings(findings))
+        self.trends = synthetic_tenant.make_trends(self.random, findings)
+
+    def query(self, payload):
+        payload = dict(payload, filters=untagged(payload.get("filters")))
+        with self.lock:
+            return findings_store.query(self.connection, payload)
+
+    def findings_page(self, filters, offset, size):
+        conditions, params = findings_store.where_clause(untagged(filters))
+        sql = "SELECT " + ", ".join(findings_store.COLUMNS) + " FROM findings"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY rowid LIMIT ? OFFSET ?"
+        with self.lock:
+            rows = self.connection.execute(sql, params + [size, offset]).fetchall()
+        results = []
+        for row in rows:
+            finding = dict(zip(findings_store.COLUMNS, row))
+            result = {
+                "id": finding["id"],
+                "objectId": finding["object_id"],
+                "objectXid": finding["object_xid"],
+                "ruleId": finding["rule_id"],
+                "cloudAccountId": finding["account_id"],
+                "cloudProvider": finding["provider"],
+                "level": finding["level"].capitalize(),
+                "status": finding["status"],
+                "riskScore": finding["risk_score"],
+                "isSuppressed": bool(finding["is_suppressed"])
+            }
+            if self.padding:
+                result["description"] = self.padding
+            results.append(result)
+        return results
+
+
+## Returns (offset, page size) of a request body that may carry paginationInfo
+## Synthetic findings have no cloud tags, tag filters match every finding
+def untagged(filters):
+    return {key: value for key, value in (filters or {}).items() if key != "cloudTags"}
+
+def page_request(body):
+    pagination = body.get("paginationInfo") or {}
+    size = min(int(pagination.get("pageSize") or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    offset = int(pagination.get("continuationToken") or 0)
+    return offset, size
+
+def page_response(results, total_count, offset, size):
+    next_offset = offset + len(results)
+    token = str(next_offset) if results and next_offset < total_count else None
+    return {
+        "totalCount": total_count,
+        "results": results,
+        "paginationInfo": {"continuationToken": token, "pageSize": size}
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set by serve()
+    tenant = None
+    latency = 0.0
+    error_rate = 0.0
+    error_status = 503
+    random = random.Random(0)
+    requests = 0
+    requests_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        logging.debug("mock_api " + format % args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        handler = type(self)
+        with handler.requests_lock:
+            handler.requests += 1
+        raw_body = self.read_body()
+        path = urllib.parse.urlparse(self.path).path.rstrip("/")
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self.send_json(self.error_status, {"message": "injected error"})
+
+        if path.endswith("/api-tokens/authorize"):
+            form = urllib.parse.parse_qs(raw_body.decode("utf-8"))
+            if not form.get("refresh_token"):
+                return self.send_json(400, {"message": "refresh_token is required"})
+            return self.send_json(200, {"access_token": ACCESS_TOKEN, "expires_in": TOKEN_EXPIRES_IN, "token_type": "bearer"})
+
+        if self.headers.get("Authorization") != "Bearer " + ACCESS_TOKEN:
+            return self.send_json(401, {"message": "invalid access token"})
+
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            return self.send_json(400, {"message": "request body is not JSON"})
+
+        tenant = self.tenant
+        if path.endswith("/v2/findings/query"):
+            data = tenant.query(body)
+            if "paginationInfo" in body:
+                offset, size = page_request(body)
+                data.update(page_response(tenant.findings_page(body.get("filters"), offset, size), data["totalCount"], offset, size))
+            return self.send_json(200, data)
+        if path.endswith("/v2/findings/trends-query"):
+            return self.send_json(200, {"results": tenant.trends})
+        if path.endswith("/v1/rules/query") or path.endswith("/v1/rules"):
+            offset, size = page_request(body)
+            return self.send_json(200, page_response(tenant.rules[offset:offset + size], len(tenant.rules), offset, size))
+        if path.endswith("/v1/compliance-frameworks"):
+            return self.send_json(200, {"totalCount": len(tenant.frameworks), "results": tenant.frameworks})
+        if path.endswith("/v1/cloud-accounts/collection-status/query"):
+            offset, size = page_request(body)
+            return self.send_json(200, page_response(tenant.accounts[offset:offset + size], len(tenant.accounts), offset, size))
+
+        return self.send_json(404, {"message": "unknown endpoint " + path})
+
+
+"""Starts the mock API on a background thread and returns the server. server.server_port is the port it listens on"""
+def serve(tenant, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, error_status=503, seed=0):
+    handler = type("TenantHandler", (MockHandler,), {
+        "tenant": tenant,
+        "latency": latency,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "random": random.Random(seed),
+        "requests": 0,
+        "requests_lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return "http://" + host + ":" + str(port)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Local mock of the SecureState and CSP APIs")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--findings', type=int, default=10000, help="number of findings in the tenant")
+    parser.add_argument('--accounts', type=int, default=50, help="number of cloud accounts")
+    parser.add_argument('--rules', type=int, default=500, help="number of rules")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the synthetic tenant")
+    parser.add_argument('--padding', type=int, default=0, help="extra bytes added to every finding of a findings page")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, default=503)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    args = parse_arguments()
+
+    started = time.time()
+    tenant = Tenant(args.findings, args.accounts, args.rules, seed=args.seed, padding=args.padding)
+    logging.info("Generated " + str(args.findings) + " findings in " + str(round(time.time() - started, 1)) + "s\n")
+
+    server = serve(tenant, args.host, args.port, args.latency, args.error_rate, args.error_status, args.seed)
+    logging.info("Mock API listening on " + base_url(server) + "\n")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,154 @@
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tracemalloc
+
+# Profiling of the report stages, enabled with --profile DIR. Every stage (fetch, compute,
+# render) runs under cProfile and tracemalloc and leaves in DIR:
+#
+#   <stage>.pstats           cProfile data, ex: python -m pstats profile/render.pstats
+#   <stage>.txt              the functions with the highest cumulative time
+#   <stage>.collapsed        collapsed stacks for flamegraph.pl or speedscope
+#   <stage>.allocations.txt  the lines that allocated the most memory still held at the end
+#                            of the stage, and the peak traced memory
+#
+# cProfile only sees the thread that runs the stage, so gather tasks running on a thread
+# pool show up as time spent waiting for the pool. Use --gather-mode sequential to see them.
+#
+# cProfile does not record full stacks, only caller/callee pairs. The collapsed stacks are
+# rebuilt from those pairs, splitting the time of a function between its callers in
+# proportion to the time each caller spent in it. That is exact for functions with a
+# single caller and a good approximation otherwise.
+
+PROFILE_FRAMES = 10
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 40
+MAX_STACK_DEPTH = 100
+# Stacks carrying less than this fraction of the stage time are dropped from the collapsed
+# output, which keeps it small for long runs
+MIN_STACK_FRACTION = 0.00001
+
+
+def function_label(func):
+    file_name, line, name = func
+    if(file_name == "~"):
+        # Built-in functions, name is like "<built-in method time.sleep>"
+        return name.strip("<>")
+    return os.path.basename(file_name) + ":" + name + ":" + str(line)
+
+def call_graph(stats):
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, (caller_cc, caller_nc, caller_tt, caller_ct) in callers.items():
+            callees.setdefault(caller, {})[func] = caller_ct
+    return callees
+
+"""Returns the profile as collapsed stack lines ("frame;frame;frame microseconds")"""
+def collapsed_stacks(stats):
+    callees = call_graph(stats)
+    totals = stats.stats
+    weights = {}
+    min_seconds = max(stats.total_tt * MIN_STACK_FRACTION, 0.000001)
+
+    def walk(func, stack, share):
+        tt = totals[func][2]
+        stack = stack + [function_label(func)]
+        self_time = tt * share
+        if(self_time > 0):
+            key = ";".join(stack)
+            weights[key] = weights.get(key, 0.0) + self_time
+        if(len(stack) >= MAX_STACK_DEPTH):
+            return
+        for callee, edge_time in callees.get(func, {}).items():
+            callee_total = totals[callee][3]
+            if(callee_total <= 0 or function_label(callee) in stack):
+                continue
+            callee_share = share * edge_time / callee_total
+            if(callee_total * callee_share >= min_seconds):
+                walk(callee, stack, callee_share)
+
+    for func, entry in totals.items():
+        callers = entry[4]
+        if not callers:
+            walk(func, [], 1.0)
+
+    lines = []
+    for stack, seconds in sorted(weights.items()):
+        microseconds = int(round(seconds * 1000000))
+        if microseconds > 0:
+            lines.append(stack + " " + str(microseconds))
+    return lines
+
+def allocation_report(stage, snapshot, peak):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>")
+    ])
+    statistics = snapshot.statistics("lineno")
+    lines = [
+        "Stage: " + stage,
+        "Peak traced memory: " + str(round(peak / 1024.0 / 1024.0, 1)) + " MiB",
+        "Held at the end of the stage: " + str(round(sum(stat.size for stat in statistics) / 1024.0 / 1024.0, 1)) + " MiB",
+        "",
+        "Top " + str(TOP_ALLOCATIONS) + " allocation sites:"
+    ]
+    for index, stat in enumerate(statistics[:TOP_ALLOCATIONS], 1):
+        frame = stat.traceback[0]
+        lines.append("#%d %s:%d %.1f KiB in %d blocks" % (index, frame.filename, frame.lineno, stat.size / 1024.0, stat.count))
+        source = stat.traceback.format(limit=1)
+        if(len(source) > 1):
+            lines.append("    " + source[-1].strip())
+
+    lines.append("")
+    lines.append("Tracebacks of the top 10 sites:")
+    for index, stat in enumerate(snapshot.statistics("traceback")[:10], 1):
+        lines.append("#%d %.1f KiB in %d blocks" % (index, stat.size / 1024.0, stat.count))
+        for line in stat.traceback.format(most_recent_first=True):
+            lines.append("    " + line)
+    return "\n".join(lines) + "\n"
+
+def write_text(path, text):
+    with open(path, "w") as output_file:
+        output_file.write(text)
+
+def write_profile(directory, stage, profiler, snapshot, peak):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, stage)
+
+    profiler.dump_stats(base + ".pstats")
+    stats = pstats.Stats(profiler)
+
+    top = io.StringIO()
+    pstats.Stats(profiler, stream=top).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    write_text(base + ".txt", top.getvalue())
+    write_text(base + ".collapsed", "\n".join(collapsed_stacks(stats)) + "\n")
+    write_text(base + ".allocations.txt", allocation_report(stage, snapshot, peak))
+    logging.info("Saved " + stage + " profile to " + base + ".*\n")
+
+"""Runs the block under cProfile and tracemalloc and writes the profile of stage into directory. Does nothing when directory is None"""
+@contextlib.contextmanager
+def profiled(directory, stage):
+    if not directory:
+        yield
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        write_profile(directory, stage, profiler, snapshot, peak)
@@ -0,0 +1,173 @@
+import json
+
+# Plans the v2/findings/query calls of a report. Sections are (name, payload) pairs.
+# Sections whose payloads only differ in their aggregations are sent as one request
+# carrying every section's aggregations, prefixed with the section name. Sections that
+# filter on a single severity level are folded into a request for several levels by
+# nesting their aggregations under a Level terms aggregation. The same way, sections that
+# differ in their status or isSuppressed filter share a request without that filter and
+# nest their aggregations under a Status or IsSuppressed terms aggregation. split_response
+# turns the combined response back into the per-section responses the get_* readers expect.
+#
+# For a report on every level, the 11 findings queries of gather_info are sent as 3
+# requests: account info, the top 10 rules, the three severity totals, resolved and
+# suppressed findings share one, the three top 10 by severity queries (filtered on the top
+# 10 accounts) share another, and objects by risk keeps its own since it sorts descending.
+
+SEPARATOR = "__"
+NESTED_AGGREGATION = "nested"
+LEVEL_FIELD = "Level"
+
+# Filters holding one value that are folded by nesting under a terms aggregation of their field
+VALUE_FILTERS = {"status": "Status", "isSuppressed": "IsSuppressed"}
+
+
+## Everything but the aggregations, the levels filter and the value filters has to match for sections to share a request
+def group_key(payload):
+    rest = {key: value for key, value in payload.items() if key != "aggregations"}
+    rest["filters"] = {key: value for key, value in payload.get("filters", {}).items() if key != "levels" and key not in VALUE_FILTERS}
+    return json.dumps(rest, sort_keys=True)
+
+def level_set(payload):
+    levels = payload.get("filters", {}).get("levels")
+    if(levels is None):
+        return None
+    return frozenset(level.lower() for level in levels)
+
+"""Groups sections into requests. Returns a list of groups, each with the combined "payload" and its "members", a list of (section name, path) where path is None unless the section was nested, else the [(field, value)] of the terms buckets its aggregations are under"""
+def plan_queries(sections):
+    by_key = {}
+    for name, payload in sections:
+        by_key.setdefault(group_key(payload), []).append((name, payload))
+
+    groups = []
+    for members in by_key.values():
+        groups += plan_levels(members)
+    return groups
+
+def plan_levels(members):
+    by_levels = {}
+    for name, payload in members:
+        by_levels.setdefault(level_set(payload), []).append((name, payload))
+
+    groups = []
+
+    # Sections without a levels filter can only be merged with each other
+    if None in by_levels:
+        groups.append(build_group(by_levels.pop(None), []))
+
+    singles = [member for levels, level_members in by_levels.items() if len(levels) == 1 for member in level_members]
+    multiples = sorted((levels for levels in by_levels if len(levels) != 1), key=len, reverse=True)
+
+    # Single level sections join the request of the widest levels filter that contains their level
+    if multiples:
+        widest = multiples.pop(0)
+        nested = [(name, payload) for name, payload in singles if level_set(payload) <= widest]
+        singles = [(name, payload) for name, payload in singles if not level_set(payload) <= widest]
+        groups.append(build_group(by_levels[widest], nested))
+
+    for levels in multiples:
+        groups.append(build_group(by_levels[levels], []))
+
+    if singles:
+        if len(set(level_set(payload) for name, payload in singles)) == 1:
+            groups.append(build_group(singles, []))
+        else:
+            groups.append(build_group([], singles))
+
+    return groups
+
+"""Combines sections that keep their own levels filter (plain) with single level sections (nested) into one request"""
+def build_group(plain, nested):
+    # A lone section is sent exactly as it was built
+    if len(plain) == 1 and not nested:
+        name, payload = plain[0]
+        return {"payload": payload, "members": [(name, None)], "single": True}
+
+    sections = plain + nested
+    template = sections[0][1]
+    payload = {key: value for key, value in template.items() if key != "aggregations"}
+    payload["filters"] = {key: value for key, value in template.get("filters", {}).items() if key not in VALUE_FILTERS}
+    payload["aggregations"] = {}
+
+    if plain:
+        levels = template["filters"].get("levels")
+    else:
+        levels = []
+        for name, section in nested:
+            levels += [level for level in section["filters"]["levels"] if level.lower() not in (known.lower() for known in levels)]
+    if levels is not None:
+        payload["filters"]["levels"] = levels
+
+    # A value filter shared by every section stays a filter of the request, the others are nested
+    nested_filters = []
+    for key in VALUE_FILTERS:
+        values = [section.get("filters", {}).get(key) for name, section in sections]
+        if all(value == values[0] for value in values):
+            if values[0] is not None:
+                payload["filters"][key] = values[0]
+        else:
+            nested_filters.append(key)
+
+    level_nested = [name for name, section in nested]
+    members = []
+    for name, section in sections:
+        filters = section.get("filters", {})
+        path = [(VALUE_FILTERS[key], filters[key]) for key in nested_filters if filters.get(key) is not None]
+        if name in level_nested:
+            path.append((LEVEL_FIELD, filters["levels"][0]))
+        if path:
+            payload["aggregations"][name + SEPARATOR + NESTED_AGGREGATION] = nested_aggregation(path, section.get("aggregations", {}))
+            members.append((name, path))
+        else:
+            for aggregation, spec in section.get("aggregations", {}).items():
+                payload["aggregations"][name + SEPARATOR + aggregation] = spec
+            members.append((name, None))
+
+    aggregation_names = {name: list(section.get("aggregations", {})) for name, section in sections}
+    return {"payload": payload, "members": members, "aggregations": aggregation_names, "single": False}
+
+## Terms aggregations of the fields of path, one inside the other, with aggregations under the last one
+def nested_aggregation(path, aggregations):
+    field, value = path[0]
+    return {
+        "fieldName": field,
+        "aggregationType": "Terms",
+        "subAggregations": aggregations if len(path) == 1 else {NESTED_AGGREGATION: nested_aggregation(path[1:], aggregations)}
+    }
+
+## Bucket of the value of the last field of path, an empty bucket when a value has no findings
+def nested_bucket(aggregation, path):
+    bucket = {}
+    for field, value in path:
+        bucket = {}
+        for key, candidate in (aggregation.get("buckets") or {}).items():
+            if key.lower() == str(value).lower():
+                bucket = candidate
+        aggregation = bucket.get("subAggregations", {}).get(NESTED_AGGREGATION, {})
+    return bucket
+
+## Splits the response of a planned request into {section name: response}
+def split_response(group, data):
+    if group["single"]:
+        name = group["members"][0][0]
+        return {name: data}
+
+    aggregations = data.get("aggregations") or {}
+    results = {}
+    for name, path in group["members"]:
+        if path is None:
+            results[name] = {
+                "totalCount": data.get("totalCount", 0),
+                "aggregations": {aggregation: aggregations.get(name + SEPARATOR + aggregation, {"buckets": {}})
+                                 for aggregation in group["aggregations"][name]}
+            }
+        else:
+            bucket = nested_bucket(aggregations.get(name + SEPARATOR + NESTED_AGGREGATION, {}), path)
+            sub_aggregations = bucket.get("subAggregations", {})
+            results[name] = {
+                "totalCount": bucket.get("count", 0),
+                "aggregations": {aggregation: sub_aggregations.get(aggregation, {"buckets": {}})
+                                 for aggregation in group["aggregations"][name]}
+            }
+    return results
@@ -0,0 +1,259 @@
+import argparse
+import logging
+import os
+import sys
+
+import gather_info
+import findings_store
+import metrics
+import profiling
+import vss_client
+import token_cache
+import topk
+import trend_store
+import response_cache
+import report_config
+import report_model
+import export_parquet
+
+# Command line of generate.py. fetch writes the API responses to data/, compute turns data/ into
+# the report model and render builds the PDF from the model, without the API or REFRESH_TOKEN.
+# build runs all three and is used when no command is given. Only render imports ReportLab
+# (report_pdf), so fetch and compute runs do not pay for loading it. export writes the report
+# tables of the model and the findings to Parquet files, it is the only command that imports
+# pyarrow, which export_parquet only loads when it writes a file.
+
+COMMANDS = ["build", "fetch", "compute", "render", "export"]
+DEFAULT_COMMAND = "build"
+
+def add_config_arguments(parser):
+    parser.add_argument('--config', help="configuration file name in json format ex: config.json", required=True)
+
+def add_fetch_arguments(parser):
+    gather_group = parser.add_argument_group('gather arguments')
+    gather_group.add_argument('--gather-mode', choices=gather_info.GATHER_MODES, default="sequential",
+                              help="run the API calls one at a time (sequential) or concurrently with a thread pool (thread) or asyncio (asyncio)")
+    gather_group.add_argument('--workers', type=int, default=gather_info.DEFAULT_GATHER_WORKERS,
+                              help="maximum number of concurrent API calls in thread and asyncio modes")
+    gather_group.add_argument('--merge-queries', action="store_true",
+                              help="send findings queries that share the same filters as a single request")
+    gather_group.add_argument('--shards', type=int, default=1,
+                              help="split every findings query by cloud account into this many queries sent in parallel and merge their results")
+    gather_group.add_argument('--top-objects', type=int, metavar="K",
+                              help="rank objects by the total risk score of all their open findings and keep the K highest. Without"
+                              " --findings-store every open finding is downloaded for it. 0 scores the 10 objects with the most"
+                              " findings instead, the default without --findings-store, with one it defaults to "
+                              + str(topk.TOP_OBJECTS))
+    http_group = parser.add_argument_group('http arguments')
+    http_group.add_argument('--http-pool-size', type=int, default=vss_client.DEFAULT_POOL_SIZE,
+                            help="number of keep-alive connections kept open to the VSS API")
+    http_group.add_argument('--connect-timeout', type=float, default=vss_client.DEFAULT_CONNECT_TIMEOUT,
+                            help="seconds to wait for a connection to the API")
+    http_group.add_argument('--read-timeout', type=float, default=vss_client.DEFAULT_READ_TIMEOUT,
+                            help="seconds to wait for an API response")
+    store_group = parser.add_argument_group('local findings store arguments')
+    store_group.add_argument('--findings-store', help="SQLite file with the raw findings, report numbers are computed from it instead of the API")
+    store_group.add_argument('--sync-findings', nargs="?", const="full", choices=findings_store.SYNC_MODES,
+                             help="download the findings into --findings-store before computing the report, all of them (full, the default) "
+                             "or only those of cloud accounts collected since the last sync (incremental)")
+    trend_group = parser.add_argument_group('trend arguments')
+    trend_group.add_argument('--history-dir', help="keep a local history of the finding counts in this directory and compute the trends from it, ex: " + trend_store.HISTORY_DIR)
+    trend_group.add_argument('--trend-interval', choices=trend_store.INTERVALS, default=trend_store.DEFAULT_INTERVAL,
+                             help="period of the trend charts when --history-dir is set, default " + trend_store.DEFAULT_INTERVAL)
+    cache_group = parser.add_argument_group('cache arguments')
+    cache_group.add_argument('--cache-dir', help="cache API responses in this directory and reuse them while they are fresh")
+
+def add_model_arguments(parser):
+    parser.add_argument('--model', default=report_model.MODEL_FILE, help="report model file, default " + report_model.MODEL_FILE)
+
+def add_output_arguments(parser):
+    parser.add_argument('--output-file', help="output file name ex: vss_report.pdf", required=True)
+
+def add_export_arguments(parser):
+    export_group = parser.add_argument_group('export arguments')
+    export_group.add_argument('--export-dir', default=export_parquet.DEFAULT_EXPORT_DIR, help="directory of the Parquet files, default " + export_parquet.DEFAULT_EXPORT_DIR)
+    export_group.add_argument('--findings-store', help="export the findings of this local findings store instead of streaming them from the API")
+    export_group.add_argument('--columns', help="comma separated finding columns to export, default all of them")
+    export_group.add_argument('--skip-findings', action="store_true", help="only export the report tables")
+    export_group.add_argument('--row-group-size', type=int, default=export_parquet.DEFAULT_ROW_GROUP_SIZE,
+                              help="findings per Parquet row group, the findings are buffered one row group at a time")
+    export_group.add_argument('--compression', choices=export_parquet.COMPRESSIONS, default=export_parquet.DEFAULT_COMPRESSION,
+                              help="Parquet compression codec, default " + export_parquet.DEFAULT_COMPRESSION)
+
+def add_metrics_arguments(parser):
+    metrics_group = parser.add_argument_group('metrics arguments')
+    metrics_group.add_argument('--metrics-json', help="write per-phase timings and per-endpoint API metrics to this JSON file")
+    metrics_group.add_argument('--metrics-prom', help="write the same metrics in the Prometheus text format, ex: for the node exporter textfile collector")
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', metavar="DIR", help="profile every stage with cProfile and tracemalloc and write the results to DIR")
+
+def build_argument_parser():
+    parser = argparse.ArgumentParser(usage="%(prog)s [build|fetch|compute|render|export] ...\n"
+                                     "Provide configuration file name with --config param and report file name with --output-file")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    
+    build_parser = commands.add_parser("build", help="fetch, compute and render the report (default)")
+    add_config_arguments(build_parser)
+    add_output_arguments(build_parser)
+    add_model_arguments(build_parser)
+    add_fetch_arguments(build_parser)
+    add_metrics_arguments(build_parser)
+    add_profile_arguments(build_parser)
+    
+    fetch_parser = commands.add_parser("fetch", help="call the API and write the responses to data/")
+    add_config_arguments(fetch_parser)
+    add_fetch_arguments(fetch_parser)
+    add_metrics_arguments(fetch_parser)
+    add_profile_arguments(fetch_parser)
+    
+    compute_parser = commands.add_parser("compute", help="compute the report model from data/")
+    add_config_arguments(compute_parser)
+    add_model_arguments(compute_parser)
+    add_metrics_arguments(compute_parser)
+    add_profile_arguments(compute_parser)
+    
+    render_parser = commands.add_parser("render", help="build the PDF from the report model")
+    add_model_arguments(render_parser)
+    add_output_arguments(render_parser)
+    add_metrics_arguments(render_parser)
+    add_profile_arguments(render_parser)
+    
+    export_parser = commands.add_parser("export", help="write the report tables of the model and the findings to Parquet files")
+    add_config_arguments(export_parser)
+    add_model_arguments(export_parser)
+    add_export_arguments(export_parser)
+    add_metrics_arguments(export_parser)
+    add_profile_arguments(export_parser)
+    return parser
+
+def parse_command_line(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # Keeps "generate.py --config ... --output-file ..." working
+    if(argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = [DEFAULT_COMMAND] + list(argv)
+    return build_argument_parser().parse_args(argv)
+
+def load_config(file_name):
+    try:
+        return report_config.load(file_name)
+    except report_config.ConfigError as error:
+        logging.error("Cannot generate report " + str(error) + "\n")
+        sys.exit()
+
+def fetch(args, config):
+    vss_client.configure(args.http_pool_size, args.connect_timeout, args.read_timeout)
+    if(args.cache_dir):
+        response_cache.enable(args.cache_dir, token_cache.token_id(gather_info.get_refresh_token()))
+    
+    gather_info.auth()
+    gather_info.gather_data(config, args.gather_mode, args.workers, args.merge_queries, args.findings_store, args.sync_findings,
+                            args.history_dir, args.trend_interval, args.shards, args.top_objects)
+
+def compute(config, model_file):
+    try:
+        model = report_model.build_model(config)
+    except OSError as error:
+        logging.error("Cannot compute report model, run fetch first: " + str(error) + "\n")
+        sys.exit()
+    report_model.save_model(model, model_file)
+    logging.info("Saved report model to " + model_file + "\n")
+    return model
+
+## Imports ReportLab only when a PDF is actually built
+def render(model, report_file_name):
+    import report_pdf
+    report_pdf.render(model, report_file_name)
+
+## pyarrow is only loaded here, by export_parquet, when data is actually exported
+def export(args, config):
+    if(args.row_group_size < 1):
+        logging.error("Cannot export report data, the row group size must be at least 1\n")
+        sys.exit()
+    if(args.findings_store and config.cloud_tags and not args.skip_findings):
+        logging.error("Cannot export report data, cloud tag filters cannot be applied to the local findings store\n")
+        sys.exit()
+    columns = [column.strip() for column in args.columns.split(",") if column.strip()] if args.columns else None
+    try:
+        export_parquet.finding_schema(columns)
+    except ImportError as error:
+        logging.error("Cannot export report data, pyarrow is required: " + str(error) + "\n")
+        sys.exit()
+    except ValueError as error:
+        logging.error("Cannot export report data " + str(error) + "\n")
+        sys.exit()
+    try:
+        model = report_model.load_model(args.model)
+        cube = gather_info.report_cube(config)
+    except (ValueError, OSError, report_model.ModelError) as error:
+        logging.error("Cannot export report data " + str(error) + "\n")
+        sys.exit()
+    
+    os.makedirs(args.export_dir, exist_ok=True)
+    export_parquet.export_report_tables(args.export_dir, model, cube, args.compression)
+    
+    if(args.skip_findings):
+        return
+    if(not args.findings_store):
+        gather_info.auth()
+    filters = gather_info.trend_snapshot_payload(config)["filters"]
+    try:
+        export_parquet.export_findings(args.export_dir, filters, args.findings_store, columns, args.row_group_size, args.compression)
+    except vss_client.ErrorStatusCode as error:
+        logging.error("Cannot export report data " + str(error) + "\n")
+        sys.exit()
+
+def write_metrics(args):
+    if(args.metrics_json):
+        metrics.write_json(args.metrics_json)
+        logging.info("Saved metrics to " + args.metrics_json + "\n")
+    if(args.metrics_prom):
+        metrics.write_prometheus(args.metrics_prom)
+        logging.info("Saved metrics to " + args.metrics_prom + "\n")
+
+def run(args):
+    if(args.command in ("build", "fetch", "compute", "export")):
+        config = load_config(args.config)
+    
+    if(args.command in ("build", "fetch")):
+        logging.info("\nGathering Report Data ...\n")
+        if(args.profile and args.gather_mode != "sequential"):
+            logging.warning("Profiling only sees the main thread, use --gather-mode sequential to profile the gather tasks\n")
+        with metrics.timed("stage", "fetch"), profiling.profiled(args.profile, "fetch"):
+            fetch(args, config)
+    
+    if(args.command in ("build", "compute")):
+        with metrics.timed("stage", "compute"), profiling.profiled(args.profile, "compute"):
+            model = compute(config, args.model)
+    
+    if(args.command == "render"):
+        try:
+            model = report_model.load_model(args.model)
+        except report_model.ModelError as error:
+            logging.error("Cannot generate report " + str(error) + "\n")
+            sys.exit()
+    
+    if(args.command in ("build", "render")):
+        logging.info("\nGenerating Report ...\n")
+        with metrics.timed("stage", "render"), profiling.profiled(args.profile, "render"):
+            render(model, args.output_file)
+    
+    if(args.command == "export"):
+        with metrics.timed("stage", "export"), profiling.profiled(args.profile, "export"):
+            export(args, config)
+    
+    response_cache.wait()
+
+def main(argv=None):
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    
+    args = parse_command_line(argv)
+    if(args.command is None):
+        build_argument_parser().print_help()
+        sys.exit(2)
+    
+    try:
+        run(args)
+    finally:
+        write_metrics(args)
@@ -0,0 +1,85 @@
+import json
+import types
+
+from collections import namedtuple
+
+# Report configuration, read and validated once at startup and then passed to the gather
+# and render functions. The file has the org name and the report filters:
+#
+#   {
+#       "org_name": "Demo Account",
+#       "config": {
+#           "providers": ["AWS", "Azure"],      list, or null for every provider
+#           "severity": ["High", "Medium"],    subset of High, Medium, Low
+#           "cloudTags": {},                   object, or null for no tag filter
+#           "cloudAccountIds": ["All"]         account ids, or ["All"]
+#       }
+#   }
+#
+# The values are kept as written in the file since they are sent to the API as is.
+
+SEVERITY_LEVELS = ["high", "medium", "low"]
+
+
+class ConfigError(Exception):
+    pass
+
+
+class ReportConfig(namedtuple("ReportConfig", ["org_name", "providers", "severity", "cloud_tags", "cloud_account_ids"])):
+    """Immutable report configuration. Lists are stored as tuples and tags as a read only mapping"""
+    __slots__ = ()
+
+    def all_accounts(self):
+        return self.cloud_account_ids[0].lower() == "all"
+
+    def has_level(self, level):
+        return level.lower() in (severity.lower() for severity in self.severity)
+
+
+def string_list(config, key, allow_none=False):
+    value = config.get(key)
+    if(value is None and allow_none):
+        return None
+    if(not isinstance(value, list) or not all(isinstance(item, str) for item in value)):
+        raise ConfigError('"' + key + '" must be a list of strings')
+    return tuple(value)
+
+"""Validates the content of a configuration file and returns a ReportConfig"""
+def from_dict(configuration):
+    if(not isinstance(configuration, dict)):
+        raise ConfigError("configuration must be a JSON object")
+    org_name = configuration.get("org_name")
+    if(not isinstance(org_name, str)):
+        raise ConfigError('"org_name" must be a string')
+    config = configuration.get("config")
+    if(not isinstance(config, dict)):
+        raise ConfigError('"config" must be an object')
+
+    cloud_account_ids = string_list(config, "cloudAccountIds")
+    if(len(cloud_account_ids) == 0):
+        raise ConfigError('"cloudAccountIds" must list at least one account, or "All"')
+
+    severity = string_list(config, "severity")
+    for level in severity:
+        if(level.lower() not in SEVERITY_LEVELS):
+            raise ConfigError('Unknown severity "' + level + '", expected one of High, Medium, Low')
+
+    cloud_tags = config.get("cloudTags")
+    if(cloud_tags is not None and not isinstance(cloud_tags, dict)):
+        raise ConfigError('"cloudTags" must be an object')
+
+    return ReportConfig(
+        org_name=org_name,
+        providers=string_list(config, "providers", allow_none=True),
+        severity=severity,
+        cloud_tags=types.MappingProxyType(dict(cloud_tags)) if cloud_tags is not None else None,
+        cloud_account_ids=cloud_account_ids
+    )
+
+def load(file_name):
+    try:
+        with open(file_name) as config_file:
+            configuration = json.load(config_file)
+    except (OSError, ValueError) as error:
+        raise ConfigError("Cannot read configuration file " + file_name + ": " + str(error))
+    return from_dict(configuration)
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+import metrics
+
+# Parsed data/*.json artifacts of the current run. Each file is read and parsed the
+# first time a section asks for it and the same structure is handed out afterwards, so
+# a report parses every artifact at most once. Callers must treat the returned data as
+# read only. Files written during the run replace their entry, and invalidate() drops
+# entries for long running processes that rebuild reports from fresh data.
+#
+# Values computed from several artifacts (ex: the count cube of the report) are memoized
+# the same way with derive(), and dropped whenever an artifact is stored or invalidated.
+
+DATA_DIR = "data"
+
+artifacts = {}
+derived = {}
+artifacts_lock = threading.Lock()
+
+
+def artifact_path(name):
+    if(name.endswith(".json")):
+        return name
+    return DATA_DIR + "/" + name + ".json"
+
+"""Returns the parsed artifact. name is either a file path or the name of a file under data/ without .json"""
+def load(name):
+    path = artifact_path(name)
+    with artifacts_lock:
+        if path in artifacts:
+            return artifacts[path]
+
+    with open(path, "r") as artifact_file:
+        text = artifact_file.read()
+    started = time.perf_counter()
+    data = json.loads(text)
+    metrics.record_parse(path, time.perf_counter() - started, len(text))
+
+    with artifacts_lock:
+        # Another thread may have loaded it meanwhile, keep the first copy
+        return artifacts.setdefault(path, data)
+
+"""Returns the value named name, computed by build() the first time it is asked for after the artifacts changed"""
+def derive(name, build):
+    with artifacts_lock:
+        if name in derived:
+            return derived[name]
+
+    value = build()
+
+    with artifacts_lock:
+        return derived.setdefault(name, value)
+
+## Records data just written to the artifact, so it is not parsed again
+def store(name, data):
+    with artifacts_lock:
+        artifacts[artifact_path(name)] = data
+        derived.clear()
+
+## Drops the derived values, ex: when a file they are computed from is written
+def invalidate_derived():
+    with artifacts_lock:
+        derived.clear()
+
+## Drops one artifact, or every artifact when name is None, and the derived values
+def invalidate(name=None):
+    with artifacts_lock:
+        if name is None:
+            artifacts.clear()
+        else:
+            artifacts.pop(artifact_path(name), None)
+        derived.clear()
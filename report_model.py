@@ -0,0 +1,70 @@
+import json
+import os
+
+import atomic_file
+import gather_info
+
+# Report model: every row and series the report tables and charts need, computed from
+# the data/ artifacts by the get_* readers. It is a small JSON document, so the PDF can be
+# rendered from it again without the API, the token or the raw data/ files.
+
+MODEL_VERSION = 2
+MODEL_FILE = os.path.join("data", "report_model.json")
+
+
+class ModelError(Exception):
+    pass
+
+
+"""Computes the report model from the data/ artifacts gathered for config"""
+def build_model(config):
+    open_findings, resolved_findings, account_ids = gather_info.get_top_10_accounts_by_findings(config)
+    findings_by_provider, providers = gather_info.get_findings_by_provider(config)
+    open_trends, open_trend_months = gather_info.get_open_findings_trends()
+    new_resolved_trends, new_resolved_months = gather_info.get_new_resolved_trends()
+
+    return {
+        "version": MODEL_VERSION,
+        "org_name": config.org_name,
+        "scope": {
+            "providers": list(config.providers) if config.providers is not None else None,
+            "cloudAccountIds": list(config.cloud_account_ids),
+            "severity": list(config.severity),
+            "cloudTags": dict(config.cloud_tags) if config.cloud_tags is not None else None
+        },
+        "account_info": gather_info.get_account_info(),
+        "open_resolved_findings": gather_info.get_open_resolved_findings(),
+        "providers": providers,
+        "findings_by_provider": findings_by_provider,
+        "top_10_accounts_by_findings": {
+            "open": open_findings,
+            "resolved": resolved_findings,
+            "accounts": account_ids
+        },
+        "top_10_accounts_by_severity": gather_info.get_high_med_low_top_10_violations(config),
+        "violations_by_severity": gather_info.get_all_violations_by_severity(config),
+        "top_10_rules": gather_info.get_top_10_rules(),
+        "top_10_objects_by_risk": gather_info.get_top_10_objects_by_risk(),
+        "open_findings_trends": {
+            "data": open_trends,
+            "months": open_trend_months
+        },
+        "new_resolved_trends": {
+            "data": new_resolved_trends,
+            "months": new_resolved_months
+        }
+    }
+
+def save_model(model, path=MODEL_FILE):
+    with atomic_file.open_atomic(path) as model_file:
+        json.dump(model, model_file, separators=(",", ":"))
+
+def load_model(path=MODEL_FILE):
+    try:
+        with open(path, "r") as model_file:
+            model = json.load(model_file)
+    except (OSError, ValueError) as error:
+        raise ModelError("Cannot read report model " + path + ": " + str(error))
+    if(model.get("version") != MODEL_VERSION):
+        raise ModelError("Report model " + path + " has version " + str(model.get("version")) + ", expected " + str(MODEL_VERSION) + ". Run compute again")
+    return model
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import atomic_file
+
+# On-disk cache of VSS API responses. Entries are keyed by a hash of the tenant, method,
+# endpoint and the canonical (sorted keys, compact) request payload, so the same query
+# built in a different key order still hits. Every endpoint class has its own TTL. Within
+# the stale-while-revalidate window after the TTL a stale entry is returned right away
+# and refreshed on a background thread. manifest.json records when each entry was fetched.
+
+# (path prefix, ttl seconds, stale-while-revalidate seconds). The first matching prefix wins.
+ENDPOINT_TTLS = [
+    ("v1/rules", 24 * 3600, 7 * 24 * 3600),
+    ("v1/compliance-frameworks", 24 * 3600, 7 * 24 * 3600),
+    ("v1/cloud-accounts/collection-status", 600, 0),
+    ("v2/findings/trends-query", 3600, 0),
+    ("v2/findings/query", 900, 0)
+]
+
+cache_dir = None
+namespace = ""
+
+manifest_lock = threading.Lock()
+revalidating = {}
+revalidating_lock = threading.Lock()
+
+
+class CachedResponse(object):
+    """Stands in for a requests.Response served from the cache"""
+
+    def __init__(self, status_code, content, url):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+## Turns on the cache. namespace keeps the entries of different tenants apart.
+def enable(directory, tenant=""):
+    global cache_dir, namespace
+    os.makedirs(directory, exist_ok=True)
+    cache_dir = directory
+    namespace = tenant
+
+def disable():
+    global cache_dir
+    cache_dir = None
+
+def enabled():
+    return cache_dir is not None
+
+def endpoint_ttl(url):
+    for prefix, ttl, stale_while_revalidate in ENDPOINT_TTLS:
+        if ("/" + prefix) in url:
+            return ttl, stale_while_revalidate
+    return 0, 0
+
+def canonical_payload(payload):
+    if(payload is None):
+        return ""
+    if(isinstance(payload, bytes)):
+        payload = payload.decode("utf-8")
+    if(isinstance(payload, str)):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return payload
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+def cache_key(method, url, payload):
+    text = "\n".join([namespace, method.upper(), url, canonical_payload(payload)])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def entry_paths(key):
+    return os.path.join(cache_dir, key + ".json"), os.path.join(cache_dir, key + ".body")
+
+def read_entry(key):
+    meta_path, body_path = entry_paths(key)
+    try:
+        with open(meta_path, "r") as meta_file:
+            meta = json.load(meta_file)
+        with open(body_path, "rb") as body_file:
+            body = body_file.read()
+    except (OSError, ValueError):
+        return None, None
+    return meta, body
+
+def store(key, method, url, response, ttl):
+    meta_path, body_path = entry_paths(key)
+    meta = {
+        "method": method.upper(),
+        "url": url,
+        "status_code": response.status_code,
+        "fetched_at": time.time(),
+        "ttl": ttl,
+        "bytes": len(response.content)
+    }
+    # Body first, so a reader never finds metadata without its body
+    atomic_file.write(body_path, response.content, "wb")
+    atomic_file.write(meta_path, json.dumps(meta))
+    update_manifest(key, meta)
+
+def update_manifest(key, meta):
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    with manifest_lock:
+        try:
+            with open(manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest[key] = {
+            "url": meta["url"],
+            "method": meta["method"],
+            "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(meta["fetched_at"])),
+            "ttl": meta["ttl"],
+            "bytes": meta["bytes"]
+        }
+        atomic_file.write(manifest_path, json.dumps(manifest, indent=4, sort_keys=True))
+
+def revalidate(key, method, url, send, ttl):
+    with revalidating_lock:
+        if key in revalidating:
+            return
+        thread = threading.Thread(target=refresh_entry, args=(key, method, url, send, ttl), daemon=True)
+        revalidating[key] = thread
+    thread.start()
+
+def refresh_entry(key, method, url, send, ttl):
+    try:
+        response = send()
+        if(response.status_code == 200):
+            store(key, method, url, response, ttl)
+        else:
+            logging.warning("Could not revalidate cached " + url + ": " + str(response.status_code) + "\n")
+    except Exception as error:
+        logging.warning("Could not revalidate cached " + url + ": " + str(error) + "\n")
+    finally:
+        with revalidating_lock:
+            revalidating.pop(key, None)
+
+## Waits for background revalidations, call before the process exits
+def wait():
+    with revalidating_lock:
+        threads = list(revalidating.values())
+    for thread in threads:
+        thread.join()
+
+"""Returns the cached response for the request if it is fresh, otherwise calls send() and caches a successful response"""
+def fetch(method, url, payload, send):
+    ttl, stale_while_revalidate = endpoint_ttl(url)
+    if(cache_dir is None or ttl <= 0):
+        return send()
+
+    key = cache_key(method, url, payload)
+    meta, body = read_entry(key)
+    if meta is not None:
+        age = time.time() - meta["fetched_at"]
+        if(age < ttl):
+            logging.debug("Cache hit " + url)
+            return CachedResponse(meta["status_code"], body, url)
+        if(age < ttl + stale_while_revalidate):
+            logging.debug("Stale cache hit " + url + ", revalidating")
+            revalidate(key, method, url, send, ttl)
+            return CachedResponse(meta["status_code"], body, url)
+
+    response = send()
+    if(response.status_code == 200):
+        store(key, method, url, response, ttl)
+    return response
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import atomic_file
+import findings_stream
+import report_data
+import vss_client
+
+# Catalog of the VSS rules, indexed by rule id. The rules are loaded page by page from
+# v1/rules/query and persisted as a compact cache holding only the fields the report
+# uses. The cache is reused until it is older than CATALOG_TTL or was fetched for another
+# tenant (API URL and refresh token), and its version is a hash of the indexed rules so
+# consumers can tell when the catalog changed. The parsed
+# catalog is kept with the other artifacts of report_data, so report_data.invalidate()
+# drops it too.
+
+CATALOG_FILE = os.path.join("data", "rule_catalog.json")
+CATALOG_TTL = 24 * 3600
+
+RULE_FIELDS = ["displayName", "provider", "service", "level"]
+
+
+def fetch_rules():
+    url = vss_client.api_url("v1/rules/query")
+    total_count = None
+    rules = []
+    for page in findings_stream.iter_pages(url):
+        if total_count is None:
+            total_count = page.get("totalCount")
+        rules += page.get("results") or []
+    return rules, total_count
+
+def build_index(rules):
+    return {rule["id"]: {field: rule.get(field) for field in RULE_FIELDS} for rule in rules}
+
+def catalog_version(index):
+    return hashlib.sha1(json.dumps(index, sort_keys=True).encode("utf-8")).hexdigest()
+
+def save_catalog(path, catalog):
+    with atomic_file.open_atomic(path) as catalog_file:
+        json.dump(catalog, catalog_file, separators=(",", ":"))
+
+## Returns the persisted catalog, or None if there is none
+def load_catalog(path=CATALOG_FILE):
+    try:
+        return report_data.load(path)
+    except (OSError, ValueError):
+        return None
+
+## Returns the persisted catalog, raises FileNotFoundError if there is none
+def require_catalog(path=CATALOG_FILE):
+    catalog = load_catalog(path)
+    if catalog is None:
+        raise FileNotFoundError("No readable rule catalog at " + path)
+    return catalog
+
+## Identifies the tenant a catalog is fetched for, from the API URL and the token id of token_cache
+def tenant_key(api_url, token_id):
+    return hashlib.sha1((api_url + " " + token_id).encode("utf-8")).hexdigest()[:16]
+
+## Downloads the rules of tenant and replaces the persisted catalog
+def refresh_catalog(path=CATALOG_FILE, tenant=None):
+    rules, total_count = fetch_rules()
+    index = build_index(rules)
+    catalog = {
+        "version": catalog_version(index),
+        "fetched_at": time.time(),
+        "tenant": tenant,
+        "total_count": total_count if total_count is not None else len(index),
+        "rules": index
+    }
+    save_catalog(path, catalog)
+    report_data.store(path, catalog)
+    logging.info("Loaded " + str(len(index)) + " rules into the rule catalog\n")
+    return catalog
+
+"""Returns the catalog of tenant, refreshing it when it is missing, of another tenant or older than max_age seconds"""
+def get_catalog(path=CATALOG_FILE, max_age=CATALOG_TTL, tenant=None):
+    catalog = load_catalog(path)
+    if catalog is not None and catalog.get("tenant") == tenant and time.time() - catalog.get("fetched_at", 0) < max_age:
+        return catalog
+    return refresh_catalog(path, tenant)
+
+def get_rule(rule_id, path=CATALOG_FILE):
+    catalog = load_catalog(path)
+    if catalog is None:
+        return None
+    return catalog["rules"].get(rule_id)
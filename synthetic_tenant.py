@@ -0,0 +1,135 @@
+import bisect
+import datetime
+import itertools
+
+# Seeded synthetic tenant shared by mock_api.py and tenant_generator.py, so the mock API and
+# the generated data/ snapshots have the same accounts, rules and findings for a seed.
+# Accounts and rules follow skewed (Zipf like) distributions so a few of them carry most of
+# the findings. Findings are generated one object at a time, in the API finding format.
+
+PROVIDERS = ["aws", "azure", "gcp"]
+PROVIDER_WEIGHTS = [6, 3, 1]
+LEVELS = ["High", "Medium", "Low"]
+LEVEL_WEIGHTS = [2, 5, 3]
+SERVICES = ["s3", "ec2", "iam", "rds", "vpc", "storage", "compute", "network", "sql", "keyvault"]
+COLLECTION_STATUSES = ["Success", "Success", "Success", "Failed", "InProgress"]
+
+ACCOUNT_SKEW = 1.1
+RULE_SKEW = 0.8
+OPEN_RATE = 0.7
+SUPPRESSED_RATE = 0.05
+MEAN_FINDINGS_PER_OBJECT = 4
+TREND_MONTHS = 6
+
+
+def cumulative_weights(count, skew):
+    return list(itertools.accumulate(1.0 / (index + 1) ** skew for index in range(count)))
+
+def weighted_index(rng, cum_weights):
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+def account_id(provider, index):
+    if(provider == "azure"):
+        return "%08x-0000-4000-8000-%012x" % (index, index)
+    if(provider == "gcp"):
+        return "project-%06d" % index
+    return "%012d" % (100000000000 + index)
+
+## Cloud accounts in the format of v1/cloud-accounts/collection-status/query
+def make_accounts(rng, count):
+    accounts = []
+    for index in range(count):
+        provider = rng.choices(PROVIDERS, PROVIDER_WEIGHTS)[0]
+        accounts.append({
+            "cloudAccountId": account_id(provider, index),
+            "provider": provider,
+            "name": "account-" + str(index),
+            "collectionStatus": rng.choice(COLLECTION_STATUSES),
+            "lastCollectedAt": (datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        })
+    return accounts
+
+## Rules in the format of v1/rules/query, the first rules cover every provider
+def make_rules(rng, count):
+    rules = []
+    for index in range(count):
+        provider = PROVIDERS[index % len(PROVIDERS)] if index < len(PROVIDERS) else rng.choices(PROVIDERS, PROVIDER_WEIGHTS)[0]
+        rules.append({
+            "id": "rule-%06d" % index,
+            "displayName": "Rule " + str(index),
+            "provider": provider,
+            "service": rng.choice(SERVICES),
+            "level": rng.choices(LEVELS, LEVEL_WEIGHTS)[0]
+        })
+    return rules
+
+## Month starts of the trend window, oldest first
+def trend_months(today, count=TREND_MONTHS):
+    months = []
+    for offset in range(count - 1, -1, -1):
+        year, month = today.year, today.month - offset
+        while month < 1:
+            year, month = year - 1, month + 12
+        months.append("%04d-%02d-01T00:00:00Z" % (year, month))
+    return months
+
+"""Returns the results of a v2/findings/trends-query response for a tenant of findings findings"""
+def make_trends(rng, findings, today=None):
+    months = trend_months(today or datetime.date.today())
+    return {status: {"buckets": {month: {"count": rng.randint(findings // 20, findings // 5 + 1)} for month in months}}
+            for status in ["Open", "New", "Resolved"]}
+
+
+class FindingGenerator(object):
+    """Generates the findings of the objects of accounts, with rules of the provider of the account"""
+
+    def __init__(self, rng, accounts, rules):
+        self.rng = rng
+        self.rules_by_provider = {}
+        for rule in rules:
+            self.rules_by_provider.setdefault(rule["provider"], []).append(rule)
+        self.rule_weights = {provider: cumulative_weights(len(provider_rules), RULE_SKEW)
+                             for provider, provider_rules in self.rules_by_provider.items()}
+        # Accounts of a provider without rules never have findings
+        self.accounts = [account for account in accounts if account["provider"] in self.rules_by_provider]
+        if not self.accounts:
+            raise ValueError("No cloud account has a provider with rules, no findings can be generated")
+        self.account_weights = cumulative_weights(len(self.accounts), ACCOUNT_SKEW)
+        self.findings = 0
+        self.objects = 0
+
+    """Returns the findings of one more object, at least 1 and at most limit of them"""
+    def generate_object(self, limit):
+        rng = self.rng
+        account = self.accounts[weighted_index(rng, self.account_weights)]
+        provider = account["provider"]
+        rules = self.rules_by_provider[provider]
+        self.objects += 1
+        object_id = "object-" + str(self.objects)
+        object_xid = account["cloudAccountId"] + "/" + object_id
+        base_risk = rng.randint(1, 90)
+
+        count = max(1, min(limit, 1 + int(rng.expovariate(1.0 / (MEAN_FINDINGS_PER_OBJECT - 1)))))
+        findings = []
+        for _ in range(count):
+            rule = rules[weighted_index(rng, self.rule_weights[provider])]
+            self.findings += 1
+            findings.append({
+                "id": "finding-%010d" % self.findings,
+                "objectId": object_id,
+                "objectXid": object_xid,
+                "ruleId": rule["id"],
+                "cloudAccountId": account["cloudAccountId"],
+                "cloudProvider": provider,
+                "level": rule["level"],
+                "status": "Open" if rng.random() < OPEN_RATE else "Resolved",
+                "riskScore": min(100, base_risk + rng.randint(0, 10)),
+                "isSuppressed": rng.random() < SUPPRESSED_RATE
+            })
+        return findings
+
+    ## Yields count findings
+    def iter_findings(self, count):
+        while self.findings < count:
+            for finding in self.generate_object(count - self.findings):
+                yield finding
@@ -0,0 +1,277 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import atomic_file
+import gather_info
+import report_config
+import rule_catalog
+import synthetic_tenant
+
+# Deterministic synthetic tenants for scale testing. For a seed and a tenant size it writes a
+# complete data/ snapshot, every file the get_* readers consume, and optionally the raw
+# findings as NDJSON in the API finding format. Accounts, rules and findings come from
+# synthetic_tenant, like those of mock_api.py.
+#
+# Findings are generated one object at a time and never kept: the snapshot is computed from
+# counters whose size depends on the number of accounts and rules, not on the number of
+# findings, so tens of millions of findings fit in a small, constant amount of memory.
+# The findings queries of the report are answered from those counters with the payloads
+# built by gather_info, so the snapshot honours the report configuration like the API does.
+#
+#   python tenant_generator.py --findings 2000000 --accounts 5000 --rules 3000 --findings-file findings.ndjson
+
+FRAMEWORKS = 12
+TOP_OBJECTS = 10
+
+# Aggregation fieldName -> counter dimension
+FIELD_DIMENSIONS = {
+    "CloudProvider": "provider",
+    "CloudAccountId": "account_id",
+    "RuleId": "rule_id",
+    "Level": "level",
+    "Status": "status"
+}
+
+WRITE_BUFFER = 1024 * 1024
+
+
+class Tenant(object):
+    """Accounts, rules and the counters of the findings generated so far"""
+
+    def __init__(self, accounts, rules, seed):
+        self.rng = random.Random(seed)
+        self.accounts = synthetic_tenant.make_accounts(self.rng, accounts)
+        self.rules = synthetic_tenant.make_rules(self.rng, rules)
+        self.generator = synthetic_tenant.FindingGenerator(self.rng, self.accounts, self.rules)
+
+        # (provider, account, level, status, suppressed) -> count
+        self.account_counts = {}
+        # (provider, rule, level, status, suppressed) -> count
+        self.rule_counts = {}
+        # provider -> heap of (open findings, sequence, object summary)
+        self.top_objects = {provider: [] for provider in synthetic_tenant.PROVIDERS}
+
+    @property
+    def findings(self):
+        return self.generator.findings
+
+    @property
+    def objects(self):
+        return self.generator.objects
+
+    def in_scope(self, finding, config):
+        if(config.providers is not None and finding["cloudProvider"] not in (provider.lower() for provider in config.providers)):
+            return False
+        return config.all_accounts() or finding["cloudAccountId"] in config.cloud_account_ids
+
+    """Generates the findings of one object, counts them and returns them in the API format"""
+    def generate_object(self, config, limit):
+        findings = self.generator.generate_object(limit)
+        first = findings[0]
+        provider = first["cloudProvider"]
+        account_id = first["cloudAccountId"]
+        if not self.in_scope(first, config):
+            return findings
+
+        levels = set(level.lower() for level in config.severity)
+        open_findings = 0
+        risk_counts = {}
+        for finding in findings:
+            level = finding["level"].lower()
+            status = finding["status"]
+            suppressed = finding["isSuppressed"]
+            key = (provider, account_id, level, status, suppressed)
+            self.account_counts[key] = self.account_counts.get(key, 0) + 1
+            key = (provider, finding["ruleId"], level, status, suppressed)
+            self.rule_counts[key] = self.rule_counts.get(key, 0) + 1
+            if(status == "Open" and level in levels):
+                open_findings += 1
+                risk_counts[finding["riskScore"]] = risk_counts.get(finding["riskScore"], 0) + 1
+
+        if open_findings:
+            entry = (open_findings, -self.objects, {"xid": first["objectXid"], "object_id": first["objectId"], "account_id": account_id, "risk_counts": risk_counts})
+            heap = self.top_objects[provider]
+            if len(heap) < TOP_OBJECTS:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        return findings
+
+    def count_rows(self, dimensions):
+        if "rule_id" in dimensions:
+            return [({"provider": key[0], "rule_id": key[1], "level": key[2], "status": key[3], "suppressed": key[4]}, count)
+                    for key, count in self.rule_counts.items()]
+        return [({"provider": key[0], "account_id": key[1], "level": key[2], "status": key[3], "suppressed": key[4]}, count)
+                for key, count in self.account_counts.items()]
+
+
+def aggregation_fields(aggregations):
+    fields = set()
+    for spec in aggregations.values():
+        fields.add(spec["fieldName"])
+        fields |= aggregation_fields(spec.get("subAggregations") or {})
+    return fields
+
+def row_matches(dimensions, filters):
+    if("status" in filters and dimensions["status"] != filters["status"]):
+        return False
+    if("levels" in filters and dimensions["level"] not in (level.lower() for level in filters["levels"])):
+        return False
+    if("cloudProviders" in filters and dimensions["provider"] not in (provider.lower() for provider in filters["cloudProviders"])):
+        return False
+    if("cloudAccountIds" in filters and "account_id" in dimensions and dimensions["account_id"] not in filters["cloudAccountIds"]):
+        return False
+    if("isSuppressed" in filters and dimensions["suppressed"] != bool(filters["isSuppressed"])):
+        return False
+    return True
+
+def aggregate(rows, spec):
+    dimension = FIELD_DIMENSIONS[spec["fieldName"]]
+    groups = {}
+    for dimensions, count in rows:
+        group = groups.setdefault(dimensions[dimension], [0, []])
+        group[0] += count
+        group[1].append((dimensions, count))
+    ordered = sorted(groups.items(), key=lambda item: (-item[1][0], item[0]))
+    if "termsCount" in spec:
+        ordered = ordered[:int(spec["termsCount"])]
+
+    buckets = {}
+    for value, (count, group_rows) in ordered:
+        bucket = {"count": count}
+        if spec.get("subAggregations"):
+            bucket["subAggregations"] = {name: aggregate(group_rows, sub_spec) for name, sub_spec in spec["subAggregations"].items()}
+        buckets[str(value)] = bucket
+    return {"buckets": buckets}
+
+## Answers a v2/findings/query payload from the counters of the tenant
+def query(tenant, payload):
+    aggregations = payload.get("aggregations", {})
+    rows = tenant.count_rows(set(FIELD_DIMENSIONS[field] for field in aggregation_fields(aggregations)))
+    filters = payload.get("filters", {})
+    rows = [(dimensions, count) for dimensions, count in rows if row_matches(dimensions, filters)]
+    return {
+        "totalCount": sum(count for dimensions, count in rows),
+        "aggregations": {name: aggregate(rows, spec) for name, spec in aggregations.items()}
+    }
+
+def objects_risk_top_10(tenant, config):
+    levels = set(level.lower() for level in config.severity)
+    open_counts = {}
+    for (provider, account, level, status, suppressed), count in tenant.account_counts.items():
+        if(status == "Open" and level in levels):
+            open_counts[provider] = open_counts.get(provider, 0) + count
+
+    providers = {}
+    for provider, heap in tenant.top_objects.items():
+        if not heap:
+            continue
+        objects = {}
+        for open_findings, sequence, summary in sorted(heap, reverse=True):
+            risk_buckets = {str(score): {"count": count, "subAggregations": {"resourceName": {"buckets": {summary["object_id"]: {"count": count}}}}}
+                            for score, count in sorted(summary["risk_counts"].items())}
+            objects[summary["xid"]] = {
+                "count": open_findings,
+                "subAggregations": {"AccountId": {"buckets": {summary["account_id"]: {
+                    "count": open_findings,
+                    "subAggregations": {"riskSummary": {"buckets": risk_buckets}}
+                }}}}
+            }
+        providers[provider] = {
+            "count": open_counts.get(provider, 0),
+            "subAggregations": {"findingsCount": {"buckets": objects}}
+        }
+    return {"totalCount": sum(bucket["count"] for bucket in providers.values()), "aggregations": {"provider": {"buckets": providers}}}
+
+def trends(tenant):
+    return {"results": synthetic_tenant.make_trends(random.Random(tenant.findings), tenant.findings)}
+
+def write_json(directory, name, data):
+    path = os.path.join(directory, name + ".json")
+    with atomic_file.open_atomic(path) as output_file:
+        json.dump(data, output_file, indent=4)
+
+"""Writes the data/ snapshot of the findings counted so far into directory"""
+def write_snapshot(tenant, config, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    for name, payload in gather_info.findings_query_sections(config):
+        if(name == "objects_risk_top_10"):
+            write_json(directory, name, objects_risk_top_10(tenant, config))
+        else:
+            data = query(tenant, payload)
+            write_json(directory, name, data)
+            if(name == "account_info"):
+                top_accounts = list(data["aggregations"]["accounts"]["buckets"])
+
+    for sev in ["high", "medium", "low"]:
+        write_json(directory, sev + "_severity_top_10", query(tenant, gather_info.top_10_by_severity_payload(config, sev, top_accounts)))
+
+    write_json(directory, "frameworks", {"totalCount": FRAMEWORKS, "results": [{"id": "framework-" + str(index), "displayName": "Framework " + str(index)} for index in range(FRAMEWORKS)]})
+    write_json(directory, "trends", trends(tenant))
+
+    index = rule_catalog.build_index(tenant.rules)
+    rule_catalog.save_catalog(os.path.join(directory, os.path.basename(rule_catalog.CATALOG_FILE)), {
+        "version": rule_catalog.catalog_version(index),
+        "fetched_at": time.time(),
+        "total_count": len(index),
+        "rules": index
+    })
+
+"""Generates the tenant, streams its findings to findings_file (NDJSON) if given and writes the snapshot"""
+def generate(config, findings, accounts, rules, seed=1, directory="data", findings_file=None):
+    if(findings < 0):
+        raise ValueError("Number of findings cannot be negative")
+    if(accounts < 1 or rules < 1):
+        raise ValueError("A tenant needs at least 1 cloud account and 1 rule")
+    tenant = Tenant(accounts, rules, seed)
+    output_file = open(findings_file, "w", buffering=WRITE_BUFFER) if findings_file else None
+    started = time.time()
+    try:
+        # Every object has at least one finding, so the loop always ends
+        while tenant.findings < findings:
+            for finding in tenant.generate_object(config, findings - tenant.findings):
+                if output_file is not None:
+                    output_file.write(json.dumps(finding, separators=(",", ":")))
+                    output_file.write("\n")
+    finally:
+        if output_file is not None:
+            output_file.close()
+    logging.info("Generated " + str(tenant.findings) + " findings on " + str(tenant.objects) + " objects in " + str(round(time.time() - started, 1)) + "s\n")
+
+    write_snapshot(tenant, config, directory)
+    return tenant
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Generate a synthetic tenant: a data/ snapshot and its raw findings")
+    parser.add_argument('--config', help="report configuration the snapshot is computed for, all providers, severities and accounts by default")
+    parser.add_argument('--findings', type=int, default=100000)
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--rules', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output-dir', default="data", help="directory the snapshot is written to")
+    parser.add_argument('--findings-file', help="write the raw findings to this NDJSON file")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    args = parse_arguments()
+    if args.config:
+        config = report_config.load(args.config)
+    else:
+        config = report_config.from_dict({
+            "org_name": "Synthetic Tenant",
+            "config": {"providers": None, "severity": ["High", "Medium", "Low"], "cloudTags": None, "cloudAccountIds": ["All"]}
+        })
+    try:
+        generate(config, args.findings, args.accounts, args.rules, args.seed, args.output_dir, args.findings_file)
+    except ValueError as error:
+        logging.error("Cannot generate tenant " + str(error) + "\n")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import time
+
+import atomic_file
+import vss_client
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Caches CSP access tokens on disk so that warm runs skip the authorize round-trip.
+# One file per refresh token (named after its hash, the refresh token itself is never
+# written), readable by the owner only. Refreshes are serialized across processes with
+# an exclusive lock on a sidecar lock file.
+
+TOKEN_CACHE_DIR = os.environ.get("VSS_TOKEN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "steamchss"))
+
+# Refresh the access token this many seconds before it expires
+REFRESH_MARGIN = 300
+
+
+class AuthError(Exception):
+    pass
+
+
+## Stable identifier of the tenant a refresh token belongs to, safe to write to disk
+def token_id(refresh_token):
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()[:32]
+
+def cache_path(refresh_token):
+    return os.path.join(TOKEN_CACHE_DIR, token_id(refresh_token) + ".json")
+
+## Returns the cached access token if it is valid for at least REFRESH_MARGIN more seconds
+def read_cached_token(path):
+    try:
+        with open(path, "r") as token_file:
+            data = json.load(token_file)
+    except (OSError, ValueError):
+        return None
+
+    if(data.get("expires_at", 0) - REFRESH_MARGIN > time.time()):
+        return data.get("access_token")
+    return None
+
+def write_cached_token(path, access_token, expires_at):
+    with atomic_file.open_atomic(path, permissions=0o600) as token_file:
+        json.dump({"access_token": access_token, "expires_at": expires_at}, token_file)
+
+@contextlib.contextmanager
+def locked(path):
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+"""Returns an access token for the refresh token, from the cache when possible. stale_token is a token the API rejected, it is never handed out again"""
+def get_access_token(refresh_token, stale_token=None):
+    path = cache_path(refresh_token)
+
+    token = read_cached_token(path)
+    if(token and token != stale_token):
+        logging.debug("Using cached access token\n")
+        return token
+
+    os.makedirs(TOKEN_CACHE_DIR, mode=0o700, exist_ok=True)
+
+    with locked(path):
+        # Another process may have refreshed the token while we were waiting for the lock
+        token = read_cached_token(path)
+        if(token and token != stale_token):
+            return token
+
+        response = vss_client.authorize(refresh_token)
+        if(response.status_code != 200):
+            raise AuthError(str(response.status_code) + " " + str(response.content))
+
+        data = response.json()
+        expires_at = int(time.time()) + int(data.get("expires_in", 0))
+        write_cached_token(path, data["access_token"], expires_at)
+
+    logging.info("Received new access token from CSP\n")
+    return data["access_token"]
+
+def invalidate(refresh_token):
+    path = cache_path(refresh_token)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+## Sets the access token on the shared client and refreshes it once if the API rejects it
+def login(refresh_token):
+    vss_client.set_access_token(get_access_token(refresh_token))
+
+    def refresh(stale_token):
+        vss_client.set_access_token(get_access_token(refresh_token, stale_token))
+
+    vss_client.on_unauthorized = refresh
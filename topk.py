@@ -0,0 +1,103 @@
+import heapq
+import os
+import sqlite3
+import tempfile
+
+import findings_stream
+import findings_store
+
+# Ranks the objects of a tenant by risk: the sum of the risk scores of their open findings,
+# ties broken by the number of findings. Unlike the ObjectXid terms aggregation, which
+# returns the 10 objects with the most findings, every open finding is scored, so an object
+# with a few critical findings is not missed.
+#
+# The ranking keeps a heap of the K best objects. From a local findings store the findings
+# are summed per object by SQLite and streamed in one pass, so memory stays O(K). From the
+# paginated findings stream, findings of an object are spread over pages, so they are first
+# written in batches to a temporary SQLite file and summed there the same way. Memory stays
+# O(K + STREAM_BATCH_SIZE) but the temporary file grows with the open findings of the tenant,
+# and every one of them is downloaded: the streamed ranking costs one request per page of
+# open findings, so it is only used when asked for.
+
+TOP_OBJECTS = 10
+
+# Open findings of the stream written to the temporary ranking table at once
+STREAM_BATCH_SIZE = 5000
+
+PROVIDER_LABELS = {"aws": "AWS", "azure": "Azure", "gcp": "GCP"}
+
+
+def provider_label(provider):
+    provider = provider or ""
+    return PROVIDER_LABELS.get(provider.lower(), provider.upper())
+
+"""Returns the k largest items of an iterable of (key, item) pairs, largest first, keeping at most k items in memory"""
+def top_k(items, k):
+    heap = []
+    for sequence, (key, item) in enumerate(items):
+        # sequence keeps the first of equal keys and avoids comparing items
+        entry = (key, -sequence, item)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [item for key, sequence, item in sorted(heap, reverse=True)]
+
+## Row of the objects by risk table: [risk score, finding count, object name, object id, provider, cloud account]
+def object_row(score, count, object_name, object_xid, provider, account_id):
+    return [score, count, object_name or object_xid, object_xid, provider_label(provider), account_id]
+
+def ranking_filters(filters):
+    filters = dict(filters or {})
+    # Sort flag of the aggregation query, not a filter of the findings
+    filters.pop("descending", None)
+    filters["status"] = "Open"
+    return filters
+
+## Rows of the open findings of the stream: (object_xid, risk_score, object_id, provider, account_id)
+def stream_rows(filters):
+    for finding in findings_stream.iter_findings(ranking_filters(filters)):
+        row = findings_stream.normalize_finding(finding)
+        if(row["status"] == "Open" and row["object_xid"] is not None):
+            yield (row["object_xid"], row["risk_score"], row["object_id"], row["provider"], row["account_id"])
+
+"""Ranks the open findings matching filters streamed from the API, summed per object in a temporary SQLite file"""
+def stream_top_objects(filters, k=TOP_OBJECTS):
+    handle, path = tempfile.mkstemp(suffix=".db", prefix="topk-")
+    os.close(handle)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE findings (object_xid TEXT, risk_score INTEGER, object_id TEXT, provider TEXT, account_id TEXT)")
+        batch = []
+        for row in stream_rows(filters):
+            batch.append(row)
+            if(len(batch) >= STREAM_BATCH_SIZE):
+                connection.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        connection.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?)", batch)
+        connection.commit()
+        return ranked_rows(connection, "SELECT object_xid, SUM(risk_score), COUNT(*), MIN(object_id), MIN(provider), MIN(account_id)"
+                                       " FROM findings GROUP BY object_xid", [], k)
+    finally:
+        connection.close()
+        os.remove(path)
+
+def ranked_rows(connection, sql, params, k):
+    rows = connection.execute(sql, params)
+    ranked = top_k((((score, count), (xid, score, count, name, provider, account))
+                    for xid, score, count, name, provider, account in rows), k)
+    return [object_row(score, count, name, xid, provider, account) for xid, score, count, name, provider, account in ranked]
+
+"""Ranks the open findings matching filters in a local findings store"""
+def store_top_objects(connection, filters, k=TOP_OBJECTS):
+    conditions, params = findings_store.where_clause(ranking_filters(filters))
+    sql = ("SELECT object_xid, SUM(risk_score), COUNT(*), MIN(object_id), MIN(provider), MIN(account_id) FROM findings"
+           + " WHERE " + " AND ".join(conditions + ["object_xid IS NOT NULL"])
+           + " GROUP BY object_xid")
+    return ranked_rows(connection, sql, params, k)
+
+## Artifact written in place of the aggregation response, get_top_10_objects_by_risk() reads both
+def ranking_data(rows, k):
+    return {"topK": k, "objects": rows}
@@ -0,0 +1,252 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+import atomic_file
+
+# Local history of the finding counts, the trends of the report are computed from it instead
+# of asking v2/findings/trends-query on every run. Every run appends one snapshot, the
+# number of findings per cloud account, provider, severity and status at that time, to an
+# append-only NDJSON file per report scope (the payload filters), so reports with different
+# filters never mix their counts:
+#
+#   {"type": "snapshot", "at": "2026-05-04T08:00:00Z", "counts": [[account, provider, level, status, count], ...]}
+#
+# The counts are gauges, so a period (day, week or month) is represented by its last
+# snapshot: Open findings of a period are the open count of that snapshot, New and Resolved
+# findings are the growth of the total and of the resolved count since the previous period.
+#
+# Periods that ended before the first snapshot are imported once from the trends API as
+#
+#   {"type": "period", "interval": "month", "start": "2026-01-01", "open": 10, "new": 4, "resolved": 3}
+#
+# Past periods never change, so once every past period of the trend window is known only
+# the current period is fetched, which is the snapshot query of the run. The API values of
+# the current period are kept too, with the time of the snapshot taken with them, so New
+# and Resolved of the first period of the store are those values plus the growth since.
+#
+# compact() keeps the store small: snapshots older than DAILY_RETENTION_DAYS are reduced to
+# the last one of their week (weeks are split at month ends) and snapshots older than
+# WEEKLY_RETENTION_DAYS to the last one of their month. Week and month rollups of compacted
+# data are exact, day rollups only cover the days kept.
+
+HISTORY_DIR = "history"
+INTERVALS = ["day", "week", "month"]
+DEFAULT_INTERVAL = "month"
+TREND_PERIODS = 6
+
+DAILY_RETENTION_DAYS = 35
+WEEKLY_RETENTION_DAYS = 370
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+"""Identifies a report scope by its payload filters"""
+def scope_key(filters):
+    return hashlib.sha1(json.dumps(filters, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def store_path(directory, filters):
+    return os.path.join(directory, scope_key(filters) + ".ndjson")
+
+## Flattens a provider > account > level > status aggregation into count rows
+def snapshot_counts(response):
+    counts = []
+    providers = response["aggregations"]["providers"]["buckets"]
+    for provider, provider_bucket in providers.items():
+        for account, account_bucket in provider_bucket["subAggregations"]["accounts"]["buckets"].items():
+            for level, level_bucket in account_bucket["subAggregations"]["levels"]["buckets"].items():
+                for status, status_bucket in level_bucket["subAggregations"]["status"]["buckets"].items():
+                    counts.append([account, provider.lower(), level.lower(), status, status_bucket["count"]])
+    return sorted(counts)
+
+def append_records(path, records):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as store_file:
+        for record in records:
+            store_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        store_file.flush()
+        os.fsync(store_file.fileno())
+
+def append_snapshot(path, taken_at, counts):
+    append_records(path, [{"type": "snapshot", "at": taken_at.strftime(TIME_FORMAT), "counts": counts}])
+
+def append_periods(path, interval, periods):
+    append_records(path, [dict(type="period", interval=interval, start=start.isoformat(), **values)
+                          for start, values in sorted(periods.items())])
+
+## Stores the API values of the unfinished period start along with the time of the snapshot taken with them
+def append_partial_period(path, interval, start, taken_at, values):
+    append_records(path, [dict(type="period", interval=interval, start=start.isoformat(), at=taken_at.strftime(TIME_FORMAT), **values)])
+
+"""Returns the records of the store, an unfinished last line of an interrupted run is skipped"""
+def read_records(path):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r") as store_file:
+        for line in store_file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning("Skipping a damaged line of " + path + "\n")
+    return records
+
+def period_start(day, interval):
+    if(interval == "day"):
+        return day
+    if(interval == "week"):
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def previous_period(start, interval):
+    if(interval == "day"):
+        return start - datetime.timedelta(days=1)
+    if(interval == "week"):
+        return start - datetime.timedelta(days=7)
+    return (start - datetime.timedelta(days=1)).replace(day=1)
+
+## The TREND_PERIODS period starts ending with the current one, oldest first
+def trend_periods(today, interval, count=TREND_PERIODS):
+    starts = [period_start(today, interval)]
+    while len(starts) < count:
+        starts.append(previous_period(starts[-1], interval))
+    return list(reversed(starts))
+
+def snapshot_time(record):
+    return datetime.datetime.strptime(record["at"], TIME_FORMAT)
+
+def snapshot_totals(record):
+    totals = {"open": 0, "resolved": 0, "total": 0}
+    for account, provider, level, status, count in record["counts"]:
+        totals["total"] += count
+        if(status == "Open"):
+            totals["open"] += count
+        elif(status == "Resolved"):
+            totals["resolved"] += count
+    return totals
+
+"""Returns {period start: totals of the last snapshot of the period}"""
+def rollup(records, interval):
+    last = {}
+    for record in records:
+        if(record.get("type") != "snapshot"):
+            continue
+        taken_at = snapshot_time(record)
+        start = period_start(taken_at.date(), interval)
+        if(start not in last or taken_at >= last[start][0]):
+            last[start] = (taken_at, record)
+    return {start: snapshot_totals(record) for start, (taken_at, record) in last.items()}
+
+def imported_periods(records, interval, partial=False):
+    periods = {}
+    for record in records:
+        if(record.get("type") == "period" and record["interval"] == interval and ("at" in record) == partial):
+            periods[datetime.date.fromisoformat(record["start"])] = record
+    return periods
+
+## Returns the past periods of the trend window that neither snapshots nor imported periods cover
+def missing_periods(records, interval, today, count=TREND_PERIODS):
+    rolled = rollup(records, interval)
+    imported = imported_periods(records, interval)
+    missing = []
+    for start in trend_periods(today, interval, count)[:-1]:
+        has_previous = any(known < start for known in rolled)
+        if(start not in imported and not (start in rolled and has_previous)):
+            missing.append(start)
+    return missing
+
+"""Computes the trends of the window from the store, in the shape of a v2/findings/trends-query response"""
+def compute_trends(records, interval, today, count=TREND_PERIODS):
+    rolled = rollup(records, interval)
+    imported = imported_periods(records, interval)
+    partial = imported_periods(records, interval, partial=True)
+    snapshots = {record["at"]: record for record in records if record.get("type") == "snapshot"}
+    known = sorted(rolled)
+
+    series = {"Open": {}, "New": {}, "Resolved": {}}
+    for start in trend_periods(today, interval, count):
+        key = start.strftime("%Y-%m-%dT00:00:00Z")
+        earlier = [day for day in known if day < start]
+        previous = rolled[earlier[-1]] if earlier else None
+
+        if(start in rolled and previous is not None):
+            latest = rolled[start]
+            values = {"open": latest["open"],
+                      "new": max(0, latest["total"] - previous["total"]),
+                      "resolved": max(0, latest["resolved"] - previous["resolved"])}
+        elif(start in imported):
+            values = imported[start]
+        elif(start in rolled and start in partial and partial[start]["at"] in snapshots):
+            # First period of the store, the API values plus the growth since they were fetched
+            latest = rolled[start]
+            base = snapshot_totals(snapshots[partial[start]["at"]])
+            values = {"open": latest["open"],
+                      "new": partial[start]["new"] + max(0, latest["total"] - base["total"]),
+                      "resolved": partial[start]["resolved"] + max(0, latest["resolved"] - base["resolved"])}
+        elif(start in rolled):
+            values = {"open": rolled[start]["open"], "new": 0, "resolved": 0}
+        else:
+            # No run in this period, the open count is still the one of the last run before it
+            values = {"open": previous["open"] if previous else 0, "new": 0, "resolved": 0}
+
+        series["Open"][key] = {"count": values["open"]}
+        series["New"][key] = {"count": values["new"]}
+        series["Resolved"][key] = {"count": values["resolved"]}
+
+    return {"interval": interval, "results": {status: {"buckets": buckets} for status, buckets in series.items()}}
+
+## Converts a trends API response to {period start: values} for the periods in wanted
+def periods_from_response(response, interval, wanted):
+    results = response["results"]
+    periods = {}
+    for status, name in [("Open", "open"), ("New", "new"), ("Resolved", "resolved")]:
+        for key, bucket in results.get(status, {}).get("buckets", {}).items():
+            start = period_start(datetime.date.fromisoformat(key[:10]), interval)
+            if start in wanted:
+                periods.setdefault(start, {"open": 0, "new": 0, "resolved": 0})[name] = bucket.get("count", 0)
+    return periods
+
+"""Rewrites the store keeping the last snapshot per week or month of old data and one record per imported period"""
+def compact(path, now):
+    records = read_records(path)
+    kept = {}
+    periods = {}
+    for record in records:
+        if(record.get("type") == "period"):
+            periods[(record["interval"], record["start"], "at" in record)] = record
+    # A partial period is obsolete once the finished period was imported
+    for interval, start, partial in list(periods):
+        if(partial and (interval, start, False) in periods):
+            del periods[(interval, start, True)]
+    # Snapshots the partial periods are based on
+    pinned = set(record["at"] for record in periods.values() if "at" in record)
+    for record in records:
+        if(record.get("type") == "period"):
+            continue
+        if(record["at"] in pinned):
+            kept[("pinned", record["at"])] = record
+            continue
+        taken_at = snapshot_time(record)
+        age = (now - taken_at).days
+        if(age > WEEKLY_RETENTION_DAYS):
+            key = ("month", period_start(taken_at.date(), "month"))
+        elif(age > DAILY_RETENTION_DAYS):
+            key = ("week", period_start(taken_at.date(), "week"), period_start(taken_at.date(), "month"))
+        else:
+            key = ("run", record["at"])
+        if(key not in kept or taken_at >= snapshot_time(kept[key])):
+            kept[key] = record
+
+    compacted = sorted(periods.values(), key=lambda record: (record["interval"], record["start"]))
+    compacted += sorted(kept.values(), key=lambda record: record["at"])
+    if(len(compacted) == len(records)):
+        return
+
+    with atomic_file.open_atomic(path) as store_file:
+        for record in compacted:
+            store_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+    logging.info("Compacted " + path + " from " + str(len(records)) + " to " + str(len(compacted)) + " records\n")
@@ -1,70 +1,31 @@
 import json
-import requests
+import token_cache
+import findings_stream
+import finding_table
 import os
+import sys
 import logging 
 
-access_token = ''
-
-refresh_token = os.environ['REFRESH_TOKEN']
+## Refresh token of the environment, read when the script runs rather than on import
+def get_refresh_token():
+    if "REFRESH_TOKEN" in os.environ:
+        return os.environ['REFRESH_TOKEN']
+    logging.error("REFRESH_TOKEN was not set in environment variable.\nToken can be obtained from CSP\n")
+    sys.exit()
 
 ## Get Access Token from CSP
 def auth():
     
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    url = 'https://console.cloud.vmware.com/csp/gateway/am/api/auth/api-tokens/authorize'
-    payload = {"refresh_token": refresh_token }
-
-    response = requests.post(url, data=payload , headers=headers)
-    
-    if response.status_code == 200:
-            print("Success")
-            logging.info("Successfully received access token") 
-    else:
-	 	    logging.error("Failed Retrieving auth token" + str(response.status_code))
-    
-    data = json.loads(response.content)
-
-
-    global access_token 
-    access_token = data["access_token"]
-#    print (access_token)
-
-## Get all the findings within the account 
-def all_findings():
-
-    global access_token
-
-    headers = {
-        'Content-Type' : 'application/json', 
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    payload = "{\n}"
-    url = 'https://api.securestate.vmware.com/v2/findings/query'
-    response = requests.post(url , data=payload, headers=headers)
-
-    print (response.content)
-
-    # Fetch the continuation Token
-    data = json.loads(response.content)
-    continuationToken = data["continuationToken"]
-
-    # Get the entire payload for 1000 objects
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
+    try:
+        token_cache.login(get_refresh_token())
+        logging.info("Successfully received access token") 
+    except token_cache.AuthError as error:
+        logging.error("Failed Retrieving auth token" + str(error))
 
-# replace cloud provider key with "AWS" for Amazon web services related violations
-    payload = "{\n\t\"filters\": {\n\t\t\"cloudProvider\": \"AWS\"\n\t}\n, \n\t\"paginationInfo\":{\n\t\t\"continuationToken\": \"" +  continuationToken + "\",\n\t\t\"pageSize\":1000\n\t}\n}"
+## Get all the findings within the account, streamed page by page
+def all_findings(filters=None):
 
-    url = 'https://api.securestate.vmware.com/v2/findings/query'
-    allFindings = requests.post(url , data=payload, headers=headers)
-
-    print (allFindings)
-
-    return allFindings
+    return findings_stream.iter_findings(filters)
 
 ## Read Terraform output file
 def get_terraform_file():
@@ -78,43 +39,57 @@ def get_terraform_file():
 
     return terraformOutput
 
-## Get all violations related to an ObjectID
-def get_violation_by_object(all_findings, objectID):
-    violations = []
-    
-    data = json.loads(all_findings.content)
-    
-    print (objectID)
-    ##print (data)
+## Rule checked for every object
 ## replace ruleId = "5c8c26847a550e1fb6560cab" for Azure and ruleId = "5c8c26417a550e1fb6560c3f" for AWS for port 22 open
 ## Tim using ruleId = "5c8c267b7a550e1fb6560c9a" for Virtual Machine Disks not Encrypted in Azure 
-    for violation in data["results"]:
-        if (violation["objectId"] == objectID and violation["status"] == "Open" and violation["ruleId"] == "5c8c25ec7a550e1fb6560bbe"):
-        #if (violation["objectId"] == objectID):
-            violations.append(violation)
+RULE_ID = "5c8c25ec7a550e1fb6560bbe"
 
-    if(len(violations) > 0):
-	##print ("Violation Found !!")
+## Columns of the index of the violations of an object
+INDEX_COLUMNS = ["object_id", "status", "rule_id"]
+
+## Table of the findings built in one pass while they are streamed, see finding_table,
+## with its objectId, status, ruleId index so every object is then a lookup
+def build_findings_index(all_findings):
+    findings_index = finding_table.from_findings(all_findings)
+    findings_index.index(INDEX_COLUMNS)
+    return findings_index
+
+## Whether an ObjectID has violations of the rule
+def get_violation_by_object(findings_index, objectID, rule_id=RULE_ID, status="Open"):
+    
+    logging.debug("Checking violations of " + objectID)
+
+    if(len(findings_index.lookup(object_id=objectID, status=status, rule_id=rule_id)) > 0):
+        logging.debug("Violation found for " + objectID)
         return True
     else:
         return False
 
-	 	 
+## Object IDs of every Terraform output, list outputs are flattened
+def get_terraform_object_ids(terraformOutput):
+    object_ids = []
+
+    for name, output in terraformOutput.items():
+        value = output["value"] if isinstance(output, dict) and "value" in output else output
+        values = value if isinstance(value, list) else [value]
+        object_ids += [item for item in values if isinstance(item, str)]
+
+    return object_ids
+
+
 ## Main Function
 if __name__ == '__main__':
     ## Auth
     auth()
-    ## Get all Findings
-    resp = all_findings()
+    ## Index all Findings once, every object is then a lookup
+    findings_index = build_findings_index(all_findings())
 
     violation_found = []
     terraformOutput=get_terraform_file()
-    objectId = terraformOutput['sg_id']
-    
-    print (objectId)
     
-    has_violation = get_violation_by_object(resp, objectId['value'])
-    violation_found.append(has_violation)
+    for objectId in get_terraform_object_ids(terraformOutput):
+        has_violation = get_violation_by_object(findings_index, objectId)
+        violation_found.append(has_violation)
  
     print("Checking if violations exist \n")
     print(violation_found)
@@ -126,4 +101,4 @@ if __name__ == '__main__':
         else:
             continue
     if (count == 0):
-	    logging.info("No Violations Found !!")
+        logging.info("No Violations Found !!")
@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import response_cache
+
+# Shared HTTP client for the CSP and VSS APIs. Every call goes through one pooled
+# keep-alive session, so repeated calls reuse warm connections instead of paying
+# a new TCP+TLS handshake each time.
+
+VSS_API_URL = os.environ.get("VSS_API_URL", "https://api.securestate.vmware.com")
+CSP_URL = os.environ.get("CSP_URL", "https://console.cloud.vmware.com")
+CSP_AUTHORIZE_URL = CSP_URL + "/csp/gateway/am/api/auth/api-tokens/authorize"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+http_pool_size = DEFAULT_POOL_SIZE
+http_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+
+access_token = ''
+
+# Called with the rejected token when an authenticated call gets a 401, the call is then retried once
+on_unauthorized = None
+
+session = None
+session_lock = threading.Lock()
+
+
+class ErrorStatusCode(Exception):
+    pass
+
+
+## Size of the connection pool and connect/read timeouts in seconds. Takes effect on the next call.
+def configure(pool_size=None, connect_timeout=None, read_timeout=None):
+    global http_pool_size, http_timeout
+
+    if(pool_size is not None):
+        if(pool_size < 1):
+            raise ValueError("HTTP pool size must be at least 1")
+        http_pool_size = pool_size
+
+    http_timeout = (connect_timeout or http_timeout[0], read_timeout or http_timeout[1])
+    close()
+
+## Bearer token injected into every authenticated call
+def set_access_token(token):
+    global access_token
+    access_token = token
+
+def api_url(path):
+    return VSS_API_URL.rstrip("/") + "/" + path.lstrip("/")
+
+def get_session():
+    global session
+
+    with session_lock:
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=http_pool_size, pool_maxsize=http_pool_size)
+            new_session = requests.Session()
+            new_session.mount("https://", adapter)
+            new_session.mount("http://", adapter)
+            new_session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            session = new_session
+        return session
+
+def close():
+    global session
+
+    with session_lock:
+        if session is not None:
+            session.close()
+            session = None
+
+"""Sends a request through the shared session. Authenticated calls get the bearer token and a JSON content type unless the caller overrides them, and are served from the response cache when it is enabled"""
+def request(method, url, authenticated=True, headers=None, retry_unauthorized=True, use_cache=True, **kwargs):
+    def send():
+        return send_request(method, url, authenticated, headers, retry_unauthorized, **kwargs)
+
+    started = time.perf_counter()
+    if(authenticated and use_cache and response_cache.enabled()):
+        response = response_cache.fetch(method, url, kwargs.get("data", kwargs.get("json")), send)
+    else:
+        response = send()
+    source = "cache" if getattr(response, "from_cache", False) else "network"
+    metrics.record_http(method, url, response.status_code, time.perf_counter() - started, len(response.content or b""), source)
+    return response
+
+def send_request(method, url, authenticated, headers, retry_unauthorized, **kwargs):
+    token = access_token
+    request_headers = {}
+    if(authenticated):
+        request_headers["Content-Type"] = "application/json"
+        request_headers["Authorization"] = "Bearer {}".format(token)
+    if(headers):
+        request_headers.update(headers)
+
+    kwargs.setdefault("timeout", http_timeout)
+
+    logging.debug(method + " " + url)
+    response = get_session().request(method, url, headers=request_headers, **kwargs)
+
+    if(authenticated and response.status_code == 401 and retry_unauthorized and on_unauthorized is not None):
+        logging.info("Access token was rejected, refreshing it\n")
+        on_unauthorized(token)
+        return send_request(method, url, authenticated, headers, False, **kwargs)
+    return response
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+## Exchanges a CSP refresh token, returns the response of the authorize endpoint
+def authorize(refresh_token):
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+    payload = {"refresh_token": refresh_token }
+
+    return post(CSP_AUTHORIZE_URL, data=payload, headers=headers, authenticated=False)